@@ -1,35 +1,327 @@
 import os
+import sys
 import json
+import math
 import time
-from flask import Flask, request, jsonify, send_from_directory
+import zlib
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 
+# Shared helpers (geo, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+
+from geo import haversine_distance, valid_position
+from hazard_store import HazardStore
+from spatial_index import GridIndex, LayeredIndex
+from snapshot import Snapshot, read_meta
+from clustering import ClusterEngine
+from lifecycle import MAINTENANCE_INTERVAL, claim, decayed_confidence, rebuild_snapshot, run_maintenance
+from tiles import MAX_TILE_ZOOM, TileAggregator
+from image_store import IMMUTABLE_CACHE_CONTROL, is_content_addressed
+import metrics
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+metrics.install_flask_metrics(app)  # /metrics (Prometheus) and, with ENABLE_PROFILING=1, /debug/profile
 
+# Legacy JSON list; imported once into the SQLite store and then renamed.
 STORAGE_FILE = os.path.join(os.path.dirname(__file__), 'storage.json')
+DB_FILE = os.environ.get('HAZARD_DB', os.path.join(os.path.dirname(__file__), 'hazards.db'))
+# Columnar snapshot written by `python snapshot.py build`; memory-mapped at startup if present.
+SNAPSHOT_DIR = os.environ.get('HAZARD_SNAPSHOT', DB_FILE + '.snapshot')
+# Expired hazards and clusters are moved here as gzip NDJSON segments (lifecycle.py).
+ARCHIVE_DIR = os.environ.get('HAZARD_ARCHIVE', DB_FILE + '.archive')
+# Seconds between background maintenance runs (expiry, archive, compaction); 0 disables it.
+MAINTENANCE_EVERY = int(os.environ.get('HAZARD_MAINTENANCE_INTERVAL', MAINTENANCE_INTERVAL))
 EVENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'events')
 
+# Aggregate tiles may be cached briefly by browsers and proxies, then revalidated by ETag.
+TILE_CACHE_CONTROL = 'public, max-age=30'
+
+# Change feed: at most this many change entries per /hazards?since= page or SSE event,
+# and an SSE comment this often so proxies keep idle streams open.
+FEED_PAGE_LIMIT = 1000
+STREAM_KEEPALIVE = 15  # seconds
+# How often an idle stream checks the store for writes made by other worker processes.
+STREAM_POLL = 1.0  # seconds
+# Every open stream holds one server thread (gthread / waitress), so a worker
+# serves at most STREAM_MAX_SUBSCRIBERS of them (serve.py: half its threads) and
+# answers more with 503 + Retry-After. A stream ends after STREAM_MAX_SECONDS;
+# EventSource reconnects on its own and resumes from its Last-Event-ID.
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('HAZARD_STREAM_SUBSCRIBERS', 4))
+STREAM_MAX_SECONDS = int(os.environ.get('HAZARD_STREAM_SECONDS', 300))
+STREAM_RETRY_AFTER = 5  # seconds a refused subscriber waits before retrying
+
+# Report timestamps are Unix seconds; a device clock may run this far ahead of ours.
+MAX_CLOCK_SKEW = 300  # seconds
+# Device-assigned idempotency keys (uuid4 hex from the clients) are short strings.
+MAX_REPORT_ID_LENGTH = 128
+
+# Largest report body accepted after gzip decompression (replayed outbox batches).
+MAX_REPORT_BODY = 16 * 1024 * 1024
+
 # Ensure events directory exists
-if not os.path.exists(EVENTS_DIR):
-    os.makedirs(EVENTS_DIR)
+os.makedirs(EVENTS_DIR, exist_ok=True)
+
+store = HazardStore(DB_FILE, legacy_json_path=STORAGE_FILE)
+
+# In-memory spatial index over the store, updated on every insert. Under a
+# multi-process server (serve.py) every worker has its own index and cluster
+# set and catches up on the other workers' writes from the change feed.
+# sync_lock guards every change to them (and to synced_seq): this worker's
+# own writes (save_hazards) and the catch-up (sync_from_store) alike.
+sync_lock = threading.Lock()
+
+def index_hazard(hazard):
+    """Adds or replaces a hazard in the spatial index and the aggregate tiles."""
+    old = index.insert(hazard)
+    if old is not None:
+        tiles.remove(old)
+    tiles.add(hazard)
+
+def unindex_hazard(hazard_id):
+    old = index.remove(hazard_id)
+    if old is not None:
+        tiles.remove(old)
+
+def load_snapshot():
+    """Returns the snapshot of this store if there is a usable one, else None."""
+    if read_meta(SNAPSHOT_DIR) is None:
+        return None
+    snapshot = Snapshot(SNAPSHOT_DIR)
+    if not snapshot.matches(store):
+        print(f" [SNAPSHOT] {SNAPSHOT_DIR} is not from this database or too old for its change feed, ignoring it")
+        return None
+    return snapshot
+
+def load_state():
+    """
+    Returns (index, tiles, cursor, snapshot): the spatial index and aggregate
+    tiles (per-zoom counts, max confidence, recency for /tiles) as of cursor.
+    Maps the snapshot if there is a usable one, so only what changed after it
+    is replayed (sync_from_store); otherwise scans the whole store.
+    """
+    snapshot = load_snapshot()
+    state_tiles = TileAggregator()
+    if snapshot is not None:
+        state_tiles.load_base(*snapshot.tile_bins, tile_count=snapshot.meta["tile_count"])
+        return LayeredIndex(snapshot.index()), state_tiles, snapshot.seq, snapshot
+    cursor = store.latest_seq()
+    state_index = GridIndex()
+    for hazard in store.all():
+        state_index.insert(hazard)
+        state_tiles.add(hazard)
+    return state_index, state_tiles, cursor, None
+
+def reload_state():
+    """
+    Replaces the index, tiles and clusters with fresh ones, for when the change
+    feed no longer reaches back to synced_seq (compacted) or the snapshot was
+    rebuilt. Caller holds sync_lock.
+    """
+    global index, tiles, clusters, synced_seq, snapshot
+    started = time.perf_counter()
+    new_index, new_tiles, cursor, new_snapshot = load_state()
+    new_clusters = ClusterEngine(store)
+    # Merging unclustered hazards needs the write lock; whoever writes them merges them
+    new_clusters.load(merge_unclustered=False)
+    index, tiles, clusters, synced_seq, snapshot = new_index, new_tiles, new_clusters, cursor, new_snapshot
+    print(f" [SYNC] Reloaded {len(index)} hazards in {time.perf_counter() - started:.3f}s")
+
+started = time.perf_counter()
+index, tiles, synced_seq, snapshot = load_state()
+
+# Hazards within 100 m are merged into persistent clusters as they arrive.
+clusters = ClusterEngine(store)
+with store.write_lock():
+    clusters.load()
+
+metrics.gauge("hazards_indexed", "Hazards in the in-memory spatial index", fn=lambda: len(index))
+metrics.gauge("clusters_total", "Hazard clusters", fn=lambda: len(clusters.all()))
+metrics.gauge("hazard_tiles", "Non-empty aggregate tiles over all zooms", fn=lambda: len(tiles))
+
+# Bumped after every write so /hazards/stream clients wake up immediately.
+change_cond = threading.Condition()
+change_version = 0
+# Open /hazards/stream connections of this worker (see STREAM_MAX_SUBSCRIBERS).
+stream_lock = threading.Lock()
+open_streams = 0
+metrics.gauge("stream_subscribers", "Open /hazards/stream connections in this worker", fn=lambda: open_streams)
+
+def open_stream():
+    """Takes a stream slot; False if STREAM_MAX_SUBSCRIBERS streams are already open."""
+    global open_streams
+    with stream_lock:
+        if open_streams >= STREAM_MAX_SUBSCRIBERS:
+            return False
+        open_streams += 1
+        return True
+
+def close_stream():
+    global open_streams
+    with stream_lock:
+        open_streams -= 1
+
+def notify_change():
+    global change_version
+    with change_cond:
+        change_version += 1
+        change_cond.notify_all()
 
 def load_hazards():
-    if not os.path.exists(STORAGE_FILE):
-        return []
+    return store.all()
+
+def sync_from_store():
+    """
+    Applies changes other worker processes committed since this one last
+    looked to the in-memory index and clusters. Costs one indexed MAX(seq)
+    query when nothing changed; replaying our own changes is harmless.
+    """
+    global synced_seq
+    if store.latest_seq() == synced_seq:
+        return
+    with sync_lock:
+        if synced_seq < store.feed_floor():
+            reload_state()
+        while True:
+            feed = store.changes_since(synced_seq, FEED_PAGE_LIMIT)
+            for hazard in feed["hazards"]:
+                index_hazard(hazard)
+            for hazard_id in feed["removed_hazards"]:
+                unindex_hazard(hazard_id)
+            for cluster in feed["clusters"]:
+                clusters.apply(cluster)
+            for cluster_id in feed["removed_clusters"]:
+                clusters.discard(cluster_id)
+            synced_seq = max(synced_seq, feed["cursor"])
+            if not feed["has_more"]:
+                return
+
+# Catch up on changes made after the snapshot (or by workers that started first)
+sync_from_store()
+print(f" [STARTUP] Indexed {len(index)} hazards in {time.perf_counter() - started:.3f}s"
+      f"{f' (snapshot at cursor {snapshot.seq})' if snapshot is not None else ''}")
+
+def maintenance_loop():
+    """Every MAINTENANCE_EVERY seconds, the first worker to claim the run expires, archives and compacts."""
+    while True:
+        time.sleep(MAINTENANCE_EVERY)
+        try:
+            if not claim(store, MAINTENANCE_EVERY):
+                continue
+            stats = run_maintenance(store, ARCHIVE_DIR)
+            if rebuild_snapshot(store, SNAPSHOT_DIR, stats):
+                # Drop the hidden rows of the old snapshot; other workers switch on restart
+                with sync_lock:
+                    reload_state()
+            sync_from_store()
+            notify_change()
+        except Exception as e:
+            print(f" [MAINTENANCE] Failed: {e}")
+
+if MAINTENANCE_EVERY > 0:
+    threading.Thread(target=maintenance_loop, name="maintenance", daemon=True).start()
+
+def validate_report(record):
+    """
+    Checks one report before it is stored and returns it with its numeric
+    fields as floats: confidence within 0..1, timestamp (optional) in Unix
+    seconds, not before 1970 nor more than MAX_CLOCK_SKEW ahead of now (which
+    also catches milliseconds), report_id (optional) a string of at most
+    MAX_REPORT_ID_LENGTH characters. Raises ValueError naming the offending field.
+    """
+    lat, lon = record.get("latitude"), record.get("longitude")
+    if not valid_position(lat, lon):
+        raise ValueError("latitude and longitude must be numbers within -90..90 and -180..180")
+    numbers = {"latitude": float(lat), "longitude": float(lon)}
+    for field, required in (("confidence", True), ("timestamp", False)):
+        value = record.get(field)
+        if value is None and not required:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{field} must be a finite number")
+        numbers[field] = float(value)
+    if not 0.0 <= numbers["confidence"] <= 1.0:
+        raise ValueError("confidence must be within 0..1")
+    if not 0.0 <= numbers.get("timestamp", 0.0) <= time.time() + MAX_CLOCK_SKEW:
+        raise ValueError("timestamp must be Unix seconds, not in the future")
+    if not isinstance(record.get("image_filename") or "", str):
+        raise ValueError("image_filename must be a string")
+    report_id = record.get("report_id")
+    if report_id is not None and not (isinstance(report_id, str) and 0 < len(report_id) <= MAX_REPORT_ID_LENGTH):
+        raise ValueError(f"report_id must be a string of 1..{MAX_REPORT_ID_LENGTH} characters")
+    return dict(record, **numbers)
+
+def save_hazards(records):
+    """
+    Appends hazards to the store and merges them into clusters in one commit,
+    then adds them to the index.
+    Returns (stored, duplicates): the hazard for every record in input order,
+    and how many of them were replays of an already stored report_id.
+    Every record is validated first (ValueError, nothing stored), so nothing
+    that could not be indexed is ever committed.
+    Clustering reads the cluster set before writing it, so the whole sequence
+    runs under the store's cross-process write lock, on up-to-date clusters,
+    and the in-memory updates under sync_lock like sync_from_store's.
+    """
+    global synced_seq
+    records = [validate_report(record) for record in records]
+    with store.write_lock():
+        sync_from_store()
+        with sync_lock:
+            try:
+                with store.transaction():
+                    with metrics.timed("ingest_stage_seconds", stage="store"):
+                        stored = store.add_many(records)
+                    new = [h for h in stored if not h.pop("duplicate", False)]
+                    with metrics.timed("ingest_stage_seconds", stage="cluster"):
+                        for hazard in new:
+                            clusters.ingest(hazard)
+            except Exception:
+                # The clusters merged in memory were rolled back in the store
+                reload_state()
+                raise
+            with metrics.timed("ingest_stage_seconds", stage="index"):
+                for hazard in new:
+                    index_hazard(hazard)
+            # Nobody else wrote while we held the write lock: everything up to here is applied
+            synced_seq = max(synced_seq, store.latest_seq())
+    duplicates = len(stored) - len(new)
+    metrics.counter("hazards_ingested_total", "Hazards written to the store").inc(len(new))
+    metrics.counter("hazards_duplicate_total", "Replayed reports already stored").inc(duplicates)
+    if new:
+        notify_change()
+    return stored, duplicates
+
+def save_hazard(data):
+    """Appends one hazard and returns the stored record."""
+    return save_hazards([data])[0][0]
+
+def request_body(req):
+    """
+    Returns the raw request body, gunzipped when sent with Content-Encoding: gzip.
+    Raises ValueError for a corrupt or oversized (past MAX_REPORT_BODY) body.
+    """
+    data = req.get_data()
+    if req.content_encoding != 'gzip':
+        return data
     try:
-        with open(STORAGE_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading storage: {e}")
-        return []
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = inflater.decompress(data, MAX_REPORT_BODY)
+    except zlib.error as e:
+        raise ValueError(f"Invalid gzip body: {e}")
+    if inflater.unconsumed_tail:
+        raise ValueError(f"Body exceeds {MAX_REPORT_BODY} bytes")
+    return body
 
-def save_hazards(hazards):
+def parse_json_body(req):
+    """Decodes a (possibly gzipped) JSON body; None if it is not valid JSON."""
+    body = request_body(req)
     try:
-        with open(STORAGE_FILE, 'w') as f:
-            json.dump(hazards, f, indent=4)
-    except Exception as e:
-        print(f"Error saving storage: {e}")
+        return json.loads(body)
+    except ValueError:
+        return None
 
 @app.route('/report_hazard', methods=['POST'])
 def report_hazard():
@@ -41,42 +333,327 @@ def report_hazard():
         "longitude": float,
         "confidence": float,
         "image_filename": string (optional),
-        "timestamp": float (optional)
+        "timestamp": float (optional),
+        "report_id": string (optional idempotency key, also read from Idempotency-Key)
     }
     """
-    data = request.json
-    if not data:
+    try:
+        data = parse_json_body(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "No data provided"}), 400
+    if request.headers.get('Idempotency-Key'):
+        data.setdefault("report_id", request.headers['Idempotency-Key'])
+
+    try:
+        new_hazard = save_hazard(data)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid report: {e}"}), 400
+    except Exception as e:
+        print(f"Error saving hazard: {e}")
+        return jsonify({"error": "Could not store hazard"}), 500
 
-    hazards = load_hazards()
-    
-    new_hazard = {
-        "id": len(hazards) + 1,
-        "latitude": data.get("latitude"),
-        "longitude": data.get("longitude"),
-        "confidence": data.get("confidence"),
-        "image_filename": data.get("image_filename"),
-        "timestamp": data.get("timestamp", time.time())
-    }
-    
-    hazards.append(new_hazard)
-    save_hazards(hazards)
-    
     print(f"Hazard reported: {new_hazard}")
     return jsonify({"message": "Hazard reported successfully", "hazard_id": new_hazard["id"]}), 201
 
+def parse_bulk_body(req):
+    """
+    Reads a bulk report body: a JSON array of hazard objects, or NDJSON
+    (one object per line) when sent as application/x-ndjson, either of them
+    optionally gzip-compressed (Content-Encoding: gzip).
+    Raises ValueError if the body is not a list of objects.
+    """
+    if req.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        text = request_body(req).decode('utf-8')
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        records = parse_json_body(req)
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a JSON array (or NDJSON lines) of hazard objects")
+    return records
+
+@app.route('/report_hazards', methods=['POST'])
+def report_hazards():
+    """
+    Bulk variant of /report_hazard. Accepts a JSON array or NDJSON of the same
+    objects and stores the valid ones in a single commit. Records whose
+    report_id is already stored are acknowledged with the existing id and not
+    stored again, so devices can safely replay batches they are unsure about.
+    Invalid records are listed in "rejected" ({"index", "error"}) with a null
+    hazard id; the rest of the batch is stored (400 if none was valid).
+    """
+    try:
+        records = parse_bulk_body(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not records:
+        return jsonify({"error": "No data provided"}), 400
+
+    valid, rejected = [], []
+    for i, record in enumerate(records):
+        try:
+            valid.append((i, validate_report(record)))
+        except ValueError as e:
+            rejected.append({"index": i, "error": str(e)})
+    if not valid:
+        return jsonify({"error": "No valid hazards in batch", "rejected": rejected}), 400
+
+    try:
+        stored, duplicates = save_hazards([record for _, record in valid])
+    except Exception as e:
+        print(f"Error saving hazards: {e}")
+        return jsonify({"error": "Could not store hazards"}), 500
+
+    hazard_ids = [None] * len(records)
+    for (i, _), hazard in zip(valid, stored):
+        hazard_ids[i] = hazard["id"]
+    print(f"Bulk report: stored {len(stored) - duplicates} hazards ({duplicates} duplicates"
+          f"{f', {len(rejected)} rejected' if rejected else ''})")
+    return jsonify({
+        "message": "Hazards reported successfully",
+        "hazard_ids": hazard_ids,
+        "duplicates": duplicates,
+        "rejected": rejected,
+    }), 201
+
+def parse_number(value, name, low=None, high=None):
+    """A finite float within low..high (either may be None). Raises ValueError naming it."""
+    if value is None:
+        raise ValueError(f"{name} is required")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be finite")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise ValueError(f"{name} must be within {low}..{high}" if high is not None else f"{name} must be >= {low}")
+    return number
+
+def parse_spatial_query(args):
+    """
+    Reads an optional viewport filter from the query string.
+    Either bbox=west,south,east,north (Leaflet's toBBoxString order; west >
+    east crosses the antimeridian) or lat=..&lon=..&radius=<meters>.
+    Raises ValueError on malformed input.
+    """
+    if 'bbox' in args:
+        parts = args['bbox'].split(',')
+        if len(parts) != 4:
+            raise ValueError("bbox must be west,south,east,north")
+        west, south, east, north = (parse_number(value, name, -limit, limit) for value, name, limit in
+                                    zip(parts, ("west", "south", "east", "north"), (180, 90, 180, 90)))
+        if south > north:
+            raise ValueError("bbox south must not exceed north")
+        return ('bbox', (south, west, north, east))
+    if 'radius' in args:
+        lat = parse_number(args.get('lat'), "lat", -90, 90)
+        lon = parse_number(args.get('lon'), "lon", -180, 180)
+        return ('radius', (lat, lon, parse_number(args.get('radius'), "radius", 0)))
+    return None
+
+def parse_cursor(value):
+    """Reads a change-feed cursor. Raises ValueError if it is not a non-negative integer."""
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError("cursor must be non-negative")
+    return cursor
+
+def filter_feed(feed, spatial):
+    """Restricts a changes_since() page to a spatial query (removed ids are always kept)."""
+    if spatial is None:
+        return feed
+    return dict(
+        feed,
+        hazards=[h for h in feed["hazards"] if in_spatial_query(spatial, h["latitude"], h["longitude"])],
+        clusters=[c for c in feed["clusters"] if in_spatial_query(spatial, c["latitude"], c["longitude"])],
+    )
+
+def conditional_json(build):
+    """
+    Serves build() as JSON tagged with the store's change cursor and the query,
+    or an empty 304 when the client's If-None-Match already has that version.
+    """
+    # Read the cursor before the data, so the tag never claims a newer state than the body
+    cursor = store.latest_seq()
+    etag = f"{cursor}-{zlib.crc32(request.full_path.encode()):08x}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Hazard-Cursor'] = str(cursor)
+    return response
+
 @app.route('/hazards', methods=['GET'])
 def get_hazards():
-    """Returns the list of reported hazards."""
-    hazards = load_hazards()
-    return jsonify(hazards)
+    """
+    Returns reported hazards.
+    With bbox or lat/lon/radius parameters only hazards in that area are returned.
+    With since=<cursor> only what changed after that cursor is returned, as
+    {"cursor", "has_more", "hazards", "clusters", "removed_hazards", "removed_clusters"};
+    pass the returned cursor next time. Full responses carry the current
+    cursor in the X-Hazard-Cursor header. Every response has an ETag, so
+    polling with If-None-Match costs a 304 when nothing changed.
+    """
+    try:
+        spatial = parse_spatial_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid spatial query: {e}"}), 400
+
+    if 'since' in request.args:
+        try:
+            since = parse_cursor(request.args['since'])
+            limit = min(parse_cursor(request.args.get('limit', FEED_PAGE_LIMIT)), FEED_PAGE_LIMIT) or FEED_PAGE_LIMIT
+        except ValueError as e:
+            return jsonify({"error": f"Invalid cursor: {e}"}), 400
+        if since > store.latest_seq():
+            # A cursor from another (or a reset) database: the client must resync from scratch
+            return jsonify({"error": "Cursor is ahead of the store; reload /hazards"}), 410
+        if since < store.feed_floor():
+            # Deletions before the floor were compacted away; the page would miss them
+            return jsonify({"error": "Cursor is older than the change feed; reload /hazards"}), 410
+        return conditional_json(lambda: filter_feed(store.changes_since(since, limit), spatial))
+
+    def build():
+        if spatial is None:
+            return load_hazards()
+        sync_from_store()
+        if spatial[0] == 'bbox':
+            return index.query_bbox(*spatial[1])
+        return index.query_radius(*spatial[1])
+    return conditional_json(build)
+
+@app.route('/hazards/stream', methods=['GET'])
+def stream_hazards():
+    """
+    Server-Sent Events feed of changes. Starts after since=<cursor> (default: now),
+    or after the Last-Event-ID a reconnecting EventSource sends. Each "changes"
+    event carries a /hazards?since= page and its cursor as the event id.
+    Accepts the same bbox / lat,lon,radius filters as /hazards.
+    A stream ends after STREAM_MAX_SECONDS (the client reconnects where it
+    left off); past STREAM_MAX_SUBSCRIBERS open streams the answer is 503.
+    """
+    try:
+        spatial = parse_spatial_query(request.args)
+        cursor = parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('since', store.latest_seq()))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid stream query: {e}"}), 400
+    if cursor < store.feed_floor():
+        return jsonify({"error": "Cursor is older than the change feed; reload /hazards"}), 410
+    if not open_stream():
+        metrics.counter("stream_refused_total", "Streams refused at STREAM_MAX_SUBSCRIBERS").inc()
+        resp = jsonify({"error": "Too many open streams on this worker; retry later"})
+        resp.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return resp, 503
+    def events(cursor):
+        yield "retry: 3000\n\n"
+        last_sent = time.monotonic()
+        deadline = last_sent + STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            with change_cond:
+                seen = change_version
+            if store.latest_seq() > cursor:
+                feed = store.changes_since(cursor, FEED_PAGE_LIMIT)
+                cursor = feed["cursor"]
+                last_sent = time.monotonic()
+                yield f"id: {cursor}\nevent: changes\ndata: {json.dumps(filter_feed(feed, spatial))}\n\n"
+                if feed["has_more"]:
+                    continue
+            # Local writes wake us at once; other workers' writes within STREAM_POLL
+            with change_cond:
+                change_cond.wait_for(lambda: change_version != seen, timeout=STREAM_POLL)
+            if time.monotonic() - last_sent >= STREAM_KEEPALIVE:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+        # An id-only event still sets the client's Last-Event-ID for the reconnect
+        yield f"id: {cursor}\n\n"
+
+    resp = Response(events(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, also for a stream that was never iterated
+    resp.call_on_close(close_stream)
+    return resp
+
+def in_spatial_query(spatial, lat, lon):
+    """Checks one point against a parsed spatial query (None matches everything)."""
+    if spatial is None:
+        return True
+    if not valid_position(lat, lon):
+        return False
+    if spatial[0] == 'bbox':
+        south, west, north, east = spatial[1]
+        in_lon = west <= lon <= east if west <= east else (lon >= west or lon <= east)
+        return south <= lat <= north and in_lon
+    c_lat, c_lon, radius = spatial[1]
+    return haversine_distance(c_lat, c_lon, lat, lon) <= radius
+
+@app.route('/clusters', methods=['GET'])
+def get_clusters():
+    """
+    Returns deduplicated hazard clusters (one per 100 m area) with their
+    representative point, best confidence, report count and last-seen time,
+    plus current_confidence: the best confidence decayed by the time since
+    the cluster was last seen (see lifecycle.py).
+    Accepts the same bbox / lat,lon,radius filters as /hazards.
+    """
+    try:
+        spatial = parse_spatial_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid spatial query: {e}"}), 400
+
+    def build():
+        sync_from_store()
+        now = time.time()
+        return [dict(c, current_confidence=round(decayed_confidence(c["best_confidence"] or 0.0, c["last_seen"], now), 3))
+                for c in clusters.all() if in_spatial_query(spatial, c["latitude"], c["longitude"])]
+    return conditional_json(build)
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    """
+    Aggregate hazard tile in slippy-map (XYZ) numbering, for density maps.
+    The tile is a grid x grid raster of bins; every non-empty bin is
+    [bin index (row * grid + col), count, max confidence, last seen] as
+    compact JSON, or with format=bin packed little-endian: a header of
+    z (u8), x (u32), y (u32), grid (u8), cells (u32), then per bin
+    index (u16), count (u32), max confidence % (u8), last seen (u32).
+    Zooms past MAX_TILE_ZOOM are 404; clients overzoom the last level.
+    """
+    if not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": f"No tile {z}/{x}/{y} (zoom 0-{MAX_TILE_ZOOM})"}), 404
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'bin'):
+        return jsonify({"error": "format must be json or bin"}), 400
+    sync_from_store()
+    body, etag = tiles.encoded(z, x, y, fmt)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(
+            body, mimetype='application/json' if fmt == 'json' else 'application/octet-stream')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = TILE_CACHE_CONTROL
+    return response
 
 @app.route('/events/<path:filename>')
 def serve_event_image(filename):
-    """Serves the captured event images."""
-    return send_from_directory(EVENTS_DIR, filename)
+    """
+    Serves the captured event images. Content-addressed names (<hash>.jpg,
+    <hash>_thumb.jpg, ...) never change content, so they are cached for a year
+    without revalidation; legacy event_<time>.jpg names keep the default caching.
+    """
+    response = send_from_directory(EVENTS_DIR, filename)
+    if is_content_addressed(filename):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 if __name__ == '__main__':
     print("Starting Backend Service...")
+    # `kill -USR1 <pid>` writes a sampling profile of all threads (kept out of EVENTS_DIR, which is served)
+    metrics.install_profile_signal(os.path.join(os.path.dirname(__file__), 'profiles'))
+    # Development server only; use serve.py (several worker processes) in production
     # Run on 0.0.0.0 to be accessible, port 5000
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
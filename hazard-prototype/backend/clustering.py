@@ -0,0 +1,145 @@
+import math
+import threading
+
+from geo import METERS_PER_DEG_LAT, haversine_distance, valid_position
+
+MERGE_RADIUS_M = 100  # Same rule the map used client-side (MIN_DIST_METERS)
+
+
+class ClusterEngine:
+    """
+    Merges each ingested hazard into the nearest cluster within merge_radius_m,
+    or opens a new one. Clusters live in a grid of ~merge_radius_m cells, so a
+    lookup only inspects the few cells around the report (roughly O(1)).
+
+    Every merge is persisted through the store, which also marks the hazard as
+    clustered; load() replays anything a crash left unmerged. Callers ingesting
+    a batch wrap it in store.transaction() so its merges commit together (and
+    with the hazards, if they were added in the same transaction). With several
+    server processes, callers hold store.write_lock() around ingest() and feed
+    other processes' clusters in through apply().
+    """
+
+    def __init__(self, store, merge_radius_m=MERGE_RADIUS_M):
+        self.store = store
+        self.merge_radius_m = merge_radius_m
+        self.cell_deg = merge_radius_m / METERS_PER_DEG_LAT
+        self.half_row = math.ceil(180.0 / self.cell_deg)  # cells from a cell to the far side of its row
+        self._cells = {}
+        self._clusters = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _bucket_add(self, cluster):
+        self._cells.setdefault(self._cell(cluster["latitude"], cluster["longitude"]), set()).add(cluster["id"])
+
+    def _bucket_remove(self, cluster):
+        key = self._cell(cluster["latitude"], cluster["longitude"])
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            bucket.discard(cluster["id"])
+            if not bucket:
+                del self._cells[key]
+
+    def _nearest(self, lat, lon):
+        """Returns the closest cluster within the merge radius, or None."""
+        cy, cx = self._cell(lat, lon)
+        # Cells are square in degrees, so longitude spans more cells away from the equator.
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        span_x = min(math.ceil(1 / cos_lat), self.half_row)
+        if 3 * (2 * span_x + 1) > len(self._cells):
+            # Near the poles the span covers more cells than are occupied: look at those instead
+            whole_row = span_x == self.half_row
+            keys = [k for k in self._cells if abs(k[0] - cy) <= 1 and (whole_row or abs(k[1] - cx) <= span_x)]
+        else:
+            keys = [(cy + dy, cx + dx) for dy in (-1, 0, 1) for dx in range(-span_x, span_x + 1)]
+        best, best_dist = None, None
+        for key in keys:
+            for cluster_id in self._cells.get(key, ()):
+                cluster = self._clusters[cluster_id]
+                dist = haversine_distance(lat, lon, cluster["latitude"], cluster["longitude"])
+                if dist <= self.merge_radius_m and (best_dist is None or dist < best_dist):
+                    best, best_dist = cluster, dist
+        return best
+
+    def load(self, merge_unclustered=True):
+        """
+        Loads persisted clusters and merges any hazards left unclustered
+        (which writes: callers hold the write lock, or pass merge_unclustered=False).
+        """
+        with self._lock:
+            for cluster in self.store.all_clusters():
+                self._clusters[cluster["id"]] = cluster
+                self._bucket_add(cluster)
+        if merge_unclustered:
+            with self.store.transaction():
+                for hazard in self.store.unclustered_hazards():
+                    self.ingest(hazard)
+
+    def ingest(self, hazard):
+        """Merges one stored hazard into the cluster set and returns its cluster."""
+        lat, lon = hazard.get("latitude"), hazard.get("longitude")
+        if not valid_position(lat, lon):
+            return None
+        confidence = hazard.get("confidence") or 0.0
+        timestamp = hazard.get("timestamp")
+
+        with self._lock:
+            cluster = self._nearest(lat, lon)
+            if cluster is None:
+                cluster = {
+                    "id": None,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "best_confidence": confidence,
+                    "best_hazard_id": hazard["id"],
+                    "image_filename": hazard.get("image_filename"),
+                    "report_count": 1,
+                    "first_seen": timestamp,
+                    "last_seen": timestamp,
+                }
+                self.store.save_cluster(cluster, hazard["id"])
+                self._clusters[cluster["id"]] = cluster
+                self._bucket_add(cluster)
+                return dict(cluster)
+
+            updated = dict(cluster)
+            n = updated["report_count"]
+            # Representative point is the running mean of every merged report.
+            updated["latitude"] = (updated["latitude"] * n + lat) / (n + 1)
+            updated["longitude"] = (updated["longitude"] * n + lon) / (n + 1)
+            updated["report_count"] = n + 1
+            if confidence > (updated["best_confidence"] or 0.0):
+                updated["best_confidence"] = confidence
+                updated["best_hazard_id"] = hazard["id"]
+                updated["image_filename"] = hazard.get("image_filename")
+            if timestamp is not None:
+                updated["first_seen"] = min(t for t in (updated["first_seen"], timestamp) if t is not None)
+                updated["last_seen"] = max(t for t in (updated["last_seen"], timestamp) if t is not None)
+
+            self.store.save_cluster(updated, hazard["id"])
+            self._bucket_remove(cluster)
+            self._clusters[updated["id"]] = updated
+            self._bucket_add(updated)
+            return dict(updated)
+
+    def apply(self, cluster):
+        """Takes over a cluster as persisted (e.g. by another worker process)."""
+        with self._lock:
+            old = self._clusters.get(cluster["id"])
+            if old is not None:
+                self._bucket_remove(old)
+            self._clusters[cluster["id"]] = dict(cluster)
+            self._bucket_add(cluster)
+
+    def discard(self, cluster_id):
+        with self._lock:
+            old = self._clusters.pop(cluster_id, None)
+            if old is not None:
+                self._bucket_remove(old)
+
+    def all(self):
+        with self._lock:
+            return [dict(c) for _, c in sorted(self._clusters.items())]
@@ -0,0 +1,473 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-process servers there (waitress runs threads)
+    fcntl = None
+
+# Change feed entries: what changed (kind), and how (op).
+HAZARD, CLUSTER = "hazard", "cluster"
+INSERT, UPDATE, DELETE = "insert", "update", "delete"
+
+# Columns every hazard row carries, in the order they are returned to clients.
+HAZARD_FIELDS = ("id", "latitude", "longitude", "confidence", "image_filename", "timestamp")
+CLUSTER_FIELDS = ("id", "latitude", "longitude", "best_confidence", "best_hazard_id",
+                  "image_filename", "report_count", "first_seen", "last_seen")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hazards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude REAL,
+    longitude REAL,
+    confidence REAL,
+    image_filename TEXT,
+    timestamp REAL,
+    cluster_id INTEGER,
+    report_id TEXT
+);
+CREATE TABLE IF NOT EXISTS clusters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude REAL,
+    longitude REAL,
+    best_confidence REAL,
+    best_hazard_id INTEGER,
+    image_filename TEXT,
+    report_count INTEGER,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+
+
+class HazardStore:
+    """
+    Embedded SQLite hazard store.
+
+    Inserts are single-row appends (O(1)), ids come from AUTOINCREMENT so they
+    stay unique across threads and processes, and the WAL journal keeps every
+    committed write intact if the process dies mid-write. Several server
+    processes may share one database file; write_lock() serializes their
+    read-modify-write sequences.
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._thread_lock = threading.Lock()
+        # Workers starting together must not both upgrade, backfill or migrate
+        with self.write_lock():
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+                self._add_missing_columns(conn)
+                self._backfill_changes(conn)
+                # Identifies this database, so a snapshot is never applied to another one
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('instance_id', ?)",
+                             (uuid.uuid4().hex,))
+            if legacy_json_path:
+                self.migrate_from_json(legacy_json_path)
+
+    def _connect(self):
+        """Returns this thread's connection (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Exclusive lock across threads and processes sharing this database, for
+        work that reads state and writes based on it (clustering). Plain
+        appends do not need it; SQLite serializes those on its own.
+        """
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.db_path + ".lock", "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs everything written inside it as one SQLite transaction (one commit,
+        one fsync) and yields this thread's connection. Nested calls join the
+        outer transaction, so add_many() and the save_cluster() calls of the
+        same batch commit together.
+        """
+        conn = self._connect()
+        if getattr(self._local, "in_transaction", False):
+            yield conn
+            return
+        self._local.in_transaction = True
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.in_transaction = False
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        """Upgrades databases created by older versions of this module in place."""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(hazards)")}
+        if "cluster_id" not in columns:
+            conn.execute("ALTER TABLE hazards ADD COLUMN cluster_id INTEGER")
+        if "report_id" not in columns:
+            conn.execute("ALTER TABLE hazards ADD COLUMN report_id TEXT")
+        # Device-assigned idempotency keys: a replayed report is stored once
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_hazards_report_id ON hazards(report_id)")
+        # Maintenance finds stale reports by age and expired clusters' reports by cluster
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_hazards_timestamp ON hazards(timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_hazards_cluster_id ON hazards(cluster_id)")
+
+    @staticmethod
+    def _backfill_changes(conn):
+        """Seeds the change feed of a database created before it existed."""
+        if conn.execute("SELECT 1 FROM changes LIMIT 1").fetchone():
+            return
+        now = time.time()
+        conn.execute("INSERT INTO changes (kind, entity_id, op, ts) SELECT ?, id, ?, ? FROM hazards ORDER BY id",
+                     (HAZARD, INSERT, now))
+        conn.execute("INSERT INTO changes (kind, entity_id, op, ts) SELECT ?, id, ?, ? FROM clusters ORDER BY id",
+                     (CLUSTER, INSERT, now))
+
+    @staticmethod
+    def _log_change(conn, kind, entity_id, op):
+        """Appends to the change feed; call inside the transaction that made the change."""
+        conn.execute("INSERT INTO changes (kind, entity_id, op, ts) VALUES (?, ?, ?, ?)",
+                     (kind, entity_id, op, time.time()))
+
+    @staticmethod
+    def _row_to_hazard(row):
+        return {field: row[field] for field in HAZARD_FIELDS}
+
+    def add(self, latitude, longitude, confidence, image_filename=None, timestamp=None):
+        """Appends one hazard and returns it with its assigned id."""
+        return self.add_many([{
+            "latitude": latitude,
+            "longitude": longitude,
+            "confidence": confidence,
+            "image_filename": image_filename,
+            "timestamp": timestamp,
+        }])[0]
+
+    def add_many(self, records):
+        """
+        Appends several hazards in a single transaction (one fsync for the batch)
+        and returns them with their assigned ids, in input order. A record whose
+        report_id is already stored (a replay) is not inserted again; the
+        existing hazard is returned in its place, marked "duplicate": True.
+        """
+        stored = []
+        with self.transaction() as conn:
+            for record in records:
+                report_id = record.get("report_id")
+                if report_id is not None:
+                    row = conn.execute("SELECT * FROM hazards WHERE report_id = ?", (report_id,)).fetchone()
+                    if row is not None:
+                        stored.append({**self._row_to_hazard(row), "duplicate": True})
+                        continue
+                timestamp = record.get("timestamp")
+                if timestamp is None:
+                    timestamp = time.time()
+                hazard = {
+                    "latitude": record.get("latitude"),
+                    "longitude": record.get("longitude"),
+                    "confidence": record.get("confidence"),
+                    "image_filename": record.get("image_filename"),
+                    "timestamp": timestamp,
+                }
+                cur = conn.execute(
+                    "INSERT INTO hazards (latitude, longitude, confidence, image_filename, timestamp, report_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (hazard["latitude"], hazard["longitude"], hazard["confidence"],
+                     hazard["image_filename"], hazard["timestamp"], report_id),
+                )
+                self._log_change(conn, HAZARD, cur.lastrowid, INSERT)
+                stored.append({"id": cur.lastrowid, **hazard})
+        return stored
+
+    def all(self):
+        """Returns every stored hazard ordered by id."""
+        rows = self._connect().execute("SELECT * FROM hazards ORDER BY id").fetchall()
+        return [self._row_to_hazard(row) for row in rows]
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM hazards").fetchone()[0]
+
+    def instance_id(self):
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'instance_id'").fetchone()[0]
+
+    def iter_rows(self, chunk=50000):
+        """
+        Yields every hazard as plain tuples in HAZARD_FIELDS order, ordered by
+        id, chunk rows at a time (no dict per record; for bulk export).
+        """
+        cur = self._connect().execute(f"SELECT {', '.join(HAZARD_FIELDS)} FROM hazards ORDER BY id")
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                return
+            yield rows
+
+    def latest_seq(self):
+        """
+        Cursor of the newest change (0 for an empty store). Read from the
+        AUTOINCREMENT high-water mark, so it never goes back when compaction
+        drops the newest entries.
+        """
+        return self._connect().execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)"
+        ).fetchone()[0]
+
+    def changes_since(self, cursor, limit=1000):
+        """
+        Returns everything that changed after cursor, oldest first, up to limit
+        change entries: the current state of changed hazards and clusters, the ids
+        of deleted ones, the cursor to pass next time and whether more remain.
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT seq, kind, entity_id, op FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (cursor, limit),
+        ).fetchall()
+        latest = {}  # (kind, id) -> last op in this page
+        for row in rows:
+            latest.pop((row["kind"], row["entity_id"]), None)
+            latest[(row["kind"], row["entity_id"])] = row["op"]
+
+        def fetch(table, fields, ids):
+            if not ids:
+                return []
+            found = {}
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                for row in conn.execute(
+                    f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    found[row["id"]] = {field: row[field] for field in fields}
+            return [found[i] for i in ids if i in found]
+
+        live = {HAZARD: [], CLUSTER: []}
+        removed = {HAZARD: [], CLUSTER: []}
+        for (kind, entity_id), op in latest.items():
+            (removed if op == DELETE else live)[kind].append(entity_id)
+        return {
+            "cursor": rows[-1]["seq"] if rows else max(cursor, 0),
+            "has_more": len(rows) == limit,
+            "hazards": fetch("hazards", HAZARD_FIELDS, live[HAZARD]),
+            "clusters": fetch("clusters", CLUSTER_FIELDS, live[CLUSTER]),
+            "removed_hazards": removed[HAZARD],
+            "removed_clusters": removed[CLUSTER],
+        }
+
+    def get_meta(self, key, default=None):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def feed_floor(self):
+        """
+        Oldest cursor the change feed can still serve completely: compaction
+        drops old delete entries, so a client (or snapshot) behind this must reload.
+        """
+        return int(self.get_meta("feed_floor", 0))
+
+    def hazards_before(self, before, limit=5000):
+        """Up to limit full hazard rows (incl. cluster_id and report_id) reported before `before`, oldest first."""
+        rows = self._connect().execute(
+            "SELECT * FROM hazards WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (before, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_hazards_before(self, before):
+        """Number of hazards reported before `before`."""
+        return self._connect().execute("SELECT COUNT(*) FROM hazards WHERE timestamp < ?", (before,)).fetchone()[0]
+
+    def hazards_of_clusters(self, cluster_ids):
+        """Full hazard rows (incl. cluster_id and report_id) merged into any of cluster_ids, ordered by id."""
+        conn = self._connect()
+        cluster_ids = list(cluster_ids)
+        rows = []
+        for i in range(0, len(cluster_ids), 500):
+            chunk = cluster_ids[i:i + 500]
+            rows += conn.execute(
+                f"SELECT * FROM hazards WHERE cluster_id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+        return sorted((dict(row) for row in rows), key=lambda row: row["id"])
+
+    def delete_hazards(self, ids):
+        """Deletes hazards in one transaction; the change feed reports them as removed."""
+        conn = self._connect()
+        with conn:
+            for hazard_id in ids:
+                conn.execute("DELETE FROM hazards WHERE id = ?", (hazard_id,))
+                self._log_change(conn, HAZARD, hazard_id, DELETE)
+
+    def delete_clusters(self, ids):
+        """Deletes clusters in one transaction; the change feed reports them as removed."""
+        conn = self._connect()
+        with conn:
+            for cluster_id in ids:
+                conn.execute("DELETE FROM clusters WHERE id = ?", (cluster_id,))
+                self._log_change(conn, CLUSTER, cluster_id, DELETE)
+
+    def compact_changes(self, tombstones_before):
+        """
+        Shrinks the change feed: drops every entry superseded by a newer one for
+        the same entity (replaying the feed gives the same result), and delete
+        entries older than tombstones_before, raising feed_floor past them.
+        Returns the number of entries removed.
+        """
+        conn = self._connect()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM changes WHERE seq NOT IN (SELECT MAX(seq) FROM changes GROUP BY kind, entity_id)"
+            ).rowcount
+            floor = conn.execute(
+                "SELECT MAX(seq) FROM changes WHERE op = ? AND ts < ?", (DELETE, tombstones_before)
+            ).fetchone()[0]
+            if floor is not None:
+                removed += conn.execute(
+                    "DELETE FROM changes WHERE op = ? AND seq <= ?", (DELETE, floor)
+                ).rowcount
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('feed_floor', ?)",
+                             (max(floor, self.feed_floor()),))
+        return removed
+
+    def vacuum(self, min_free_share=0.25):
+        """Rewrites the database file if at least min_free_share of its pages are free. Returns True if it did."""
+        conn = self._connect()
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not pages or free / pages < min_free_share:
+            return False
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    def unclustered_hazards(self):
+        """Returns hazards not yet assigned to a cluster, ordered by id."""
+        rows = self._connect().execute(
+            "SELECT * FROM hazards WHERE cluster_id IS NULL ORDER BY id"
+        ).fetchall()
+        return [self._row_to_hazard(row) for row in rows]
+
+    def all_clusters(self):
+        rows = self._connect().execute("SELECT * FROM clusters ORDER BY id").fetchall()
+        return [{field: row[field] for field in CLUSTER_FIELDS} for row in rows]
+
+    def save_cluster(self, cluster, hazard_id):
+        """
+        Inserts or updates a cluster and links hazard_id to it in one transaction
+        (the caller's, inside transaction()), so a restart re-clusters exactly
+        the hazards that were never merged. Assigns cluster["id"] on first save.
+        """
+        values = [cluster[field] for field in CLUSTER_FIELDS[1:]]
+        with self.transaction() as conn:
+            if cluster.get("id") is None:
+                cur = conn.execute(
+                    f"INSERT INTO clusters ({', '.join(CLUSTER_FIELDS[1:])}) "
+                    f"VALUES ({', '.join('?' * len(values))})",
+                    values,
+                )
+                cluster["id"] = cur.lastrowid
+                self._log_change(conn, CLUSTER, cluster["id"], INSERT)
+            else:
+                conn.execute(
+                    f"UPDATE clusters SET {', '.join(f + ' = ?' for f in CLUSTER_FIELDS[1:])} WHERE id = ?",
+                    values + [cluster["id"]],
+                )
+                self._log_change(conn, CLUSTER, cluster["id"], UPDATE)
+            conn.execute(
+                "UPDATE hazards SET cluster_id = ? WHERE id = ?",
+                (cluster["id"], hazard_id),
+            )
+        return cluster
+
+    def migrate_from_json(self, json_path):
+        """
+        One-time import of the legacy storage.json list.
+        The import and the 'migrated' marker commit in one transaction, so a crash
+        either leaves nothing imported or never imports the file twice.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return 0
+
+        try:
+            with open(json_path, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error reading legacy storage {json_path}: {e}")
+            return 0
+
+        # The old len()+1 ids could collide under concurrent writes. Keep the first
+        # occurrence of each id and renumber the rest after every original id is in.
+        seen_ids = set()
+        keep, renumber = [], []
+        for hazard in legacy:
+            hazard_id = hazard.get("id")
+            if hazard_id is None or hazard_id in seen_ids:
+                renumber.append(hazard)
+            else:
+                seen_ids.add(hazard_id)
+                keep.append(hazard)
+
+        with conn:
+            for hazard_id, hazard in [(h["id"], h) for h in keep] + [(None, h) for h in renumber]:
+                cur = conn.execute(
+                    "INSERT INTO hazards (id, latitude, longitude, confidence, image_filename, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        hazard_id,
+                        hazard.get("latitude"),
+                        hazard.get("longitude"),
+                        hazard.get("confidence"),
+                        hazard.get("image_filename"),
+                        hazard.get("timestamp", time.time()),
+                    ),
+                )
+                self._log_change(conn, HAZARD, cur.lastrowid, INSERT)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (json_path,),
+            )
+
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except OSError as e:
+            print(f"Migrated {json_path} but could not rename it: {e}")
+        print(f"Migrated {len(legacy)} hazards from {json_path}")
+        return len(legacy)
@@ -0,0 +1,186 @@
+"""
+Hazard lifecycle: confidence decay, expiry into cold archive segments, and
+compaction of the hot store.
+
+Potholes get repaired, but nothing ever removed their reports, so the store,
+every full /hazards scan and the frontend's map grew without bound. Here:
+
+- A cluster's confidence halves every CONFIDENCE_HALF_LIFE_DAYS it is not
+  re-observed (decayed_confidence(); computed when read, no row rewrites).
+  A new report merged into the cluster resets the clock (last_seen).
+- Maintenance expires clusters whose decayed confidence fell below
+  MIN_CONFIDENCE or that were not seen for CLUSTER_TTL_DAYS, with all their
+  reports, and single reports older than HAZARD_TTL_DAYS (the cluster keeps
+  summarizing them). Expired rows are appended to gzip NDJSON segments per
+  month (<db>.archive/hazards-YYYY-MM.ndjson.gz, clusters-...) and fsynced
+  before they are deleted, so a crash can duplicate an archived row (same
+  id) but never lose one.
+- The change feed drops superseded entries and delete entries older than
+  TOMBSTONE_RETENTION_DAYS (clients further behind reload, see feed_floor),
+  and the database file is vacuumed when much of it is free pages.
+
+Each step holds the store's write lock only for one batch, so ingestion
+keeps running. The backend runs maintenance every MAINTENANCE_INTERVAL
+seconds (HAZARD_MAINTENANCE_INTERVAL, 0 = off); the first worker process
+to claim() a run does the work. For cron:
+
+    python lifecycle.py                 # due maintenance on hazards.db (HAZARD_DB)
+    python lifecycle.py --force --dry-run
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+
+# Shared helpers (geo, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+
+from hazard_store import HazardStore
+from snapshot import build, read_meta
+
+DAY = 86400
+CONFIDENCE_HALF_LIFE_DAYS = 30
+MIN_CONFIDENCE = 0.2          # clusters decayed below this are expired
+CLUSTER_TTL_DAYS = 180        # ... and any cluster not seen for this long
+HAZARD_TTL_DAYS = 30          # single reports older than this are archived
+TOMBSTONE_RETENTION_DAYS = 7  # feed clients offline longer than this reload
+MAINTENANCE_INTERVAL = 3600   # seconds
+ARCHIVE_BATCH = 5000          # rows per write-lock hold
+
+
+def decayed_confidence(confidence, last_seen, now=None, half_life_days=CONFIDENCE_HALF_LIFE_DAYS):
+    """Confidence after halving every half_life_days since last_seen (unchanged without a last_seen)."""
+    if confidence is None or last_seen is None:
+        return confidence
+    age = max((time.time() if now is None else now) - last_seen, 0.0)
+    return confidence * 0.5 ** (age / (half_life_days * DAY))
+
+
+def cluster_expired(cluster, now):
+    last_seen = cluster["last_seen"] if cluster["last_seen"] is not None else cluster["first_seen"]
+    if last_seen is None:
+        return False
+    return (now - last_seen > CLUSTER_TTL_DAYS * DAY
+            or decayed_confidence(cluster["best_confidence"] or 0.0, last_seen, now) < MIN_CONFIDENCE)
+
+
+def archive(rows, kind, archive_dir, time_field, now):
+    """Appends rows to <archive_dir>/<kind>-YYYY-MM.ndjson.gz by the month of time_field, fsynced."""
+    os.makedirs(archive_dir, exist_ok=True)
+    months = {}
+    for row in rows:
+        month = time.strftime("%Y-%m", time.gmtime(row[time_field] or now))
+        months.setdefault(month, []).append(json.dumps(dict(row, archived_at=now)) + "\n")
+    for month, lines in months.items():
+        # Every append is one more gzip member; gzip readers see them as one stream
+        with open(os.path.join(archive_dir, f"{kind}-{month}.ndjson.gz"), "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="ab") as gz:
+                gz.write("".join(lines).encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_archive(archive_dir, kind="hazards"):
+    """Yields every archived row of a kind, oldest segment first."""
+    if not os.path.isdir(archive_dir):
+        return
+    for name in sorted(os.listdir(archive_dir)):
+        if name.startswith(kind + "-") and name.endswith(".ndjson.gz"):
+            with gzip.open(os.path.join(archive_dir, name), "rt") as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+def claim(store, interval=MAINTENANCE_INTERVAL, now=None):
+    """True (and stamps the store) if no process ran maintenance in the last interval seconds."""
+    now = time.time() if now is None else now
+    with store.write_lock():
+        if now - float(store.get_meta("last_maintenance", 0)) < interval:
+            return False
+        store.set_meta("last_maintenance", now)
+        return True
+
+
+def run_maintenance(store, archive_dir, now=None, dry_run=False):
+    """
+    Expires decayed clusters and stale reports into archive_dir, compacts the
+    change feed and vacuums. Takes the store's write lock per batch (callers
+    must not hold it). Returns counts of what was done; with dry_run, of
+    everything a real run would expire and archive, changing nothing.
+    """
+    now = time.time() if now is None else now
+    started = time.perf_counter()
+    stats = {"clusters_expired": 0, "hazards_archived": 0, "changes_compacted": 0, "vacuumed": False}
+
+    if dry_run:
+        stale_before = now - HAZARD_TTL_DAYS * DAY
+        expired = [c["id"] for c in store.all_clusters() if cluster_expired(c, now)]
+        hazards = store.hazards_of_clusters(expired)
+        # Reports of expired clusters go with them; other stale reports are archived on their own
+        stale_in_expired = sum(1 for h in hazards if h["timestamp"] is not None and h["timestamp"] < stale_before)
+        stats["clusters_expired"] = len(expired)
+        stats["hazards_archived"] = len(hazards) + store.count_hazards_before(stale_before) - stale_in_expired
+        print(f" [MAINTENANCE] Would expire {stats['clusters_expired']} clusters and archive "
+              f"{stats['hazards_archived']} hazards ({time.perf_counter() - started:.2f}s)")
+        return stats
+
+    # Clusters and their reports go together: decided, archived and deleted
+    # under one lock hold, so a report merged in meanwhile cannot be lost.
+    while True:
+        with store.write_lock():
+            expired = [c for c in store.all_clusters() if cluster_expired(c, now)][:ARCHIVE_BATCH]
+            if not expired:
+                break
+            hazards = store.hazards_of_clusters([c["id"] for c in expired])
+            archive(hazards, "hazards", archive_dir, "timestamp", now)
+            archive(expired, "clusters", archive_dir, "last_seen", now)
+            store.delete_hazards([h["id"] for h in hazards])
+            store.delete_clusters([c["id"] for c in expired])
+        stats["clusters_expired"] += len(expired)
+        stats["hazards_archived"] += len(hazards)
+
+    while True:
+        with store.write_lock():
+            hazards = store.hazards_before(now - HAZARD_TTL_DAYS * DAY, ARCHIVE_BATCH)
+            if not hazards:
+                break
+            archive(hazards, "hazards", archive_dir, "timestamp", now)
+            store.delete_hazards([h["id"] for h in hazards])
+        stats["hazards_archived"] += len(hazards)
+
+    with store.write_lock():
+        stats["changes_compacted"] = store.compact_changes(now - TOMBSTONE_RETENTION_DAYS * DAY)
+        stats["vacuumed"] = store.vacuum()
+    print(f" [MAINTENANCE] Expired {stats['clusters_expired']} clusters, "
+          f"archived {stats['hazards_archived']} hazards, compacted {stats['changes_compacted']} changes"
+          f"{', vacuumed' if stats['vacuumed'] else ''} in {time.perf_counter() - started:.2f}s")
+    return stats
+
+
+def rebuild_snapshot(store, snapshot_dir, stats):
+    """Rebuilds an existing snapshot after maintenance removed anything. Returns True if it did."""
+    if read_meta(snapshot_dir) is None or not (stats["clusters_expired"] or stats["hazards_archived"]):
+        return False
+    build(store, snapshot_dir)
+    return True
+
+
+if __name__ == "__main__":
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    default_db = os.environ.get("HAZARD_DB", os.path.join(backend_dir, "hazards.db"))
+    parser = argparse.ArgumentParser(description="Expire, archive and compact hazards.")
+    parser.add_argument("--db", default=default_db, help="hazard database (default: HAZARD_DB or hazards.db)")
+    parser.add_argument("--archive", help="archive directory (default: <db>.archive)")
+    parser.add_argument("--snapshot", help="snapshot directory to rebuild (default: <db>.snapshot)")
+    parser.add_argument("--force", action="store_true", help="run even if the last run was recent")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would expire")
+    args = parser.parse_args()
+
+    store = HazardStore(args.db)
+    if not (args.force or args.dry_run or claim(store)):
+        sys.exit(" [MAINTENANCE] Not due yet (use --force)")
+    stats = run_maintenance(store, args.archive or args.db + ".archive", dry_run=args.dry_run)
+    if not args.dry_run:
+        rebuild_snapshot(store, args.snapshot or args.db + ".snapshot", stats)
@@ -0,0 +1,43 @@
+"""
+Production entry point for the hazard backend.
+
+    python serve.py                       # gunicorn, one worker per CPU, 8 threads each
+    python serve.py --workers 4 --threads 4
+    python serve.py --server waitress     # Windows / no fork: threads only
+
+Equivalent gunicorn command line:
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 app:app
+
+All workers share hazards.db (SQLite WAL). Clustering runs under the store's
+cross-process write lock and every worker brings its in-memory spatial index
+and clusters up to date from the change feed before answering, so any worker
+returns the same data. Each open /hazards/stream (SSE) holds a thread, so a
+worker takes at most half its threads' worth of streams (HAZARD_STREAM_SUBSCRIBERS)
+and ends each after HAZARD_STREAM_SECONDS; clients reconnect where they left off.
+app.py's own `python app.py` stays the dev server.
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from serving import SERVERS, serve
+
+
+def load_app():
+    import app
+    return app.app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the hazard backend with several workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)) or None,
+                        help="worker processes (default: CPU count; gunicorn only)")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--server", choices=SERVERS, help="default: the first one installed")
+    args = parser.parse_args()
+    # Every open SSE stream holds a thread; keep half of each worker's threads for API requests
+    os.environ.setdefault("HAZARD_STREAM_SUBSCRIBERS", str(max(1, args.threads // 2)))
+    serve(load_app, host=args.host, port=args.port, workers=args.workers, threads=args.threads, server=args.server)
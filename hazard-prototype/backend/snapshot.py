@@ -0,0 +1,361 @@
+"""
+Compact columnar snapshot of the hazard store for fast backend startup.
+
+A snapshot is a directory of NumPy arrays next to the database:
+
+    columns.npy        structured array: id, latitude, longitude, confidence,
+                       timestamp; sorted by spatial index cell, then id
+    cells.npy          the sorted cell key of every row
+    ids.npy, id_rows.npy   ids in ascending order and their row in columns.npy
+    images.bin, image_offsets.npy   image filenames as one UTF-8 blob
+    tile_*.npy         precomputed aggregate tile bins (tiles.aggregate_bins)
+    meta.json          store instance id, change cursor, counts, parameters
+
+The backend memory-maps the arrays at startup (np.load(mmap_mode="r")), so
+loading costs milliseconds whatever the size, the pages are shared by every
+worker process through the OS page cache, and a viewport query touches only
+the rows of the cells it covers. Changes after the snapshot's cursor are
+replayed from the store's change feed into a small in-memory delta
+(spatial_index.LayeredIndex, TileAggregator.load_base).
+
+    python snapshot.py build                       # from hazards.db (HAZARD_DB)
+    python snapshot.py info
+    python snapshot.py export hazards.ndjson --format ndjson
+    python snapshot.py import storage.json         # JSON array or NDJSON
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+
+import numpy as np
+
+# Shared helpers (geo, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+
+from clustering import ClusterEngine
+from geo import valid_position
+from hazard_store import HAZARD_FIELDS, HazardStore
+from spatial_index import DEFAULT_CELL_DEG
+from tiles import MAX_TILE_ZOOM, TILE_GRID, aggregate_bins
+
+SNAPSHOT_VERSION = 1
+COLUMNS_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("latitude", "<f8"),
+    ("longitude", "<f8"),
+    ("confidence", "<f8"),   # NaN for a missing value
+    ("timestamp", "<f8"),
+])
+# Cell (cy, cx) of the grid index packed into one sortable int64; every row
+# of cells (fixed cy) is a contiguous key range, so a bbox is one range per row.
+CELL_OFFSET = 1 << 20
+CELL_ROW = 1 << 21
+IMPORT_CHUNK = 5000
+
+
+def cell_keys(lats, lons, cell_deg):
+    cy = np.floor(np.asarray(lats) / cell_deg).astype(np.int64)
+    cx = np.floor(np.asarray(lons) / cell_deg).astype(np.int64)
+    return (cy + CELL_OFFSET) * CELL_ROW + (cx + CELL_OFFSET)
+
+
+def build(store, path, cell_deg=DEFAULT_CELL_DEG, max_zoom=MAX_TILE_ZOOM, grid=TILE_GRID):
+    """
+    Writes a snapshot of every hazard in the store to directory path,
+    replacing any previous one atomically. Returns its meta dict.
+    """
+    started = time.perf_counter()
+    # The cursor is read before the rows: anything written in between is in
+    # both the snapshot and the feed after the cursor, and replaying it is harmless.
+    seq = store.latest_seq()
+    ids, lats, lons, confs, stamps, images = [], [], [], [], [], []
+    for rows in store.iter_rows():
+        for hazard_id, lat, lon, conf, image, ts in rows:
+            if not valid_position(lat, lon):
+                continue  # never indexed or tiled
+            ids.append(hazard_id)
+            lats.append(lat)
+            lons.append(lon)
+            confs.append(np.nan if conf is None else conf)
+            stamps.append(np.nan if ts is None else ts)
+            images.append(image)
+
+    n = len(ids)
+    columns = np.empty(n, dtype=COLUMNS_DTYPE)
+    columns["id"] = ids
+    columns["latitude"] = lats
+    columns["longitude"] = lons
+    columns["confidence"] = confs
+    columns["timestamp"] = stamps
+    cells = cell_keys(columns["latitude"], columns["longitude"], cell_deg)
+    order = np.lexsort((columns["id"], cells))
+    columns, cells = columns[order], cells[order]
+    encoded = [(images[i] or "").encode("utf-8") for i in order]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    id_rows = np.argsort(columns["id"], kind="stable")
+
+    keys, counts, max_conf, last_seen = aggregate_bins(
+        columns["latitude"], columns["longitude"], columns["confidence"], columns["timestamp"], max_zoom, grid)
+    tile_count = int(np.unique(keys // (grid * grid)).size)
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "instance_id": store.instance_id(),
+        "seq": seq,
+        "count": n,
+        "cell_deg": cell_deg,
+        "max_zoom": max_zoom,
+        "grid": grid,
+        "tile_count": tile_count,
+        "created": time.time(),
+    }
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "columns.npy"), columns)
+    np.save(os.path.join(tmp, "cells.npy"), cells)
+    np.save(os.path.join(tmp, "ids.npy"), columns["id"][id_rows])
+    np.save(os.path.join(tmp, "id_rows.npy"), id_rows)
+    with open(os.path.join(tmp, "images.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(tmp, "image_offsets.npy"), offsets)
+    np.save(os.path.join(tmp, "tile_keys.npy"), keys)
+    np.save(os.path.join(tmp, "tile_counts.npy"), counts.astype(np.int32))
+    np.save(os.path.join(tmp, "tile_max_confidence.npy"), max_conf.astype(np.float32))
+    np.save(os.path.join(tmp, "tile_last_seen.npy"), last_seen)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    # Swap directories; processes that mapped the old files keep reading them
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    print(f" [SNAPSHOT] Wrote {n} hazards ({tile_count} tiles) up to cursor {seq} "
+          f"in {time.perf_counter() - started:.2f}s -> {path}")
+    return meta
+
+
+def read_meta(path):
+    """Returns the snapshot's meta dict, or None if there is no readable snapshot."""
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == SNAPSHOT_VERSION else None
+
+
+class Snapshot:
+    """A memory-mapped snapshot directory (see module docstring)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = read_meta(path)
+        if self.meta is None:
+            raise FileNotFoundError(f"No snapshot in {path}")
+        self.seq = self.meta["seq"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.columns = load("columns.npy")
+        self.cells = load("cells.npy")
+        self.ids = load("ids.npy")
+        self.id_rows = load("id_rows.npy")
+        self.image_offsets = load("image_offsets.npy")
+        # np.memmap cannot map an empty file
+        images = os.path.join(path, "images.bin")
+        self.images = np.memmap(images, dtype=np.uint8, mode="r") if os.path.getsize(images) else b""
+        self.tile_bins = tuple(load(f"tile_{name}.npy")
+                               for name in ("keys", "counts", "max_confidence", "last_seen"))
+
+    def matches(self, store):
+        """
+        True if the snapshot was taken from this store, is not ahead of it, and
+        the change feed still holds everything after it (see compact_changes).
+        """
+        return (self.meta["instance_id"] == store.instance_id()
+                and store.feed_floor() <= self.seq <= store.latest_seq())
+
+    def hazard(self, row):
+        """Builds the client-facing dict of one row."""
+        record = self.columns[row]
+        start, end = self.image_offsets[row], self.image_offsets[row + 1]
+        confidence, timestamp = float(record["confidence"]), float(record["timestamp"])
+        return {
+            "id": int(record["id"]),
+            "latitude": float(record["latitude"]),
+            "longitude": float(record["longitude"]),
+            "confidence": None if confidence != confidence else confidence,
+            "image_filename": bytes(self.images[start:end]).decode("utf-8") if end > start else None,
+            "timestamp": None if timestamp != timestamp else timestamp,
+        }
+
+    def row_of(self, hazard_id):
+        """Row of a hazard id, or None if the snapshot does not have it."""
+        i = int(np.searchsorted(self.ids, hazard_id))
+        if i < len(self.ids) and self.ids[i] == hazard_id:
+            return int(self.id_rows[i])
+        return None
+
+    def iter_hazards(self):
+        """Yields every hazard dict in id order."""
+        for row in self.id_rows:
+            yield self.hazard(int(row))
+
+    def index(self):
+        return SnapshotIndex(self)
+
+
+class SnapshotIndex:
+    """
+    Read-only spatial index over a Snapshot. Rows replaced or deleted since
+    the snapshot are hidden (hide()); dicts are built only for query results.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.cell_deg = snapshot.meta["cell_deg"]
+        self._cells = snapshot.cells
+        self._hidden = np.zeros(len(snapshot.columns), dtype=bool)
+        self._hidden_count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hidden) - self._hidden_count
+
+    def hide(self, hazard_id):
+        """Hides a hazard; returns its snapshot version (None if absent or already hidden)."""
+        row = self.snapshot.row_of(hazard_id)
+        with self._lock:
+            if row is None or self._hidden[row]:
+                return None
+            self._hidden[row] = True
+            self._hidden_count += 1
+        return self.snapshot.hazard(row)
+
+    def scan(self, min_lat, min_lon, max_lat, max_lon):
+        """Yields visible hazards inside one non-wrapping box."""
+        lo_y, hi_y = (int(np.floor(v / self.cell_deg)) for v in (min_lat, max_lat))
+        lo_x, hi_x = (int(np.floor(v / self.cell_deg)) for v in (min_lon, max_lon))
+        # One contiguous key range per row of cells under the box
+        rows = np.arange(lo_y, hi_y + 1, dtype=np.int64) + CELL_OFFSET
+        starts = np.searchsorted(self._cells, rows * CELL_ROW + lo_x + CELL_OFFSET)
+        ends = np.searchsorted(self._cells, rows * CELL_ROW + hi_x + CELL_OFFSET, side="right")
+        spans = [(s, e) for s, e in zip(starts.tolist(), ends.tolist()) if e > s]
+        if not spans:
+            return
+        candidates = np.concatenate([np.arange(s, e) for s, e in spans])
+        columns = self.snapshot.columns
+        lat, lon = columns["latitude"][candidates], columns["longitude"][candidates]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        inside &= ~self._hidden[candidates]
+        for row in candidates[inside].tolist():
+            yield self.snapshot.hazard(row)
+
+
+def load_records(path, fmt=None):
+    """Reads hazard records from a JSON array or NDJSON file, in chunks of IMPORT_CHUNK."""
+    fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "json")
+    if fmt == "json":
+        with open(path) as f:
+            records = json.load(f)
+        for i in range(0, len(records), IMPORT_CHUNK):
+            yield records[i:i + IMPORT_CHUNK]
+        return
+    chunk = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+            if len(chunk) == IMPORT_CHUNK:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def export(store, path, fmt="ndjson"):
+    """Streams every hazard in the store to a JSON array or NDJSON file; returns the count."""
+    n = 0
+    with open(path, "w") as f:
+        if fmt == "json":
+            f.write("[")
+        for rows in store.iter_rows():
+            for row in rows:
+                line = json.dumps(dict(zip(HAZARD_FIELDS, row)))
+                if fmt == "json":
+                    f.write(("," if n else "") + "\n" + line)
+                else:
+                    f.write(line + "\n")
+                n += 1
+        if fmt == "json":
+            f.write("\n]\n")
+    return n
+
+
+def import_records(store, path, fmt=None):
+    """
+    Appends hazards from a JSON/NDJSON file to the store (ids are reassigned;
+    records with a known report_id are skipped) and clusters them.
+    Returns (stored, duplicates).
+    """
+    stored = duplicates = 0
+    for chunk in load_records(path, fmt):
+        for record in chunk:
+            record.pop("id", None)
+        with store.write_lock():
+            for hazard in store.add_many(chunk):
+                if hazard.get("duplicate"):
+                    duplicates += 1
+                else:
+                    stored += 1
+    # Running backends pick the new clusters up from the change feed
+    with store.write_lock():
+        ClusterEngine(store).load()
+    return stored, duplicates
+
+
+if __name__ == "__main__":
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    default_db = os.environ.get("HAZARD_DB", os.path.join(backend_dir, "hazards.db"))
+    parser = argparse.ArgumentParser(description="Build, inspect, import and export hazard snapshots.")
+    parser.add_argument("--db", default=default_db, help="hazard database (default: HAZARD_DB or hazards.db)")
+    parser.add_argument("--snapshot", help="snapshot directory (default: <db>.snapshot)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="write a snapshot of the store")
+    commands.add_parser("info", help="describe the snapshot")
+    export_cmd = commands.add_parser("export", help="write every hazard to JSON or NDJSON")
+    export_cmd.add_argument("output")
+    export_cmd.add_argument("--format", choices=["json", "ndjson"], default="ndjson")
+    import_cmd = commands.add_parser("import", help="append hazards from JSON or NDJSON, then rebuild")
+    import_cmd.add_argument("input")
+    import_cmd.add_argument("--format", choices=["json", "ndjson"], help="default: from the file extension")
+    args = parser.parse_args()
+
+    snapshot_dir = args.snapshot or args.db + ".snapshot"
+    if args.command == "info":
+        meta = read_meta(snapshot_dir)
+        if meta is None:
+            sys.exit(f"No snapshot in {snapshot_dir}")
+        store = HazardStore(args.db)
+        meta["behind_store_by"] = store.latest_seq() - meta["seq"]
+        meta["matches_store"] = meta["instance_id"] == store.instance_id()
+        print(json.dumps(meta, indent=2))
+    elif args.command == "export":
+        started = time.perf_counter()
+        n = export(HazardStore(args.db), args.output, args.format)
+        print(f" [SNAPSHOT] Exported {n} hazards to {args.output} in {time.perf_counter() - started:.2f}s")
+    else:
+        store = HazardStore(args.db)
+        if args.command == "import":
+            stored, duplicates = import_records(store, args.input, args.format)
+            print(f" [SNAPSHOT] Imported {stored} hazards ({duplicates} duplicates) from {args.input}")
+        build(store, snapshot_dir)
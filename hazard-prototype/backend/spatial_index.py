@@ -0,0 +1,137 @@
+import math
+import threading
+
+from geo import EARTH_RADIUS_M, haversine_many, valid_position
+
+# Grid cell edge in degrees (~1.1 km of latitude). Viewport queries touch only the
+# cells under the requested box, so cost follows the viewport, not the store size.
+DEFAULT_CELL_DEG = 0.01
+
+
+class GridIndex:
+    """
+    In-memory uniform lat/lon grid of hazards, kept in sync with the store on
+    insert. Inserting an id that is already indexed replaces it, so replaying
+    the change feed over the index is safe.
+    """
+
+    def __init__(self, cell_deg=DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._where = {}  # hazard id -> cell key
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(bucket) for bucket in self._cells.values())
+
+    def insert(self, hazard):
+        """Indexes a hazard; returns the version it replaced, if any."""
+        lat, lon = hazard.get("latitude"), hazard.get("longitude")
+        if not valid_position(lat, lon):
+            return None
+        key = self._cell(lat, lon)
+        with self._lock:
+            old = self._discard(hazard["id"])
+            self._cells.setdefault(key, []).append(hazard)
+            self._where[hazard["id"]] = key
+        return old
+
+    def remove(self, hazard_id):
+        """Drops a hazard from the index and returns it (None if it was not indexed)."""
+        with self._lock:
+            return self._discard(hazard_id)
+
+    def _discard(self, hazard_id):
+        key = self._where.pop(hazard_id, None)
+        if key is None:
+            return None
+        old = next(h for h in self._cells[key] if h["id"] == hazard_id)
+        bucket = [h for h in self._cells[key] if h["id"] != hazard_id]
+        if bucket:
+            self._cells[key] = bucket
+        else:
+            del self._cells[key]
+        return old
+
+    def bulk_load(self, hazards):
+        for hazard in hazards:
+            self.insert(hazard)
+
+    def _scan(self, min_lat, min_lon, max_lat, max_lon):
+        """Yields hazards inside one non-wrapping box."""
+        lo_y, lo_x = self._cell(min_lat, min_lon)
+        hi_y, hi_x = self._cell(max_lat, max_lon)
+        n_cells = (hi_y - lo_y + 1) * (hi_x - lo_x + 1)
+        with self._lock:
+            if n_cells > len(self._cells):
+                # Huge box over a sparse grid: walking occupied cells is cheaper.
+                buckets = [b for (cy, cx), b in self._cells.items()
+                           if lo_y <= cy <= hi_y and lo_x <= cx <= hi_x]
+            else:
+                buckets = [self._cells[(cy, cx)]
+                           for cy in range(lo_y, hi_y + 1)
+                           for cx in range(lo_x, hi_x + 1)
+                           if (cy, cx) in self._cells]
+            candidates = [h for bucket in buckets for h in bucket]
+        for h in candidates:
+            if min_lat <= h["latitude"] <= max_lat and min_lon <= h["longitude"] <= max_lon:
+                yield h
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Returns hazards inside the box; min_lon > max_lon means the box crosses the antimeridian."""
+        if min_lon > max_lon:
+            found = list(self._scan(min_lat, min_lon, max_lat, 180.0))
+            found.extend(self._scan(min_lat, -180.0, max_lat, max_lon))
+        else:
+            found = list(self._scan(min_lat, min_lon, max_lat, max_lon))
+        return sorted(found, key=lambda h: h["id"])
+
+    def query_radius(self, lat, lon, radius_m):
+        """Returns hazards within radius_m meters of (lat, lon)."""
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlon = min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+        min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        if dlon >= 180.0:
+            box = self.query_bbox(min_lat, -180.0, max_lat, 180.0)
+        else:
+            min_lon = (lon - dlon + 180.0) % 360.0 - 180.0
+            max_lon = (lon + dlon + 180.0) % 360.0 - 180.0
+            box = self.query_bbox(min_lat, min_lon, max_lat, max_lon)
+        if not box:
+            return []
+        dist = haversine_many(lat, lon, [h["latitude"] for h in box], [h["longitude"] for h in box])
+        return [h for h, d in zip(box, dist) if d <= radius_m]
+
+
+class LayeredIndex(GridIndex):
+    """
+    GridIndex over a read-only base (snapshot.SnapshotIndex). The base holds
+    the bulk of the hazards memory-mapped; this index holds only hazards
+    inserted since, and inserting or removing an id hides its base version.
+    """
+
+    def __init__(self, base):
+        super().__init__(base.cell_deg)
+        self.base = base
+
+    def __len__(self):
+        return super().__len__() + len(self.base)
+
+    def insert(self, hazard):
+        old = super().insert(hazard)
+        base_old = self.base.hide(hazard["id"])
+        return old if old is not None else base_old
+
+    def remove(self, hazard_id):
+        old = super().remove(hazard_id)
+        base_old = self.base.hide(hazard_id)
+        return old if old is not None else base_old
+
+    def _scan(self, min_lat, min_lon, max_lat, max_lon):
+        yield from super()._scan(min_lat, min_lon, max_lat, max_lon)
+        yield from self.base.scan(min_lat, min_lon, max_lat, max_lon)
@@ -0,0 +1,192 @@
+import json
+import math
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from geo import valid_position
+
+# Aggregates exist for zooms 0..MAX_TILE_ZOOM; the map overzooms the last level
+# (at 14 a bin is ~150 m at the equator, about one cluster).
+MAX_TILE_ZOOM = 14
+TILE_GRID = 16          # each tile is split into TILE_GRID x TILE_GRID bins
+MAX_MERCATOR_LAT = 85.05112878
+
+# Binary tile: header (z, x, y, grid, cells) then one record per non-empty bin
+BIN_HEADER = struct.Struct("<BIIBI")
+BIN_CELL = struct.Struct("<HIBI")   # bin index, count, max confidence %, last seen (unix s)
+MAX_UINT32 = 2 ** 32 - 1
+
+
+def tile_fraction(lat, lon):
+    """Web Mercator position of a point as fractions (u, v) in [0, 1) of the world."""
+    lat = min(max(lat, -MAX_MERCATOR_LAT), MAX_MERCATOR_LAT)
+    u = (lon + 180.0) / 360.0 % 1.0
+    v = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+    return u, min(max(v, 0.0), 1.0 - 1e-12)
+
+
+def aggregate_bins(lats, lons, confidences, timestamps, max_zoom=MAX_TILE_ZOOM, grid=TILE_GRID):
+    """
+    Vectorized aggregation of many hazards at once (snapshot builds). Returns
+    (keys, counts, max_confidence, last_seen) sorted by bin_key(z, x, y, bin).
+    """
+    lats = np.clip(np.asarray(lats, dtype=float), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    u = (np.asarray(lons, dtype=float) + 180.0) / 360.0 % 1.0
+    v = np.clip((1.0 - np.arcsinh(np.tan(np.radians(lats))) / np.pi) / 2.0, 0.0, 1.0 - 1e-12)
+    confidences = np.nan_to_num(np.asarray(confidences, dtype=float))
+    timestamps = np.nan_to_num(np.asarray(timestamps, dtype=float))
+    parts = []
+    for z in range(max_zoom + 1):
+        scale = (1 << z) * grid
+        px, py = (u * scale).astype(np.int64), (v * scale).astype(np.int64)
+        parts.append(bin_key(z, px // grid, py // grid, (py % grid) * grid + px % grid, max_zoom, grid))
+    keys = np.concatenate(parts)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    n = len(lats)
+    conf = np.tile(confidences, max_zoom + 1)[order]
+    ts = np.tile(timestamps, max_zoom + 1)[order]
+    if not n:
+        empty = np.zeros(0)
+        return keys, empty.astype(np.int64), empty, empty
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    counts = np.diff(np.concatenate([starts, [len(keys)]]))
+    return keys[starts], counts, np.maximum.reduceat(conf, starts), np.maximum.reduceat(ts, starts)
+
+
+def bin_key(z, x, y, b, max_zoom=MAX_TILE_ZOOM, grid=TILE_GRID):
+    """Sortable int64 key of one bin; all bins of a tile are contiguous."""
+    return ((z * (1 << max_zoom) + x) * (1 << max_zoom) + y) * grid * grid + b
+
+
+class TileAggregator:
+    """
+    Per-zoom slippy-map tiles of hazard counts, max confidence and recency.
+
+    Every tile is a TILE_GRID x TILE_GRID grid of bins; add() updates the one
+    bin per zoom level that contains the hazard (O(zoom levels)), so serving a
+    tile costs the same whether the region holds ten hazards or a million.
+    Encoded tiles are cached until their bins change. remove() keeps counts
+    exact; max confidence and last seen stay upper bounds until a rebuild.
+
+    load_base() takes precomputed bins (aggregate_bins(), e.g. memory-mapped
+    from a snapshot) as a read-only base; add()/remove() then record only
+    the difference, and tiles are the merge of both.
+    """
+
+    def __init__(self, max_zoom=MAX_TILE_ZOOM, grid=TILE_GRID):
+        self.max_zoom = max_zoom
+        self.grid = grid
+        self._tiles = {}    # (z, x, y) -> {bin index: [count, max confidence, last seen]}
+        self._encoded = {}  # (z, x, y, format) -> (body, etag)
+        self._base = None   # (keys, counts, max_confidence, last_seen), sorted by key
+        self._base_tiles = 0
+        self._lock = threading.Lock()
+
+    def load_base(self, keys, counts, max_confidence, last_seen, tile_count=0):
+        """Uses precomputed bins as the base layer (arrays may be memory-mapped)."""
+        with self._lock:
+            self._base = (keys, counts, max_confidence, last_seen)
+            self._base_tiles = tile_count
+            self._encoded.clear()
+
+    def _bins(self, hazard):
+        """Yields ((z, x, y), bin index) of the hazard at every zoom level."""
+        u, v = tile_fraction(hazard["latitude"], hazard["longitude"])
+        for z in range(self.max_zoom + 1):
+            scale = (1 << z) * self.grid
+            px, py = int(u * scale), int(v * scale)
+            yield (z, px // self.grid, py // self.grid), (py % self.grid) * self.grid + px % self.grid
+
+    def add(self, hazard):
+        if not valid_position(hazard.get("latitude"), hazard.get("longitude")):
+            return
+        confidence = hazard.get("confidence") or 0.0
+        timestamp = hazard.get("timestamp") or 0.0
+        with self._lock:
+            for key, b in self._bins(hazard):
+                cell = self._tiles.setdefault(key, {}).get(b)
+                if cell is None:
+                    self._tiles[key][b] = [1, confidence, timestamp]
+                else:
+                    cell[0] += 1
+                    cell[1] = max(cell[1], confidence)
+                    cell[2] = max(cell[2], timestamp)
+                self._invalidate(key)
+
+    def remove(self, hazard):
+        if not valid_position(hazard.get("latitude"), hazard.get("longitude")):
+            return
+        with self._lock:
+            for key, b in self._bins(hazard):
+                cells = self._tiles.setdefault(key, {})
+                # Without a base layer the count can never go below zero;
+                # with one, a negative delta cancels a base count.
+                cell = cells.setdefault(b, [0, 0.0, 0.0])
+                cell[0] -= 1
+                if cell[0] == 0 or (cell[0] < 0 and self._base is None):
+                    del cells[b]
+                    if not cells:
+                        del self._tiles[key]
+                self._invalidate(key)
+
+    def _invalidate(self, key):
+        self._encoded.pop(key + ("json",), None)
+        self._encoded.pop(key + ("bin",), None)
+
+    def tile(self, z, x, y):
+        """Returns {"z", "x", "y", "grid", "count", "cells": [[bin, count, max_conf, last_seen], ...]}."""
+        with self._lock:
+            return self._tile(z, x, y)
+
+    def _tile(self, z, x, y):
+        merged = {}
+        if self._base is not None:
+            keys, counts, max_conf, last_seen = self._base
+            first = bin_key(z, x, y, 0, self.max_zoom, self.grid)
+            lo = int(np.searchsorted(keys, first))
+            hi = int(np.searchsorted(keys, first + self.grid * self.grid))
+            for i in range(lo, hi):
+                merged[int(keys[i] - first)] = [int(counts[i]), float(max_conf[i]), float(last_seen[i])]
+        for b, (count, conf, seen) in self._tiles.get((z, x, y), {}).items():
+            cell = merged.setdefault(b, [0, 0.0, 0.0])
+            cell[0] += count
+            cell[1] = max(cell[1], conf)
+            cell[2] = max(cell[2], seen)
+        cells = sorted((b, c) for b, c in merged.items() if c[0] > 0)
+        return {
+            "z": z, "x": x, "y": y, "grid": self.grid,
+            "count": sum(c[0] for _, c in cells),
+            "cells": [[b, c[0], round(c[1], 3), int(c[2])] for b, c in cells],
+        }
+
+    def encoded(self, z, x, y, fmt="json"):
+        """Returns (body bytes, etag) of one tile as compact JSON or binary, cached until it changes."""
+        key = (z, x, y, fmt)
+        with self._lock:
+            cached = self._encoded.get(key)
+            if cached is not None:
+                return cached
+            tile = self._tile(z, x, y)
+            if fmt == "bin":
+                body = BIN_HEADER.pack(z, x, y, tile["grid"], len(tile["cells"])) + b"".join(
+                    # Clamped to the field ranges: stored rows may predate ingest validation
+                    BIN_CELL.pack(b, min(count, MAX_UINT32), min(max(int(round(conf * 100)), 0), 100),
+                                  min(max(last_seen, 0), MAX_UINT32))
+                    for b, count, conf, last_seen in tile["cells"]
+                )
+            else:
+                body = json.dumps(tile, separators=(",", ":")).encode()
+            # Content-derived, so every worker process hands out the same ETag for the same tile
+            result = (body, f"{fmt}-{zlib.crc32(body):08x}")
+            if tile["cells"]:  # empty tiles are cheap to build and would fill the cache
+                self._encoded[key] = result
+            return result
+
+    def __len__(self):
+        """Non-empty tiles (with a base layer: base tiles plus tiles changed since)."""
+        with self._lock:
+            return self._base_tiles + len(self._tiles)
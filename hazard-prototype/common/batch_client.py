@@ -0,0 +1,114 @@
+"""
+Client-side batching for the bulk /report_hazards endpoint.
+
+BatchSender journals every hazard payload in an on-device Outbox first and
+POSTs it from there as one gzip-compressed JSON array when batch_size payloads
+are pending or the oldest has waited max_wait seconds. While the backend is
+unreachable the payloads stay on disk; after reconnecting the backlog is
+replayed in paced batches. Every payload carries a report_id, so the backend
+ignores a batch it already stored. Records the backend rejects as invalid
+(400 / 422) are dropped one by one and the rest of their batch is delivered;
+any other status (auth, a wrong URL, an older backend, 408/429, 5xx) keeps
+the batch journaled and is retried with backoff. All requests go through one pooled
+requests.Session (keep-alive), and stats expose reports/s alongside requests/s
+so ingest throughput can be measured.
+"""
+import gzip
+import json
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from outbox import OutboxReplayer, RejectedBatch, new_report_id
+
+# The only statuses that say the data itself is invalid. Anything else (401,
+# 403, 404, 413, 429, 5xx, ...) is about the backend or this client, so the
+# batch stays journaled and is retried with backoff.
+REJECTED_STATUS = (400, 422)
+
+
+class BatchSender:
+    """Outbox-backed, size/time-windowed batching of hazard payloads over one pooled HTTP session."""
+
+    def __init__(self, url, outbox, batch_size=20, max_wait=1.0, max_rate=200.0, backoff=0.5,
+                 max_backoff=60.0, pool_size=4, timeout=10, compress=True):
+        self.url = url
+        self.outbox = outbox
+        self.timeout = timeout
+        self.compress = compress
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.stats = {"reports": 0, "requests": 0, "failed_requests": 0, "rejected_reports": 0, "bytes_sent": 0}
+        self._started = time.time()
+        self.replayer = OutboxReplayer(outbox, self._post, batch_size=batch_size, max_wait=max_wait,
+                                       max_rate=max_rate, backoff=backoff, max_backoff=max_backoff,
+                                       name="batch-sender")
+
+    def add(self, payload):
+        """Journals one payload (assigning its report_id); never blocks on the network."""
+        payload.setdefault("report_id", new_report_id())
+        self.outbox.put([payload])
+        self.replayer.wake()
+
+    def _post(self, batch):
+        body = json.dumps(batch).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            with metrics.timed("pipeline_stage_seconds", stage="batch_post"):
+                resp = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._failed(batch)
+            raise ConnectionError(f"Could not connect to backend: {e}") from e
+        self.stats["requests"] += 1
+        self.stats["bytes_sent"] += len(body)
+        try:
+            reply = resp.json()
+        except ValueError:
+            reply = {}
+        # 201, or a 400 / 422 that lists every record: the backend judged each record on its own
+        if resp.status_code == 201 or (resp.status_code in REJECTED_STATUS and "rejected" in reply):
+            rejected = reply.get("rejected", [])
+            for r in rejected:
+                print(f" [REJECTED] Report {batch[r['index']].get('report_id')}: {r['error']}")
+            sent = len(batch) - len(rejected)
+            self.stats["reports"] += sent
+            self.stats["rejected_reports"] += len(rejected)
+            metrics.counter("batch_reports_total", "Reports POSTed in batches", outcome="sent").inc(sent)
+            metrics.counter("batch_reports_total", "Reports POSTed in batches", outcome="rejected").inc(len(rejected))
+            duplicates = reply.get("duplicates", 0)
+            print(f" [REPORTED] Sent batch of {sent} hazards"
+                  + (f" ({duplicates} already stored)" if duplicates else ""))
+            return [r["index"] for r in rejected]
+        self._failed(batch)
+        if resp.status_code not in REJECTED_STATUS:
+            raise ConnectionError(f"Backend returned {resp.status_code}")
+        # The batch was refused as a whole; the replayer splits it to find the bad records
+        if len(batch) == 1:
+            self.stats["rejected_reports"] += 1
+        raise RejectedBatch(f"Backend returned {resp.status_code}")
+
+    def _failed(self, batch):
+        self.stats["failed_requests"] += 1
+        metrics.counter("batch_reports_total", "Reports POSTed in batches", outcome="failed").inc(len(batch))
+
+    def pending(self):
+        return self.outbox.count()
+
+    def throughput(self):
+        """Returns (reports/s, requests/s) since the sender started."""
+        elapsed = max(time.time() - self._started, 1e-9)
+        return self.stats["reports"] / elapsed, self.stats["requests"] / elapsed
+
+    def close(self, timeout=None):
+        """Sends what is pending (within timeout) and stops; the rest stays in the outbox for next start."""
+        self.replayer.close(timeout)
+        self.session.close()
@@ -0,0 +1,96 @@
+"""
+Detection-to-report steps shared by the detector (detection/detect_potholes.py)
+and the service (runs/pothole-detector/service.py).
+
+Both loops filter the model's boxes by confidence, geotag a frame at its
+capture time, distance-gate a report and hand it to the reporter workers,
+report finished tracks, and render the event image on the worker. Only the
+job they build differs (a backend payload vs. a report-sink record), so each
+entry point passes its own make_job(result, frame, lat, lon, confidence,
+timestamp); everything else lives here once.
+"""
+import numpy as np
+
+import metrics
+from event_images import prepare_event_image
+
+
+def detections(result, threshold):
+    """Boxes ((N, 4) x1, y1, x2, y2) and confidences of the detections above threshold."""
+    boxes, confs = [], []
+    for box in result.boxes:
+        conf = float(box.conf)
+        if conf > threshold:
+            # Filter for class if needed, for now assume all detections are relevant
+            boxes.append([float(v) for v in box.xyxy[0]])
+            confs.append(conf)
+    return np.array(boxes, dtype=float).reshape(-1, 4), np.array(confs, dtype=float)
+
+
+def max_confidence(result, threshold):
+    """Returns (detected, max_conf) over the boxes above threshold."""
+    _, confs = detections(result, threshold)
+    return bool(len(confs)), float(confs.max()) if len(confs) else 0.0
+
+
+def skip(reason, message, label=""):
+    """Counts and logs a detection that is not reported."""
+    metrics.counter("reports_skipped_total", "Detections not reported", reason=reason).inc()
+    print(f" [SKIP]{label} {message}")
+
+
+def locate(location, timestamp, label=""):
+    """Position of the vehicle at a frame's timestamp, or None (counted and logged) without a fix."""
+    position = location.position(timestamp)
+    if position is None:
+        skip("no_fix", "Hazard detected but there is no GPS fix for this frame", label)
+    return position
+
+
+def track_context(result, frame, lat, lon, timestamp):
+    """What a track keeps of its best frame: enough to report it after the track ends."""
+    return {"result": result, "frame": frame, "latitude": lat, "longitude": lon, "timestamp": timestamp}
+
+
+def queue_report(reporter, gate, job, lat, lon, label=""):
+    """Distance-gates a report job at lat/lon and hands it to the reporter workers. Returns True if queued."""
+    should_report, dist = gate.should_report(lat, lon)
+    if not should_report:
+        skip("distance", f"Hazard detected but too close to a previous tag "
+                         f"({dist:.1f}m < {gate.min_distance_m}m)", label)
+        return False
+    if reporter.submit(job):
+        # Gate on what we queued, not on what the sink has confirmed,
+        # so a slow sink does not let duplicates through meanwhile.
+        gate.add(lat, lon)
+        return True
+    skip("queue_full", "Report queue full, dropping this detection", label)
+    return False
+
+
+def report_track(reporter, gate, track, make_job, label=""):
+    """Reports a finished track: its best frame and position, with the track's mean confidence."""
+    ctx = track["context"]
+    if ctx is None:
+        # Seen only in frames without a GPS fix
+        skip("no_fix", "Pothole track ended without a GPS fix for any of its frames", label)
+        return False
+    job = make_job(ctx["result"], ctx["frame"], ctx["latitude"], ctx["longitude"], track["confidence"],
+                   ctx["timestamp"])
+    return queue_report(reporter, gate, job, ctx["latitude"], ctx["longitude"], label)
+
+
+def store_event_image(job, image_store, max_width=None, crop=False):
+    """
+    Worker-side half of a report: renders the job's result (or raw frame)
+    into an event image and saves it. Pops both from the job; returns the
+    image_store reference, or None if the job had nothing to draw.
+    """
+    result = job.pop("result", None)
+    frame = job.pop("frame", None)
+    if result is None and frame is None:
+        return None
+    with metrics.timed("pipeline_stage_seconds", stage="encode"):
+        image = prepare_event_image(result=result, image=frame, max_width=max_width, crop=crop)
+    with metrics.timed("pipeline_stage_seconds", stage="write"):
+        return image_store.put(image)
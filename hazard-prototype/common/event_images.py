@@ -0,0 +1,90 @@
+"""
+Event image rendering and encoding, done on the reporter workers.
+
+In the lean pipeline the detection loop never draws or encodes: it hands the
+raw YOLO result to the reporter, and the worker calls render_event_image()
+to annotate (result.plot()), optionally crop around the detected boxes,
+downscale and encode to JPEG or WebP at the configured quality.
+"""
+import os
+import threading
+
+import cv2
+
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def extension(fmt):
+    """File extension (with dot) for an event image format."""
+    return FORMATS[fmt][0]
+
+
+def result_boxes(result):
+    """Returns the result's boxes as [[x1, y1, x2, y2], ...] in pixels."""
+    return [[float(v) for v in box.xyxy[0]] for box in result.boxes]
+
+
+def crop_to_boxes(image, boxes, margin=0.25):
+    """Crops image to the union of boxes, padded by margin (fraction of the union size)."""
+    if not boxes:
+        return image
+    h, w = image.shape[:2]
+    x1 = min(b[0] for b in boxes)
+    y1 = min(b[1] for b in boxes)
+    x2 = max(b[2] for b in boxes)
+    y2 = max(b[3] for b in boxes)
+    pad_x = (x2 - x1) * margin
+    pad_y = (y2 - y1) * margin
+    x1, y1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+    x2, y2 = min(w, int(x2 + pad_x) + 1), min(h, int(y2 + pad_y) + 1)
+    if x2 <= x1 or y2 <= y1:
+        return image
+    return image[y1:y2, x1:x2]
+
+
+def downscale(image, max_width):
+    """Shrinks image to max_width pixels wide (never upscales)."""
+    h, w = image.shape[:2]
+    if not max_width or w <= max_width:
+        return image
+    new_h = max(1, round(h * max_width / w))
+    return cv2.resize(image, (max_width, new_h), interpolation=cv2.INTER_AREA)
+
+
+def encode_image(image, fmt="jpg", quality=85):
+    """Encodes a BGR image to JPEG/WebP bytes."""
+    ext, quality_flag = FORMATS[fmt]
+    ok, buf = cv2.imencode(ext, image, [quality_flag, int(quality)])
+    if not ok:
+        raise RuntimeError(f"Could not encode event image as {fmt}")
+    return buf.tobytes()
+
+
+def prepare_event_image(result=None, image=None, max_width=None, crop=False):
+    """
+    Builds the event image (not yet encoded). Pass the YOLO result (annotation
+    happens here, off the hot loop) and/or an already annotated image to reuse.
+    """
+    if image is None:
+        image = result.plot()
+    if crop and result is not None:
+        image = crop_to_boxes(image, result_boxes(result))
+    return downscale(image, max_width)
+
+
+def render_event_image(result=None, image=None, fmt="jpg", quality=85, max_width=None, crop=False):
+    """prepare_event_image() encoded to JPEG/WebP bytes."""
+    return encode_image(prepare_event_image(result, image, max_width, crop), fmt=fmt, quality=quality)
+
+
+def write_bytes_atomic(path, data):
+    """Writes data to path via a temp file + rename, so readers never see half an image."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Unique per writer, so two workers storing the same content-addressed name cannot interleave
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
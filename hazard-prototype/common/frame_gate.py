@@ -0,0 +1,82 @@
+"""
+Cheap pre-filter in front of YOLO inference.
+
+FrameGate keeps a tiny grayscale thumbnail of the last few inferred frames.
+A new frame whose thumbnail barely differs from one of them reuses that
+frame's result instead of running the model (a parked car, or the same cached
+image in the service simulation). When GPS speed is known, frames are also
+strided by distance travelled: a slow vehicle only needs a fresh inference
+every min_travel_m meters. max_skip bounds how long a result can be reused.
+"""
+import cv2
+import numpy as np
+
+THUMB_SIZE = (64, 36)  # (width, height) of the comparison thumbnail
+
+
+class FrameGate:
+    def __init__(self, diff_threshold=3.0, max_skip=15, cache_size=4, min_travel_m=None):
+        self.diff_threshold = diff_threshold
+        self.max_skip = max_skip
+        self.cache_size = cache_size
+        self.min_travel_m = min_travel_m
+        self._cache = []          # [(thumb, result)], most recent last
+        self._last_result = None
+        self._since_inference = 0
+        self._travel_m = 0.0
+        self._thumb = None
+        self.counters = {"frames": 0, "inferred": 0, "skipped_unchanged": 0, "skipped_stride": 0}
+
+    @staticmethod
+    def _thumbnail(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def lookup(self, frame, speed_mps=None, dt=None):
+        """
+        Returns a reusable result for this frame, or None if the model must run
+        (then call store() with the new result). speed_mps/dt enable the
+        distance-travelled stride.
+        """
+        self.counters["frames"] += 1
+        self._thumb = None
+        if speed_mps is not None and dt is not None:
+            self._travel_m += speed_mps * dt
+
+        if self._last_result is None or self._since_inference >= self.max_skip:
+            return None
+
+        if self.min_travel_m is not None and speed_mps is not None and self._travel_m < self.min_travel_m:
+            self._since_inference += 1
+            self.counters["skipped_stride"] += 1
+            return self._last_result
+
+        self._thumb = self._thumbnail(frame)
+        for thumb, result in reversed(self._cache):
+            if float(np.mean(np.abs(self._thumb - thumb))) < self.diff_threshold:
+                self._since_inference += 1
+                self.counters["skipped_unchanged"] += 1
+                return result
+        return None
+
+    def store(self, frame, result):
+        """Records the result of a real inference on frame."""
+        thumb = self._thumb if self._thumb is not None else self._thumbnail(frame)
+        self._cache.append((thumb, result))
+        del self._cache[:-self.cache_size]
+        self._last_result = result
+        self._since_inference = 0
+        self._travel_m = 0.0
+        self._thumb = None
+        self.counters["inferred"] += 1
+
+    def saved_fraction(self):
+        """Fraction of frames that did not need a model call."""
+        frames = self.counters["frames"]
+        return 1.0 - self.counters["inferred"] / frames if frames else 0.0
+
+    def summary(self):
+        c = self.counters
+        return (f"{c['frames']} frames | {c['inferred']} inferred | "
+                f"{c['skipped_unchanged']} unchanged | {c['skipped_stride']} strided | "
+                f"{self.saved_fraction() * 100:.0f}% compute saved")
@@ -0,0 +1,134 @@
+"""
+Shared geo helpers for the detectors and the backend.
+
+valid_position() for reported coordinates, scalar haversine for one pair of
+points, NumPy-vectorized one-to-many and many-to-many distance functions, and
+ReportGate, which decides whether a new detection is far enough from
+everything already reported.
+"""
+import math
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEG_LAT = 111320.0
+
+
+def valid_position(lat, lon):
+    """True if lat/lon are finite numbers within -90..90 and -180..180."""
+    for value, limit in ((lat, 90.0), (lon, 180.0)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        if not -limit <= value <= limit:  # also False for NaN
+            return False
+    return True
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculates distance in meters between two lat/lon points."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2.0)**2 + \
+        math.cos(phi1) * math.cos(phi2) * \
+        math.sin(delta_lambda / 2.0)**2
+
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Distances in meters from one point to every point in lats/lons (arrays)."""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    phi1 = math.radians(lat)
+    a = np.sin((lats - phi1) / 2.0)**2 + \
+        math.cos(phi1) * np.cos(lats) * np.sin((lons - math.radians(lon)) / 2.0)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def equirectangular_many(lat, lon, lats, lons):
+    """
+    Flat-earth approximation of haversine_many. Within a few km it is accurate
+    to well under a meter and costs one cos() for the whole batch.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    dlon = (lons - lon + 180.0) % 360.0 - 180.0
+    x = np.radians(dlon) * math.cos(math.radians(lat))
+    y = np.radians(lats - lat)
+    return EARTH_RADIUS_M * np.hypot(x, y)
+
+
+def radius_join(lats_a, lons_a, lats_b, lons_b, radius_m):
+    """
+    Many-to-many radius join. Returns (idx_a, idx_b, dist_m) arrays for every
+    pair of points closer than radius_m. Points in b are sorted by latitude so
+    each point in a only measures the latitude band it can actually reach.
+    """
+    lats_a = np.asarray(lats_a, dtype=np.float64)
+    lons_a = np.asarray(lons_a, dtype=np.float64)
+    lats_b = np.asarray(lats_b, dtype=np.float64)
+    lons_b = np.asarray(lons_b, dtype=np.float64)
+
+    order = np.argsort(lats_b, kind="stable")
+    sorted_lats = lats_b[order]
+    band = radius_m / METERS_PER_DEG_LAT
+    starts = np.searchsorted(sorted_lats, lats_a - band, side="left")
+    ends = np.searchsorted(sorted_lats, lats_a + band, side="right")
+
+    out_a, out_b, out_d = [], [], []
+    for i in np.nonzero(ends > starts)[0]:
+        candidates = order[starts[i]:ends[i]]
+        dist = haversine_many(lats_a[i], lons_a[i], lats_b[candidates], lons_b[candidates])
+        hit = dist <= radius_m
+        if hit.any():
+            out_a.append(np.full(int(hit.sum()), i, dtype=np.int64))
+            out_b.append(candidates[hit])
+            out_d.append(dist[hit])
+
+    if not out_a:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), np.empty(0, dtype=np.float64)
+    return np.concatenate(out_a), np.concatenate(out_b), np.concatenate(out_d)
+
+
+class ReportGate:
+    """
+    Remembers every reported location and answers "is this new detection at
+    least min_distance_m from all of them?" with one vectorized pass.
+    """
+
+    def __init__(self, min_distance_m, capacity=1024):
+        self.min_distance_m = min_distance_m
+        self._lats = np.empty(capacity, dtype=np.float64)
+        self._lons = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, lat, lon):
+        if self._size == len(self._lats):
+            self._lats = np.resize(self._lats, 2 * len(self._lats))
+            self._lons = np.resize(self._lons, 2 * len(self._lons))
+        self._lats[self._size] = lat
+        self._lons[self._size] = lon
+        self._size += 1
+
+    def nearest_distance(self, lat, lon):
+        """Distance in meters to the closest reported point, or inf if none is within the gate radius."""
+        if self._size == 0:
+            return math.inf
+        lats = self._lats[:self._size]
+        lons = self._lons[:self._size]
+        # Cheap latitude band first; only points that could be in range get haversine.
+        near = np.abs(lats - lat) <= self.min_distance_m / METERS_PER_DEG_LAT
+        if not near.any():
+            return math.inf
+        return float(haversine_many(lat, lon, lats[near], lons[near]).min())
+
+    def should_report(self, lat, lon):
+        """Returns (ok, nearest_distance_m)."""
+        dist = self.nearest_distance(lat, lon)
+        return dist >= self.min_distance_m, dist
@@ -0,0 +1,104 @@
+"""
+Content-addressed store for event images.
+
+An event image is stored under the hash of its encoded bytes, e.g.
+events/3f/3fa9...c2.jpg, next to downscaled variants (3fa9...c2_thumb.jpg,
+3fa9...c2_medium.jpg) written at the same time. Identical images (the
+simulation re-reporting the same cached frame) are stored once, names never
+collide, and since a name's content never changes it can be cached forever.
+Hazard documents only keep the name (or URL) and hash, never the pixels.
+"""
+import os
+import re
+import hashlib
+
+import cv2
+import numpy as np
+
+from event_images import FORMATS, downscale, encode_image, extension, write_bytes_atomic
+
+HASH_CHARS = 32  # hex chars of SHA-256 kept in names (128 bits)
+
+# Variant name -> max width in pixels, written alongside every stored image.
+VARIANTS = {"thumb": 240, "medium": 960}
+
+# Cache-Control for content-addressed names: one year, never revalidated.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_NAME_RE = re.compile(r"^([0-9a-f]{2})/(\1[0-9a-f]{%d})(?:_([a-z]+))?\.[a-z]+$" % (HASH_CHARS - 2))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+
+
+def image_name(key, fmt="jpg", variant=None):
+    """Relative name of an image or one of its variants: '3f/3fa9...c2_thumb.jpg'."""
+    suffix = f"_{variant}" if variant else ""
+    return f"{key[:2]}/{key}{suffix}{extension(fmt)}"
+
+
+def is_content_addressed(name):
+    """True for names produced by image_name() (safe to cache forever)."""
+    return _NAME_RE.match(name.replace(os.sep, "/")) is not None
+
+
+class LocalImageStore:
+    """Content-addressed images in a local directory (the backend serves it at /events/)."""
+
+    def __init__(self, root, fmt="jpg", quality=85, variants=VARIANTS):
+        self.root = root
+        self.fmt = fmt
+        self.quality = quality
+        self.variants = variants
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def put(self, image):
+        """
+        Encodes and stores a BGR image with its variants, unless an identical one
+        is already stored. Returns a reference:
+        {"hash", "name", "variants": {variant: name}, "bytes", "deduplicated"}.
+        """
+        return self._put(encode_image(image, fmt=self.fmt, quality=self.quality), image, self.fmt)
+
+    def put_file(self, path):
+        """
+        Moves an encoded image file written outside the store (e.g. by an older
+        version) into it, keeping its bytes if its format is one of FORMATS.
+        Returns a reference like put(). Raises ValueError if it is not an image.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"{path} is not an image")
+        fmt = {".jpeg": "jpg"}.get(os.path.splitext(path)[1].lower(), os.path.splitext(path)[1].lower()[1:])
+        ref = self._put(data, image, fmt) if fmt in FORMATS else self.put(image)
+        os.remove(path)
+        return ref
+
+    def _put(self, data, image, fmt):
+        key = content_hash(data)
+        ref = {
+            "hash": key,
+            "name": image_name(key, fmt),
+            "variants": {v: image_name(key, fmt, v) for v in self.variants},
+            "bytes": len(data),
+            "deduplicated": False,
+        }
+        if os.path.exists(self.path(ref["name"])):
+            ref["deduplicated"] = True
+            return ref
+        # Variants first: once the full image exists, all of its variants do too
+        for variant, max_width in self.variants.items():
+            small = encode_image(downscale(image, max_width), fmt=fmt, quality=self.quality)
+            write_bytes_atomic(self.path(ref["variants"][variant]), small)
+        write_bytes_atomic(self.path(ref["name"]), data)
+        return ref
+
+    def files(self, ref):
+        """(name, local path) of every file belonging to a reference, full image last."""
+        names = list(ref["variants"].values()) + [ref["name"]]
+        return [(name, self.path(name)) for name in names]
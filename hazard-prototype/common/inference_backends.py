@@ -0,0 +1,115 @@
+"""
+Pluggable inference backends for the detectors, export_model.py and the
+backend benchmark.
+
+A backend is a (format, precision) pair, e.g. ("onnx", "fp32") or
+("tflite", "int8"). export_backend() converts .pt weights into that format,
+and load_backend() loads the exported file through its CPU runtime
+(ONNX Runtime, the TFLite interpreter, OpenVINO) behind the usual YOLO
+call interface, so detection loops do not care which one they got.
+
+Ultralytics (and with it PyTorch, seconds of import time) is imported on
+the first load, not when this module is: processes that never run a model
+(the service's web server, model_server.py clients) do not pay for it.
+warm_up() runs a few inferences right after loading, so the first real
+frames do not pay for lazy initialization inside the runtime either.
+"""
+import os
+import time
+
+import numpy as np
+
+WARMUP_SHAPE = (480, 640, 3)  # a webcam frame
+WARMUP_RUNS = 2
+
+# Supported precisions per backend. Ultralytics only quantizes TFLite and
+# OpenVINO exports; its fp16 ONNX export needs a GPU, so ONNX stays fp32 here.
+BACKENDS = {
+    "pytorch": ("fp32",),
+    "onnx": ("fp32",),
+    "tflite": ("fp32", "fp16", "int8"),
+    "openvino": ("fp32", "fp16", "int8"),
+}
+
+
+def check_backend(backend, precision="fp32"):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    if precision not in BACKENDS[backend]:
+        raise ValueError(f"{backend} does not support {precision} (supported: {', '.join(BACKENDS[backend])})")
+
+
+def backend_of(model_path):
+    """Guesses the backend from an exported model path."""
+    path = model_path.rstrip("/\\")
+    if path.endswith(".onnx"):
+        return "onnx"
+    if path.endswith(".tflite"):
+        return "tflite"
+    if path.endswith("_openvino_model"):
+        return "openvino"
+    return "pytorch"
+
+
+def export_backend(weights, backend, precision="fp32", imgsz=640):
+    """Exports .pt weights to the given backend/precision and returns the exported path."""
+    check_backend(backend, precision)
+    if backend == "pytorch":
+        return weights
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    path = model.export(
+        format=backend,
+        imgsz=imgsz,
+        half=precision == "fp16",
+        int8=precision == "int8",
+        device="cpu",
+    )
+    return str(path)
+
+
+def load_backend(model_path):
+    """Loads a .pt or exported model; Ultralytics dispatches to the matching CPU runtime."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found: {model_path}")
+    from ultralytics import YOLO
+    return YOLO(model_path, task="detect")
+
+
+def load_first_available(candidates):
+    """
+    Loads the first candidate path that exists and loads cleanly.
+    Returns (model, path). Names that do not exist locally are still tried last,
+    since Ultralytics downloads its stock weights (e.g. yolov8n.pt) on demand.
+    """
+    existing = [c for c in candidates if os.path.exists(c)]
+    missing = [c for c in candidates if not os.path.exists(c)]
+    errors = []
+    for path in existing + missing:
+        try:
+            if path in existing:
+                model = load_backend(path)
+            else:
+                from ultralytics import YOLO
+                model = YOLO(path)
+            print(f"Loaded {path} ({backend_of(path)} backend)")
+            return model, path
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+            print(f"Computed error loading model {path}: {e}")
+    raise RuntimeError("No model could be loaded:\n" + "\n".join(errors))
+
+
+def warm_up(model, shape=WARMUP_SHAPE, runs=WARMUP_RUNS):
+    """
+    Runs the model on `runs` blank frames of shape (graph build, runtime
+    allocations, fused layers) and returns their latencies in ms; the first
+    is what the first real frame would have cost.
+    """
+    frame = np.zeros(shape, dtype=np.uint8)
+    latencies = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        model(frame, verbose=False)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
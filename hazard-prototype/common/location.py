@@ -0,0 +1,365 @@
+"""
+Where the vehicle was when a frame was captured.
+
+Detections used to get a random-walk coordinate taken when the report was
+sent. A location provider instead answers position(t) for the frame's own
+timestamp:
+
+- TrackReader reads fixes from NMEA sentences (RMC / GGA, e.g. a GPS
+  receiver's serial device or a logged .nmea file), a GPX track or a CSV
+  log (timestamp, latitude, longitude[, speed]) on a background thread into
+  a FixBuffer. follow=True keeps reading a growing file or a device.
+- FixBuffer is a ring buffer of time-ordered fixes; position(t) finds the
+  surrounding pair by binary search (O(log n)) and interpolates linearly,
+  so a 30 FPS camera gets a distinct position per frame from a 1-10 Hz GPS.
+- SimulatedGPS is the old random walk, for demos without a receiver.
+
+Fixes more than max_gap seconds apart are not interpolated across (a tunnel
+or a pause in the log); past the newest fix its position is held for
+max_age seconds, after which position() returns None. Times are Unix
+seconds; time_offset is added to every fix (e.g. to line a log up with a
+video's frame timestamps).
+"""
+import os
+import io
+import csv
+import random
+import datetime
+import threading
+import xml.etree.ElementTree as ET
+
+from geo import haversine_distance
+
+KNOTS_TO_MPS = 0.514444
+DEFAULT_CAPACITY = 36000   # one hour at 10 Hz
+DEFAULT_MAX_GAP = 5.0      # seconds between fixes still interpolated across
+DEFAULT_MAX_AGE = 2.0      # seconds the newest fix is held for later frames
+FOLLOW_POLL = 0.2          # seconds between reads of a followed file at its end
+
+
+class FixBuffer:
+    """
+    Fixed-capacity ring buffer of (t, lat, lon, speed_mps or None), in time
+    order; the oldest fix is overwritten when full. Thread-safe.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_gap=DEFAULT_MAX_GAP, max_age=DEFAULT_MAX_AGE):
+        self.capacity = capacity
+        self.max_gap = max_gap
+        self.max_age = max_age
+        self._fixes = [None] * capacity
+        self._start = 0   # slot of the oldest fix
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _get(self, i):
+        return self._fixes[(self._start + i) % self.capacity]
+
+    def add(self, t, lat, lon, speed_mps=None):
+        """Appends a fix; one not newer than the last is dropped. Returns True if kept."""
+        with self._lock:
+            if self._count and t <= self._get(self._count - 1)[0]:
+                return False
+            fix = (t, lat, lon, speed_mps)
+            if self._count < self.capacity:
+                self._fixes[(self._start + self._count) % self.capacity] = fix
+                self._count += 1
+            else:
+                self._fixes[self._start] = fix
+                self._start = (self._start + 1) % self.capacity
+            return True
+
+    def span(self):
+        """(first, last) fix time, or None when empty."""
+        with self._lock:
+            if not self._count:
+                return None
+            return self._get(0)[0], self._get(self._count - 1)[0]
+
+    def _bracket(self, t):
+        """(before, after) fixes around t (after is None past the end, before None ahead of the start)."""
+        lo, hi = 0, self._count
+        while lo < hi:  # first fix with time > t
+            mid = (lo + hi) // 2
+            if self._get(mid)[0] <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+        before = self._get(lo - 1) if lo > 0 else None
+        after = self._get(lo) if lo < self._count else None
+        return before, after
+
+    def fix_at(self, t):
+        """Interpolated (t, lat, lon, speed_mps) at time t, or None without a usable fix."""
+        with self._lock:
+            before, after = self._bracket(t)
+        if before is None:
+            return None
+        if after is None:
+            return before if t - before[0] <= self.max_age else None
+        if before[0] == t:
+            return before
+        dt = after[0] - before[0]
+        if dt > self.max_gap:
+            return None
+        w = (t - before[0]) / dt
+        lat = before[1] + (after[1] - before[1]) * w
+        lon = before[2] + (after[2] - before[2]) * w
+        if abs(after[2] - before[2]) > 180.0:
+            # Across the antimeridian: the short way round
+            dlon = (after[2] - before[2] + 180.0) % 360.0 - 180.0
+            lon = (before[2] + dlon * w + 180.0) % 360.0 - 180.0
+        if before[3] is not None and after[3] is not None:
+            speed = before[3] + (after[3] - before[3]) * w
+        else:
+            speed = haversine_distance(before[1], before[2], after[1], after[2]) / dt
+        return t, lat, lon, speed
+
+    def position(self, t):
+        fix = self.fix_at(t)
+        return None if fix is None else (fix[1], fix[2])
+
+    def speed(self, t):
+        fix = self.fix_at(t)
+        return None if fix is None else fix[3]
+
+
+# --- Parsers: each yields (t, lat, lon, speed_mps or None) ---
+
+def _nmea_checksum_ok(sentence):
+    if "*" not in sentence:
+        return True  # checksum is optional
+    body, checksum = sentence[1:].split("*", 1)
+    value = 0
+    for ch in body:
+        value ^= ord(ch)
+    try:
+        return value == int(checksum[:2], 16)
+    except ValueError:
+        return False
+
+
+def _nmea_degrees(value, hemisphere):
+    """ddmm.mmmm / dddmm.mmmm + N/S/E/W -> signed decimal degrees."""
+    dot = value.index(".") if "." in value else len(value)
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60.0
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def _nmea_time(date, hhmmss):
+    """Unix time of an NMEA UTC time-of-day on a date."""
+    h, m, s = int(hhmmss[0:2]), int(hhmmss[2:4]), float(hhmmss[4:])
+    day = datetime.datetime.combine(date, datetime.time(h, m), tzinfo=datetime.timezone.utc)
+    return day.timestamp() + s
+
+
+def parse_nmea(lines):
+    """
+    Fixes from RMC (time, date, position, speed) and GGA (time, position)
+    sentences of any talker (GP, GN, GL, ...). GGA has no date: it takes the
+    last RMC's, or today's (UTC) before the first RMC. Invalid fixes and
+    sentences with a wrong checksum are skipped.
+    """
+    date = None
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("$") or not _nmea_checksum_ok(line):
+            continue
+        fields = line.split("*", 1)[0].split(",")
+        kind = fields[0][3:]
+        try:
+            if kind == "RMC" and len(fields) >= 10:
+                if fields[9]:
+                    d = fields[9]
+                    date = datetime.date(2000 + int(d[4:6]), int(d[2:4]), int(d[0:2]))
+                if fields[2] != "A" or not fields[3] or not fields[1] or date is None:
+                    continue
+                speed = float(fields[7]) * KNOTS_TO_MPS if fields[7] else None
+                yield (_nmea_time(date, fields[1]), _nmea_degrees(fields[3], fields[4]),
+                       _nmea_degrees(fields[5], fields[6]), speed)
+            elif kind == "GGA" and len(fields) >= 7:
+                if fields[6] in ("", "0") or not fields[2] or not fields[1]:
+                    continue
+                day = date or datetime.datetime.now(datetime.timezone.utc).date()
+                yield (_nmea_time(day, fields[1]), _nmea_degrees(fields[2], fields[3]),
+                       _nmea_degrees(fields[4], fields[5]), None)
+        except (ValueError, IndexError):
+            continue
+
+
+def parse_time(value):
+    """Unix seconds from a number or an ISO 8601 string (Z or offset; naive = UTC)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_gpx(source):
+    """Fixes from the <trkpt> (and <rtept>) points of a GPX file or file object that have a <time>."""
+    for _, elem in ET.iterparse(source):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag not in ("trkpt", "rtept"):
+            continue
+        t = speed = None
+        for child in elem.iter():
+            name = child.tag.rsplit("}", 1)[-1]
+            if name == "time" and child.text:
+                t = parse_time(child.text)
+            elif name == "speed" and child.text:
+                speed = float(child.text)
+        if t is not None:
+            yield t, float(elem.get("lat")), float(elem.get("lon")), speed
+        elem.clear()
+
+
+CSV_COLUMNS = {
+    "t": ("timestamp", "time", "t", "unix_time"),
+    "lat": ("latitude", "lat"),
+    "lon": ("longitude", "lon", "lng"),
+    "speed": ("speed", "speed_mps"),
+}
+
+
+def parse_csv(lines):
+    """Fixes from CSV with a header naming timestamp/time, latitude/lat, longitude/lon[, speed] columns."""
+    reader = csv.reader(lines)
+    header = [h.strip().lower() for h in next(reader, [])]
+    columns = {}
+    for key, names in CSV_COLUMNS.items():
+        columns[key] = next((header.index(n) for n in names if n in header), None)
+    if columns["t"] is None or columns["lat"] is None or columns["lon"] is None:
+        raise ValueError(f"CSV track needs timestamp, latitude and longitude columns, got {header}")
+    for row in reader:
+        try:
+            speed = row[columns["speed"]] if columns["speed"] is not None else ""
+            yield (parse_time(row[columns["t"]]), float(row[columns["lat"]]), float(row[columns["lon"]]),
+                   float(speed) if speed.strip() else None)
+        except (ValueError, IndexError):
+            continue
+
+
+PARSERS = {"nmea": parse_nmea, "gpx": parse_gpx, "csv": parse_csv}
+
+
+def track_format(path):
+    """nmea, gpx or csv from a file extension (devices and anything else: nmea)."""
+    ext = os.path.splitext(str(path))[1].lower()
+    return {".gpx": "gpx", ".csv": "csv"}.get(ext, "nmea")
+
+
+def _follow(f, stop):
+    """Yields lines of a file as they are appended, until stop is set."""
+    while not stop.is_set():
+        line = f.readline()
+        if line:
+            yield line
+        else:
+            stop.wait(FOLLOW_POLL)
+
+
+class TrackReader:
+    """
+    Reads fixes from source (a path, a device or a text file object) on a
+    background thread into a FixBuffer; position(t) / speed(t) answer from
+    the fixes read so far. fmt defaults to the file extension (track_format).
+    With follow=True the reader waits for more data at the end (live
+    devices, logs still being written); GPX is always read once.
+    """
+
+    def __init__(self, source, fmt=None, follow=False, time_offset=0.0, capacity=DEFAULT_CAPACITY,
+                 max_gap=DEFAULT_MAX_GAP, max_age=DEFAULT_MAX_AGE):
+        self.source = source
+        self.fmt = fmt or track_format(source)
+        if self.fmt not in PARSERS:
+            raise ValueError(f"Unknown track format {self.fmt!r}, expected one of {sorted(PARSERS)}")
+        self.follow = follow and self.fmt != "gpx"
+        self.time_offset = time_offset
+        self.buffer = FixBuffer(capacity, max_gap=max_gap, max_age=max_age)
+        self.stats = {"fixes": 0, "dropped": 0}
+        self.error = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="location", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if isinstance(self.source, io.IOBase):
+                f = self.source
+            elif self.fmt == "gpx":
+                f = open(self.source, "rb")  # the XML declaration names the encoding
+            else:
+                f = open(self.source, "r", newline="" if self.fmt == "csv" else None, errors="replace")
+            with f:
+                lines = _follow(f, self._stop) if self.follow else f
+                for t, lat, lon, speed in PARSERS[self.fmt](lines):
+                    if self.buffer.add(t + self.time_offset, lat, lon, speed):
+                        self.stats["fixes"] += 1
+                    else:
+                        self.stats["dropped"] += 1
+                    if self._stop.is_set():
+                        break
+        except Exception as e:
+            self.error = e
+            print(f" [GPS] Reading {self.source} failed: {e}")
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Blocks until a non-followed source is read completely. Returns True if it was."""
+        return self._done.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+
+    def position(self, t):
+        return self.buffer.position(t)
+
+    def speed(self, t):
+        return self.buffer.speed(t)
+
+    def summary(self):
+        span = self.buffer.span()
+        covered = f", {span[1] - span[0]:.0f}s of track" if span else ""
+        return (f"{self.stats['fixes']} fixes from {self.source} ({self.fmt}){covered}, "
+                f"{self.stats['dropped']} repeated or out of order")
+
+
+class SimulatedGPS:
+    """The demo's random walk from a start point: every position() call moves a few meters."""
+
+    def __init__(self, lat, lon, step_deg=0.00005):
+        self.lat = lat
+        self.lon = lon
+        self.step_deg = step_deg
+        self._lock = threading.Lock()
+
+    def position(self, t=None):
+        with self._lock:
+            self.lat += random.uniform(-self.step_deg, self.step_deg)
+            self.lon += random.uniform(-self.step_deg, self.step_deg)
+            return self.lat, self.lon
+
+    def speed(self, t=None):
+        return None  # unknown: the frame gate falls back to scene change only
+
+    def summary(self):
+        return f"simulated GPS at {self.lat:.5f}, {self.lon:.5f}"
+
+
+def create_location(source, lat, lon, fmt=None, follow=True, time_offset=0.0, max_gap=DEFAULT_MAX_GAP):
+    """A started TrackReader for source, or SimulatedGPS from (lat, lon) when source is empty."""
+    if not source:
+        return SimulatedGPS(lat, lon)
+    return TrackReader(source, fmt=fmt, follow=follow, time_offset=time_offset, max_gap=max_gap).start()
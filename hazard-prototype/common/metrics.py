@@ -0,0 +1,311 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+    from metrics import counter, gauge, histogram, timed
+    with timed("pipeline_stage_seconds", stage="inference"):
+        result = model(frame)
+    counter("reports_skipped_total", reason="cooldown").inc()
+
+install_flask_metrics(app) times every request, serves /metrics and, when
+ENABLE_PROFILING=1, /debug/profile. start_metrics_server(port) exposes
+/metrics from processes without Flask. install_profile_signal() dumps a
+sampling profile of all threads on SIGUSR1.
+"""
+import os
+import sys
+import math
+import time
+import signal
+import bisect
+import threading
+import traceback
+import collections
+from contextlib import contextmanager
+
+# Seconds; tuned for per-frame stages (ms) up to network calls (s).
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROLLING_WINDOW = 1024  # recent observations kept per histogram for p50/p95
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape_label(value):
+    """A label value as the text exposition format requires: backslash, quote and newline escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = sorted(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_escape_label(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self._value += n
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {_format_value(self._value)}"
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, fn=None):
+        self._value = 0
+        self._fn = fn
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        return self._fn() if self._fn else self._value
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {_format_value(self.value())}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._recent = collections.deque(maxlen=ROLLING_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._recent.append(value)
+
+    def quantile(self, q):
+        """q-quantile of the recent observations (None if empty)."""
+        with self._lock:
+            recent = sorted(self._recent)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            yield f"{name}_bucket{_format_labels(labels, {'le': _format_value(bound)})} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {_format_value(total)}"
+        yield f"{name}_count{_format_labels(labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}   # name -> (kind, help, {labels_key: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            kind, _, children = self._metrics.setdefault(name, (cls.kind, help_text, {}))
+            if kind != cls.kind:
+                raise ValueError(f"Metric {name} already registered as a {kind}")
+            if key not in children:
+                children[key] = cls(**kwargs)
+            return children[key]
+
+    def render(self):
+        """Returns every metric in Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = [(name, kind, help_text, list(children.items()))
+                       for name, (kind, help_text, children) in sorted(self._metrics.items())]
+        for name, kind, help_text, children in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in children:
+                lines.extend(metric.samples(name, dict(key)))
+            if kind == "histogram":
+                # Rolling quantiles over the last ROLLING_WINDOW observations
+                lines.append(f"# HELP {name}_recent {help_text} (last {ROLLING_WINDOW} observations)")
+                lines.append(f"# TYPE {name}_recent summary")
+                for key, metric in children:
+                    for q in QUANTILES:
+                        value = metric.quantile(q)
+                        if value is not None:
+                            lines.append(f"{name}_recent{_format_labels(dict(key), {'quantile': q})} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text="", **labels):
+    return REGISTRY._get(Counter, name, help_text, labels)
+
+
+def gauge(name, help_text="", fn=None, **labels):
+    """A settable gauge, or a callback gauge evaluated at scrape time when fn is given."""
+    return REGISTRY._get(Gauge, name, help_text, labels, fn=fn)
+
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+    return REGISTRY._get(Histogram, name, help_text, labels, buckets=buckets)
+
+
+@contextmanager
+def timed(name, help_text="Duration in seconds", **labels):
+    """Observes the duration of the block into a histogram."""
+    hist = histogram(name, help_text, **labels)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - start)
+
+
+class RateMeter:
+    """Events per second over a sliding window (e.g. FPS)."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._times = collections.deque()
+
+    def tick(self):
+        now = time.monotonic()
+        self._times.append(now)
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.0
+        span = self._times[-1] - self._times[0]
+        return (len(self._times) - 1) / span if span > 0 else 0.0
+
+
+# --- Sampling profiler ---
+
+def sample_profile(seconds=10.0, interval=0.005):
+    """
+    Samples the stacks of every thread for `seconds` and returns them in
+    collapsed-stack format ("thread;frame;frame count" per line), which
+    flamegraph.pl and speedscope read directly.
+    """
+    me = threading.get_ident()
+    names = {}
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = [f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+                      for fs in traceback.extract_stack(frame)]
+            stacks[";".join([names.get(ident, str(ident))] + frames)] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+
+
+def dump_profile(out_dir, seconds=10.0):
+    """Runs sample_profile() and writes it to out_dir; returns the file path."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"profile_{time.strftime('%Y%m%d_%H%M%S')}.collapsed")
+    data = sample_profile(seconds)
+    with open(path, "w") as f:
+        f.write(data)
+    print(f" [PROFILE] Wrote {path}")
+    return path
+
+
+def install_profile_signal(out_dir, seconds=10.0, signum=getattr(signal, "SIGUSR1", None)):
+    """On signum (SIGUSR1 by default), dump a sampling profile in the background."""
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handler(_signum, _frame):
+        threading.Thread(target=dump_profile, args=(out_dir, seconds), daemon=True).start()
+
+    signal.signal(signum, handler)
+    return True
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serves /metrics on a background thread, for processes without a Flask app."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f" [METRICS] Serving http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def install_flask_metrics(app, prefix="http"):
+    """Times every request of a Flask app, adds /metrics and (opt-in) /debug/profile."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = getattr(g, "_metrics_start", None)
+        if start is not None and request.endpoint != "metrics":
+            endpoint = request.endpoint or "unmatched"
+            histogram(f"{prefix}_request_duration_seconds", "Flask handler latency in seconds",
+                      endpoint=endpoint, method=request.method).observe(time.perf_counter() - start)
+            counter(f"{prefix}_requests_total", "Requests handled",
+                    endpoint=endpoint, method=request.method, status=response.status_code).inc()
+        return response
+
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
+
+    if os.environ.get("ENABLE_PROFILING") == "1":
+        def profile():
+            try:
+                seconds = float(request.args.get("seconds", 10))
+            except ValueError:
+                seconds = math.nan
+            if not seconds > 0:  # also rejects nan
+                return Response("seconds must be a positive number\n", status=400, mimetype="text/plain")
+            return Response(sample_profile(min(seconds, 60.0)), mimetype="text/plain")
+
+        app.add_url_rule("/debug/profile", "debug_profile", profile)
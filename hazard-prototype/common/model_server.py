@@ -0,0 +1,329 @@
+"""
+Long-lived model process for short-lived detector runs.
+
+Every `python detect_potholes.py ...` used to import Ultralytics/PyTorch and
+load the weights before its first frame, seconds per invocation. A model
+server does that once (and warms the model up), then answers inference
+requests over a local socket; a client attaches in milliseconds and never
+imports Ultralytics:
+
+    python model_server.py --new-key                         # once: writes the key file
+    python model_server.py --model pothole_best.pt           # keep running
+    MODEL_SERVER=default python detect_potholes.py --offline drive.mp4
+
+RemoteModel is called like the YOLO model (model(frame_or_frames) ->
+[result]); its results carry the boxes as NumPy arrays behind the same
+interface the detection loops use (result.boxes, box.conf, box.xyxy[0],
+box.cls, result.boxes.data, result.plot()). The server runs one request at
+a time per model; ROI / tiled inference (--roi/--tiles) happens server-side.
+
+Connections carry pickles, so whoever can talk to the server (or pose as
+it) can run code in the other process. Hence:
+
+- The socket is a Unix domain socket in a private directory (0700, owned
+  by this user; $XDG_RUNTIME_DIR/pothole-model, else ~/.pothole-model),
+  never a world-writable one such as /tmp. Without Unix sockets (Windows)
+  it is a loopback "host:port"; other hosts are refused.
+- Both sides authenticate with a shared key: MODEL_SERVER_KEY, else the
+  key file (MODEL_SERVER_KEY_FILE, default <private dir>/authkey, 0600).
+  There is no built-in key; without one the server does not start and
+  clients load the model themselves.
+"""
+import os
+import sys
+import stat
+import time
+import signal
+import secrets
+import argparse
+import ipaddress
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+UNIX_SOCKETS = hasattr(os, "fork")
+PRIVATE_DIR = os.path.join(os.environ["XDG_RUNTIME_DIR"], "pothole-model") if os.environ.get("XDG_RUNTIME_DIR") \
+    else os.path.expanduser(os.path.join("~", ".pothole-model"))
+DEFAULT_ADDRESS = os.path.join(PRIVATE_DIR, "model.sock") if UNIX_SOCKETS else "127.0.0.1:6070"
+KEY_FILE = os.environ.get("MODEL_SERVER_KEY_FILE") or os.path.join(PRIVATE_DIR, "authkey")
+
+
+def private_dir(path, create=False):
+    """
+    Checks that directory path is only accessible to this user (creating it
+    0700 if asked). Raises RuntimeError otherwise, e.g. for /tmp or a symlink.
+    """
+    if create:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError(f"{path} is not a directory")
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise RuntimeError(f"{path} must be owned by this user and not accessible to others (chmod 700)")
+    return path
+
+
+def load_authkey(path=KEY_FILE):
+    """The shared key: MODEL_SERVER_KEY, else the 0600 key file at path. Raises RuntimeError if there is none."""
+    if os.environ.get("MODEL_SERVER_KEY"):
+        return os.environ["MODEL_SERVER_KEY"].encode()
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        raise RuntimeError(f"No model server key: set MODEL_SERVER_KEY or run `model_server.py --new-key` ({path})")
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise RuntimeError(f"{path} must be owned by this user and readable only by it (chmod 600)")
+    with open(path, "rb") as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"{path} is empty")
+    return key
+
+
+def new_authkey(path=KEY_FILE):
+    """Writes a fresh random key to path (mode 0600) and returns it."""
+    private_dir(os.path.dirname(path), create=True)
+    key = secrets.token_hex(32).encode()
+    fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.replace(path + ".tmp", path)
+    return key
+
+
+def parse_address(address, create=False):
+    """
+    A Unix socket path in a private directory (see private_dir), or
+    (host, port) for a loopback "host:port". "default" is DEFAULT_ADDRESS.
+    Raises ValueError for any other host and RuntimeError for an unsafe directory.
+    """
+    address = DEFAULT_ADDRESS if address in (None, "", "default") else str(address)
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address and os.sep not in address:
+        host = host.strip("[]") or "127.0.0.1"
+        try:
+            loopback = host == "localhost" or ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ValueError(f"Model server address {address!r} is not a loopback address")
+        return (host, int(port))
+    if not UNIX_SOCKETS:
+        raise ValueError(f"Model server address {address!r}: Unix sockets are not available, use 127.0.0.1:<port>")
+    private_dir(os.path.dirname(os.path.abspath(address)), create=create)
+    return address
+
+
+class RemoteBox:
+    """One detection: conf and cls scalars, xyxy as a (1, 4) array like Ultralytics."""
+
+    def __init__(self, row):
+        self.data = row[None, :]
+        self.xyxy = row[None, :4]
+        self.conf = row[4]
+        self.cls = row[5]
+
+
+class RemoteBoxes:
+    """(N, 6) rows of x1, y1, x2, y2, conf, cls."""
+
+    def __init__(self, data):
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return (RemoteBox(row) for row in self.data)
+
+
+class RemoteResult:
+    """Detections of one frame from a model server."""
+
+    def __init__(self, frame, data, names, speed=None):
+        self.orig_img = frame
+        self.orig_shape = frame.shape[:2]
+        self.boxes = RemoteBoxes(data)
+        self.names = names
+        self.path = ""
+        self.speed = speed or {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def plot(self):
+        """A copy of the frame with the boxes and labels drawn on it."""
+        import cv2
+
+        image = self.orig_img.copy()
+        for x1, y1, x2, y2, conf, cls in self.boxes.data:
+            p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+            cv2.rectangle(image, p1, p2, (0, 0, 255), 2)
+            label = f"{self.names.get(int(cls), int(cls))} {conf:.2f}"
+            cv2.putText(image, label, (p1[0], max(p1[1] - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        return image
+
+
+class RemoteModel:
+    """Client of a model server; one connection, safe to share between threads."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = address
+        self._conn = Client(parse_address(address), authkey=authkey or load_authkey())
+        self._lock = threading.Lock()
+        info = self._request(("info",))
+        self.names = {int(k): v for k, v in info["names"].items()}
+        self.model_path = info["model"]
+
+    def _request(self, message):
+        with self._lock:
+            self._conn.send(message)
+            status, payload = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Model server {self.address}: {payload}")
+        return payload
+
+    def __call__(self, source, verbose=False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        t0 = time.perf_counter()
+        rows = self._request(("infer", frames, kwargs))
+        speed = {"roundtrip": (time.perf_counter() - t0) * 1000 / max(len(frames), 1)}
+        return [RemoteResult(frame, data, self.names, speed) for frame, data in zip(frames, rows)]
+
+    def close(self):
+        self._conn.close()
+
+
+def attach(address=DEFAULT_ADDRESS, authkey=None):
+    """
+    A RemoteModel for a running server at address, or None (logged) if there
+    is none, its key does not match or the address is unsafe; callers then
+    load the model themselves.
+    """
+    try:
+        return RemoteModel(address, authkey)
+    except (OSError, EOFError, AuthenticationError, ValueError, RuntimeError) as e:
+        print(f" [MODEL] Not using a model server at {address} ({e.__class__.__name__}: {e})")
+        return None
+
+
+def _boxes_of(result):
+    data = result.boxes.data
+    data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+    return np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+
+def serve_model(model, model_path, address=DEFAULT_ADDRESS, authkey=None):
+    """Answers inference requests for model at address until interrupted (one thread per client)."""
+    authkey = authkey or load_authkey()
+    address = parse_address(address, create=True)
+    if isinstance(address, str) and os.path.exists(address):
+        try:
+            Client(address, authkey=authkey).close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(address)  # left behind by a server that was killed
+        except AuthenticationError:
+            raise RuntimeError(f"Another model server (different key) is listening at {address}")
+        else:
+            raise RuntimeError(f"A model server is already listening at {address}")
+    listener = Listener(address, authkey=authkey)
+    model_lock = threading.Lock()
+    names = {int(k): v for k, v in (getattr(model, "names", None) or {}).items()}
+    stats = {"clients": 0, "frames": 0}
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if message[0] == "info":
+                        reply = {"names": names, "model": model_path, "pid": os.getpid()}
+                    elif message[0] == "infer":
+                        _, frames, kwargs = message
+                        with model_lock:
+                            results = model(frames, verbose=False, **kwargs)
+                        reply = [_boxes_of(r) for r in results]
+                        stats["frames"] += len(frames)
+                    else:
+                        raise ValueError(f"unknown request {message[0]!r}")
+                    conn.send(("ok", reply))
+                except Exception as e:
+                    conn.send(("error", f"{e.__class__.__name__}: {e}"))
+
+    print(f" [MODEL] Serving {model_path} at {listener.address}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:  # e.g. a client with the wrong authkey
+                print(f" [MODEL] Rejected a connection: {e}")
+                continue
+            stats["clients"] += 1
+            threading.Thread(target=handle, args=(conn,), name="model-client", daemon=True).start()
+    finally:
+        listener.close()
+        print(f" [MODEL] Served {stats['frames']} frames to {stats['clients']} clients")
+
+
+if __name__ == "__main__":
+    from inference_backends import WARMUP_RUNS, load_first_available, warm_up
+    from tiled_inference import TiledDetector
+
+    parser = argparse.ArgumentParser(description="Keep a warm detection model in memory for detector runs.")
+    parser.add_argument("--model", nargs="+", default=[os.environ.get("MODEL_PATH") or "yolov8n.pt"],
+                        help="model paths, the first that loads is served")
+    parser.add_argument("--address", default=os.environ.get("MODEL_SERVER") or DEFAULT_ADDRESS,
+                        help=f"socket path in a private directory, or a loopback host:port "
+                             f"(default: MODEL_SERVER or {DEFAULT_ADDRESS})")
+    parser.add_argument("--new-key", action="store_true", help=f"write a new random key to {KEY_FILE} and exit")
+    parser.add_argument("--warmup", type=int, default=WARMUP_RUNS, help="warm-up inferences before serving")
+    parser.add_argument("--roi", nargs=4, type=float, metavar=("X0", "Y0", "X1", "Y1"),
+                        help="road region as fractions of the frame (tiled inference)")
+    parser.add_argument("--tiles", nargs=2, type=int, default=(1, 1), metavar=("COLS", "ROWS"))
+    parser.add_argument("--imgsz", type=int, help="model input size per tile")
+    args = parser.parse_args()
+    if args.new_key:
+        new_authkey()
+        print(f" [MODEL] Wrote a new key to {KEY_FILE}; restart running servers and clients")
+        sys.exit(0)
+    try:
+        # Check the key and the address before spending seconds on the model
+        load_authkey()
+        parse_address(args.address, create=True)
+    except (RuntimeError, ValueError) as e:
+        sys.exit(f" [MODEL] {e}")
+
+    started = time.perf_counter()
+    model, path = load_first_available(args.model)
+    if args.roi or tuple(args.tiles) != (1, 1) or args.imgsz:
+        model = TiledDetector(model, roi=tuple(args.roi) if args.roi else None, tiles=args.tiles, imgsz=args.imgsz)
+    loaded = time.perf_counter() - started
+    latencies = warm_up(model, runs=args.warmup)
+    print(f" [MODEL] Loaded in {loaded:.2f}s, warm-up {', '.join(f'{ms:.0f}' for ms in latencies)} ms")
+
+    def stop(*_):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # a second SIGTERM must not interrupt the shutdown
+        sys.exit(0)  # closes (and unlinks) the socket
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        serve_model(model, path, args.address)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,350 @@
+"""
+Durable on-device outbox for reports that have not reached their sink yet.
+
+Every pending report is written to a small SQLite journal (WAL, one fsync per
+put) before anything is sent, so a crash, a reboot or hours without coverage
+lose nothing. Each record carries a report_id idempotency key assigned on the
+device; sinks dedupe on it, so replaying a batch that was stored but never
+acknowledged is harmless. Disk use is bounded: past max_records / max_bytes
+the oldest reports are evicted (and counted).
+
+OutboxReplayer drains the journal on its own thread, oldest first, in batches.
+A sink that rejects single records says which ones; a batch rejected as a
+whole is split in half and retried, so one bad record never drops the
+good reports journaled with it. A batch that keeps failing the same way is
+split too: if part of it goes through, the records it still fails on are
+moved to a quarantine table (kept, not sent) so they cannot block the queue.
+Backlog batches are paced to max_rate reports/s and unreachable sinks back off
+exponentially, so replay after a reconnect never competes with the live
+detection loop for CPU or bandwidth.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_id TEXT UNIQUE,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quarantine (
+    id INTEGER PRIMARY KEY,
+    report_id TEXT,
+    created REAL NOT NULL,
+    quarantined REAL NOT NULL,
+    error TEXT,
+    record TEXT NOT NULL
+);
+"""
+
+
+def new_report_id():
+    """Idempotency key for one report, assigned once on the device."""
+    return uuid.uuid4().hex
+
+
+class RejectedBatch(Exception):
+    """Raised by a replay sender when the sink refused the batch; retrying it unchanged will not help."""
+
+
+class Outbox:
+    """SQLite journal of pending reports, bounded to max_records and max_bytes of payload."""
+
+    def __init__(self, path, max_records=50000, max_bytes=64 * 1024 * 1024, name="outbox"):
+        self.path = path
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._evicted = metrics.counter("outbox_evicted_total", "Pending reports dropped to bound disk use", outbox=name)
+        metrics.gauge("outbox_pending", "Reports waiting in the on-device outbox", fn=self.count, outbox=name)
+
+    def _connect(self):
+        """Returns this thread's connection (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, records):
+        """
+        Journals records (dicts) in one transaction. A record without a
+        report_id gets one; a report_id already pending is ignored.
+        Returns the number of records evicted to stay within bounds.
+        """
+        rows = []
+        for record in records:
+            record.setdefault("report_id", new_report_id())
+            data = json.dumps(record)
+            rows.append((record["report_id"], time.time(), len(data), data))
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (report_id, created, size, record) VALUES (?, ?, ?, ?)", rows
+            )
+            evicted = self._enforce_bounds(conn)
+        if evicted:
+            self._evicted.inc(evicted)
+            print(f" [OUTBOX] Full, dropped the {evicted} oldest pending reports")
+        return evicted
+
+    def _enforce_bounds(self, conn):
+        count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox").fetchone()
+        if count <= self.max_records and size <= self.max_bytes:
+            return 0
+        # Oldest first, up to the first record that brings both totals back within bounds
+        evicted, cutoff = 0, None
+        for row_id, row_size in conn.execute("SELECT id, size FROM outbox ORDER BY id"):
+            if count - evicted <= self.max_records and size <= self.max_bytes:
+                break
+            evicted += 1
+            size -= row_size
+            cutoff = row_id
+        conn.execute("DELETE FROM outbox WHERE id <= ?", (cutoff,))
+        return evicted
+
+    def peek(self, limit):
+        """Returns up to limit pending [(row_id, record)], oldest first, without removing them."""
+        rows = self._connect().execute(
+            "SELECT id, record FROM outbox ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        return [(row_id, json.loads(data)) for row_id, data in rows]
+
+    def ack(self, row_ids):
+        """Removes delivered (or permanently rejected) records."""
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in row_ids])
+
+    def failed(self, row_ids):
+        """Counts a failed delivery attempt on each record."""
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in row_ids])
+
+    def quarantine(self, row_ids, error):
+        """Moves records the sink keeps failing on out of the queue, keeping them for inspection."""
+        conn = self._connect()
+        with self._write_lock, conn:
+            for row_id in row_ids:
+                conn.execute(
+                    "INSERT OR REPLACE INTO quarantine (id, report_id, created, quarantined, error, record) "
+                    "SELECT id, report_id, created, ?, ?, record FROM outbox WHERE id = ?",
+                    (time.time(), str(error), row_id),
+                )
+                conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def oldest_age(self):
+        """Seconds the oldest pending record has waited (None if empty)."""
+        row = self._connect().execute("SELECT MIN(created) FROM outbox").fetchone()
+        return None if row[0] is None else time.time() - row[0]
+
+    def import_jsonl(self, path, convert=None):
+        """
+        One-time import of the JSONL outbox older versions wrote; renames the
+        file afterwards. convert(record) maps an old record onto the current form.
+        """
+        if not os.path.exists(path):
+            return 0
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-append
+                records.append(convert(record) if convert else record)
+        self.put(records)
+        os.replace(path, path + ".migrated")
+        print(f" [OUTBOX] Imported {len(records)} reports from {path}")
+        return len(records)
+
+
+class OutboxReplayer:
+    """
+    Drains an Outbox on a background thread. send(records) delivers one batch
+    and returns the positions of any records the sink rejected (None or empty
+    if it took them all); it raises on failure, RejectedBatch if the sink
+    refused the batch as a whole (which is then bisected down to the bad
+    records). A batch goes out when it is full or its oldest record has
+    waited max_wait seconds; back-to-back batches are paced to max_rate reports/s.
+    ConnectionError is always retried; a batch failing max_failures times in a
+    row with the same other error is isolated (see _isolate).
+    """
+
+    def __init__(self, outbox, send, batch_size=50, max_wait=1.0, max_rate=200.0,
+                 backoff=1.0, max_backoff=60.0, idle_wait=5.0, max_failures=5, name="outbox-replay"):
+        self.outbox = outbox
+        self.send = send
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_rate = max_rate
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle_wait = idle_wait
+        self.max_failures = max_failures
+        self._failure, self._failures = None, 0
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._stop = threading.Event()
+        self._started = time.time()
+        self.stats = {"sent": 0, "batches": 0, "failed_batches": 0, "rejected": 0, "quarantined": 0,
+                      "send_seconds": 0.0}
+        self._metrics = {key: metrics.counter("outbox_replay_total", "Outbox replay outcomes", outbox=name, outcome=key)
+                         for key in ("sent", "batches", "failed_batches", "rejected", "quarantined")}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Signals that new records were put; call after Outbox.put()."""
+        self._wake.set()
+
+    def _count(self, key, n=1):
+        self.stats[key] += n
+        self._metrics[key].inc(n)
+
+    def _wait(self, seconds):
+        self._wake.wait(seconds)
+        self._wake.clear()
+
+    def _run(self):
+        delay = self.backoff
+        while not self._stop.is_set():
+            rows = self.outbox.peek(self.batch_size)
+            if not rows:
+                if self._closing.is_set():
+                    return
+                self._wait(self.idle_wait)
+                continue
+            age = self.outbox.oldest_age() or 0.0
+            if len(rows) < self.batch_size and age < self.max_wait and not self._closing.is_set():
+                self._wait(self.max_wait - age)
+                continue
+
+            started = time.perf_counter()
+            try:
+                self._deliver(rows)
+            except Exception as e:
+                # Halves delivered before the failure are already acked
+                self.outbox.failed([row_id for row_id, _ in rows])
+                self._count("failed_batches")
+                if self._closing.is_set():
+                    return
+                if self._repeated_failure(rows, e) and self._try_isolate(rows):
+                    delay = self.backoff
+                    continue
+                print(f" [OUTBOX] Replay failed ({e}); {self.outbox.count()} pending, retrying in {delay:.1f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            elapsed = time.perf_counter() - started
+            self.stats["send_seconds"] += elapsed
+            self._count("batches")
+            delay = self.backoff
+            # Pace backlog replay so it never saturates the device
+            if self.max_rate:
+                self._stop.wait(max(0.0, len(rows) / self.max_rate - elapsed))
+
+    def _deliver(self, rows):
+        """
+        Sends rows and acks them. A rejected batch is split in half and each
+        half sent on its own; single rejected records are dropped. Raises on a
+        retryable failure.
+        """
+        try:
+            rejected = set(self.send([record for _, record in rows]) or ())
+        except RejectedBatch as e:
+            if len(rows) == 1:
+                print(f" [OUTBOX] Sink rejected report {rows[0][1].get('report_id')}, dropping it: {e}")
+                self.outbox.ack([rows[0][0]])
+                self._count("rejected")
+                return
+            half = len(rows) // 2
+            self._deliver(rows[:half])
+            self._deliver(rows[half:])
+            return
+        if rejected:
+            print(f" [OUTBOX] Sink rejected {len(rejected)} of {len(rows)} reports, dropping them")
+            self._count("rejected", len(rejected))
+        self.outbox.ack([row_id for row_id, _ in rows])
+        self._count("sent", len(rows) - len(rejected))
+
+    def _repeated_failure(self, rows, error):
+        """True once the same head batch failed max_failures times in a row with the same non-connection error."""
+        if isinstance(error, ConnectionError) or len(rows) < 2:
+            self._failure, self._failures = None, 0
+            return False
+        failure = (rows[0][0], type(error), str(error))
+        self._failures = self._failures + 1 if failure == self._failure else 1
+        self._failure = failure
+        return self._failures >= self.max_failures
+
+    def _try_isolate(self, rows):
+        """Runs _isolate on a batch that keeps failing; True if it got the queue moving again."""
+        self._failure, self._failures = None, 0
+        print(f" [OUTBOX] Batch of {len(rows)} failed {self.max_failures} times the same way, isolating the bad records")
+        try:
+            self._isolate(rows)
+        except Exception as e:
+            print(f" [OUTBOX] Every part of the batch fails ({e}), the sink itself is failing")
+            return False
+        return True
+
+    def _isolate(self, rows, proven=False):
+        """
+        Sends each half of a failing batch on its own. If neither half goes
+        through (and nothing did yet) the sink is failing as a whole: raises.
+        Otherwise the failing parts hold bad records: they are split further
+        and a single failing record is quarantined.
+        """
+        half = len(rows) // 2
+        failed = []
+        for part in (rows[:half], rows[half:]):
+            try:
+                self._deliver(part)
+            except ConnectionError:
+                raise  # unreachable now: says nothing about the records
+            except Exception as e:
+                failed.append((part, e))
+        if len(failed) == 2 and not proven:
+            raise failed[0][1]
+        for part, e in failed:
+            if len(part) > 1:
+                self._isolate(part, proven=True)
+                continue
+            print(f" [OUTBOX] Report {part[0][1].get('report_id')} keeps failing ({e}), quarantining it")
+            self.outbox.quarantine([part[0][0]], e)
+            self._count("quarantined")
+
+    def throughput(self):
+        """Returns (reports/s since start, reports/s while sending)."""
+        elapsed = max(time.time() - self._started, 1e-9)
+        busy = max(self.stats["send_seconds"], 1e-9)
+        return self.stats["sent"] / elapsed, self.stats["sent"] / busy
+
+    def close(self, timeout=None):
+        """Tries to deliver what is pending within timeout, then stops; undelivered records stay journaled."""
+        self._closing.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(1.0)
@@ -0,0 +1,140 @@
+"""
+Where the cloud service writes its hazard reports.
+
+A sink takes documents in batches and image files one at a time:
+
+    sink.write(collection, [(doc_id, data), ...])   # one commit per call
+    sink.upload(path, name, cache_control=None)     # -> public URL
+    sink.server_timestamp                            # value for "created_at"
+
+- FirestoreSink: Firestore WriteBatch commits (up to FIRESTORE_BATCH_LIMIT
+  writes each) and Firebase Storage uploads. firebase_admin is imported and
+  initialized on first use, so importing the service needs neither the SDK
+  nor credentials, and startup does no network round trip.
+- MemorySink: keeps everything in dicts, with an optional simulated round
+  trip per commit and per upload; for tests and benchmarks.
+- LocalFileSink: appends documents as NDJSON and copies images into a
+  directory, so the service runs offline; the last line per id wins.
+  Values JSON has no type for (datetimes) are written as strings.
+
+Writes are keyed by document id, so writing a replayed batch again is harmless.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+
+FIRESTORE_BATCH_LIMIT = 500  # writes per Firestore commit
+
+
+class FirestoreSink:
+    """Firestore + Firebase Storage, initialized lazily from a service account file."""
+
+    def __init__(self, cred_path, bucket_name):
+        self.cred_path = cred_path
+        self.bucket_name = bucket_name
+        self._db = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def _clients(self):
+        with self._lock:
+            if self._db is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore, storage
+
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(credentials.Certificate(self.cred_path),
+                                                  {'storageBucket': self.bucket_name})
+                self._db = firestore.client()
+                self._bucket = storage.bucket()
+            return self._db, self._bucket
+
+    @property
+    def server_timestamp(self):
+        from firebase_admin import firestore
+        return firestore.SERVER_TIMESTAMP
+
+    def write(self, collection, documents):
+        db, _ = self._clients()
+        for i in range(0, len(documents), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for doc_id, data in documents[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(db.collection(collection).document(doc_id), data)
+            batch.commit()
+
+    def upload(self, path, name, cache_control=None):
+        _, bucket = self._clients()
+        blob = bucket.blob(name)
+        if cache_control:
+            blob.cache_control = cache_control
+        blob.upload_from_filename(path)
+        # Make public (optional, or use signed URLs)
+        blob.make_public()
+        return blob.public_url
+
+
+class MemorySink:
+    """In-memory sink; latency_s simulates the round trip of every commit and upload."""
+
+    server_timestamp = property(lambda self: time.time())
+
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.documents = {}  # collection -> {doc_id: data}
+        self.objects = {}    # name -> size in bytes
+        self.stats = {"commits": 0, "documents": 0, "uploads": 0}
+        self._lock = threading.Lock()
+
+    def write(self, collection, documents):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self._lock:
+            self.documents.setdefault(collection, {}).update(documents)
+            self.stats["commits"] += 1
+            self.stats["documents"] += len(documents)
+
+    def upload(self, path, name, cache_control=None):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.objects[name] = size
+            self.stats["uploads"] += 1
+        return f"memory://{name}"
+
+
+class LocalFileSink:
+    """Documents as <directory>/<collection>.ndjson, images copied to <directory>/objects."""
+
+    server_timestamp = property(lambda self: time.time())
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+
+    def write(self, collection, documents):
+        lines = "".join(json.dumps({"id": doc_id, **data}, default=str) + "\n" for doc_id, data in documents)
+        with self._lock, open(os.path.join(self.directory, f"{collection}.ndjson"), "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def upload(self, path, name, cache_control=None):
+        target = os.path.join(self.directory, "objects", name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        return "file://" + os.path.abspath(target)
+
+    def read(self, collection):
+        """Current documents of a collection: {doc_id: data}."""
+        documents = {}
+        path = os.path.join(self.directory, f"{collection}.ndjson")
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    data = json.loads(line)
+                    documents[data["id"]] = data
+        return documents
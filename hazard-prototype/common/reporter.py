@@ -0,0 +1,131 @@
+"""
+Background reporting stage for the detector loops.
+
+The capture/inference loop only calls ReportQueue.submit(); image writes and
+network calls run on worker threads, so a slow or unreachable backend never
+stalls inference. Failed jobs are retried with exponential backoff and, once
+retries are exhausted, journaled in the on-device Outbox for later replay.
+"""
+import queue
+import threading
+import time
+
+import metrics
+
+# What submit() does when the queue is full.
+DROP_OLDEST = "drop_oldest"   # discard the oldest pending report, keep the new one
+DROP_NEWEST = "drop_newest"   # discard the new report
+BLOCK = "block"               # backpressure: wait for a free slot
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+_STOP = object()
+
+
+class ReportQueue:
+    """
+    Bounded queue drained by `workers` threads that call handler(job).
+
+    handler should raise on failure. to_record(job) turns a job into the
+    JSON-serializable dict put in the outbox (an outbox.Outbox; defaults to the
+    job itself).
+    """
+
+    def __init__(self, handler, workers=1, maxsize=32, policy=DROP_OLDEST,
+                 max_retries=3, backoff=0.5, max_backoff=10.0,
+                 outbox=None, to_record=None, name="reporter"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {POLICIES}")
+        self.handler = handler
+        self.policy = policy
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.outbox = outbox
+        self.to_record = to_record or (lambda job: job)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "sent": 0, "dropped": 0, "retried": 0, "spilled": 0, "failed": 0}
+        self._metrics = {key: metrics.counter("report_queue_jobs_total", "Report jobs by outcome", queue=name, outcome=key)
+                         for key in self.stats}
+        metrics.gauge("report_queue_depth", "Jobs waiting in the report queue", fn=self.depth, queue=name)
+        self._workers = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._workers:
+            t.start()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+        self._metrics[key].inc(n)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, job):
+        """Queues a job without blocking the caller (unless policy is BLOCK). Returns False if dropped."""
+        self._count("submitted")
+        if self.policy == BLOCK:
+            self._queue.put(job)
+            return True
+        while True:
+            try:
+                self._queue.put_nowait(job)
+                return True
+            except queue.Full:
+                if self.policy == DROP_NEWEST:
+                    self._count("dropped")
+                    return False
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._process(job)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handler(job)
+                self._count("sent")
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f" [ERROR] Report failed after {attempt + 1} attempts: {e}")
+                    break
+                self._count("retried")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        self._count("failed")
+        self._spill(job)
+
+    def _spill(self, job):
+        """Appends the job to the outbox so it survives until it can be replayed."""
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.put([self.to_record(job)])
+            self._count("spilled")
+            print(f" [OUTBOX] Saved unsent report to {self.outbox.path}")
+        except Exception as e:
+            print(f" [ERROR] Could not write outbox {self.outbox.path}: {e}")
+
+    def close(self, timeout=None):
+        """Lets the workers finish queued jobs, then stops them."""
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        deadline = None if timeout is None else time.time() + timeout
+        for t in self._workers:
+            t.join(None if deadline is None else max(0.0, deadline - time.time()))
@@ -0,0 +1,76 @@
+"""
+Production WSGI serving for the Flask apps.
+
+serve(load_app, ...) runs the app under the best server installed:
+
+- gunicorn (Linux/macOS): `workers` pre-forked processes with `threads`
+  threads each (gthread). Every worker calls load_app() itself after the
+  fork, so SQLite connections, locks and background threads are never
+  shared between processes.
+- waitress (any platform, incl. Windows): one process, `threads` threads.
+- werkzeug's threaded development server as a last resort.
+
+Each gunicorn worker has its own metrics registry, so /metrics shows the
+worker that answered the scrape.
+"""
+import os
+
+SERVERS = ("gunicorn", "waitress", "werkzeug")
+
+
+def available_server(preferred=None, in_process=False):
+    """
+    Returns the preferred server if importable, else the first installed one
+    of SERVERS. in_process=True rules out gunicorn (it serves from forked workers).
+    """
+    candidates = [preferred] if preferred else []
+    candidates += [s for s in SERVERS if s != preferred]
+    if in_process:
+        candidates.remove("gunicorn")
+    for name in candidates:
+        if name == "werkzeug":
+            return name
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            if name == preferred:
+                print(f" [SERVE] {name} is not installed, falling back")
+    return "werkzeug"
+
+
+def serve(load_app, host="0.0.0.0", port=5000, workers=None, threads=8, server=None, timeout=60,
+          in_process=False):
+    """
+    Serves the WSGI app returned by load_app() until interrupted. workers
+    defaults to the CPU count; only gunicorn runs more than one process.
+    in_process=True serves from this process, for apps whose state (threads,
+    child processes) lives next to the app object.
+    """
+    workers = workers or os.cpu_count() or 1
+    server = available_server(server, in_process)
+    print(f" [SERVE] {server} on http://{host}:{port} "
+          f"({workers if server == 'gunicorn' else 1} processes x {threads} threads)")
+
+    if server == "gunicorn":
+        from gunicorn.app.base import BaseApplication
+
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{host}:{port}")
+                self.cfg.set("workers", workers)
+                self.cfg.set("threads", threads)
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("timeout", timeout)
+                # Never import the app in the master: each worker opens its own store
+                self.cfg.set("preload_app", False)
+
+            def load(self):
+                return load_app()
+
+        Application().run()
+    elif server == "waitress":
+        import waitress
+        waitress.serve(load_app(), host=host, port=port, threads=threads)
+    else:
+        load_app().run(host=host, port=port, threaded=True)
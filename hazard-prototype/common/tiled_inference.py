@@ -0,0 +1,150 @@
+"""
+Region-of-interest and tiled inference for small, distant potholes.
+
+At the model's input size a pothole 40 m down the road is a handful of
+pixels, while the sky and the dashboard take up half the frame. TiledDetector
+crops the road region of interest (roi, as fractions of the frame) and
+optionally splits it into overlapping tiles, so every tile reaches the model
+at close to native resolution. All tiles of a frame (and of every frame in a
+list) run as one batch, plus the whole ROI so large, near potholes are not
+cut apart. Boxes are shifted back to frame coordinates and merged across
+tiles by class-aware NMS; a box clipped at a tile edge is folded into the
+full one it is part of.
+
+TiledDetector is called like the YOLO model it wraps,
+detector(frame_or_frames, verbose=False) -> [Results], so the detection
+loops, the frame gate and the trackers work unchanged.
+"""
+import numpy as np
+
+DEFAULT_IOU = 0.5     # same object found by two tiles
+DEFAULT_IOS = 0.8     # intersection over the smaller box: a part clipped at a tile edge
+
+
+def roi_pixels(shape, roi):
+    """(x0, y0, x1, y1) fractions of the frame -> pixel bounds, at least one pixel wide and high."""
+    h, w = shape[:2]
+    if roi is None:
+        return 0, 0, w, h
+    x0, y0 = int(round(roi[0] * w)), int(round(roi[1] * h))
+    x1, y1 = int(round(roi[2] * w)), int(round(roi[3] * h))
+    x0, y0 = min(max(x0, 0), w - 1), min(max(y0, 0), h - 1)
+    return x0, y0, max(min(x1, w), x0 + 1), max(min(y1, h), y0 + 1)
+
+
+def tile_windows(bounds, cols=1, rows=1, overlap=0.2):
+    """Splits pixel bounds into cols x rows windows overlapping by `overlap` of a tile."""
+    x0, y0, x1, y1 = bounds
+    tile_w = (x1 - x0) / (cols - (cols - 1) * overlap)
+    tile_h = (y1 - y0) / (rows - (rows - 1) * overlap)
+    windows = []
+    for r in range(rows):
+        for c in range(cols):
+            tx = x0 + c * tile_w * (1 - overlap)
+            ty = y0 + r * tile_h * (1 - overlap)
+            windows.append((int(tx), int(ty), min(int(round(tx + tile_w)), x1), min(int(round(ty + tile_h)), y1)))
+    return windows
+
+
+def merge_detections(data, iou_threshold=DEFAULT_IOU, ios_threshold=DEFAULT_IOS):
+    """
+    Class-aware greedy NMS over (N, 6) rows of x1, y1, x2, y2, conf, cls.
+    A suppressed box that overlaps the kept one by iou_threshold, or is
+    covered by ios_threshold of the smaller box, widens the kept box to
+    their union. Returns the kept rows, most confident first.
+    """
+    data = np.asarray(data, dtype=float).reshape(-1, 6)
+    if len(data) < 2:
+        return data
+    boxes = data[:, :4]
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    iou = inter / np.maximum(area[:, None] + area[None, :] - inter, 1e-9)
+    ios = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-9)
+    same = (iou > iou_threshold) | (ios > ios_threshold)
+    same &= data[:, None, 5] == data[None, :, 5]
+
+    kept = []
+    done = np.zeros(len(data), dtype=bool)
+    for i in np.argsort(-data[:, 4], kind="stable"):
+        if done[i]:
+            continue
+        group = same[i] & ~done
+        group[i] = True
+        done |= group
+        row = data[i].copy()
+        row[:2] = boxes[group, :2].min(axis=0)
+        row[2:4] = boxes[group, 2:].max(axis=0)
+        kept.append(row)
+    return np.array(kept)
+
+
+class TiledDetector:
+    """
+    Wraps a YOLO model: crops roi (x0, y0, x1, y1 fractions, None = whole
+    frame), splits it into tiles=(cols, rows) overlapping windows and runs
+    them as one batch at imgsz. full_roi adds the whole ROI to the batch
+    when there is more than one tile.
+    """
+
+    def __init__(self, model, roi=None, tiles=(1, 1), overlap=0.2, imgsz=None, full_roi=True,
+                 iou_threshold=DEFAULT_IOU, ios_threshold=DEFAULT_IOS):
+        self.model = model
+        self.roi = roi
+        self.tiles = tuple(tiles)
+        self.overlap = overlap
+        self.imgsz = imgsz
+        self.full_roi = full_roi
+        self.iou_threshold = iou_threshold
+        self.ios_threshold = ios_threshold
+        self.names = getattr(model, "names", None)
+
+    def windows(self, shape):
+        """Pixel windows (x0, y0, x1, y1) run for a frame of this shape."""
+        bounds = roi_pixels(shape, self.roi)
+        windows = tile_windows(bounds, *self.tiles, overlap=self.overlap)
+        if self.full_roi and len(windows) > 1:
+            windows.append(bounds)
+        return windows
+
+    def __call__(self, source, verbose=False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        crops, owners = [], []
+        for i, frame in enumerate(frames):
+            for window in self.windows(frame.shape):
+                x0, y0, x1, y1 = window
+                crops.append(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+                owners.append((i, window))
+        if self.imgsz:
+            kwargs.setdefault("imgsz", self.imgsz)
+        tile_results = self.model(crops, verbose=verbose, **kwargs)
+
+        per_frame = [[] for _ in frames]
+        templates = [None] * len(frames)
+        for (i, (x0, y0, _, _)), result in zip(owners, tile_results):
+            if templates[i] is None:
+                templates[i] = result
+            data = result.boxes.data
+            data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+            if len(data):
+                data = np.array(data, dtype=float)
+                data[:, [0, 2]] += x0
+                data[:, [1, 3]] += y0
+                per_frame[i].append(data)
+        return [self._result(frame, templates[i],
+                             merge_detections(np.concatenate(per_frame[i]) if per_frame[i] else [],
+                                              self.iou_threshold, self.ios_threshold))
+                for i, frame in enumerate(frames)]
+
+    @staticmethod
+    def _result(frame, template, data):
+        """A Results for the whole frame carrying the merged boxes (plot() draws on the full frame)."""
+        import torch
+        from ultralytics.engine.results import Results
+
+        return Results(frame, path=template.path, names=template.names,
+                       boxes=torch.as_tensor(data, dtype=torch.float32).reshape(-1, 6))
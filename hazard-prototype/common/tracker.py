@@ -0,0 +1,170 @@
+"""
+Detection fusion: one report per pothole instead of one per frame.
+
+DetectionTracker links the boxes of consecutive frames into tracks, greedily
+by IoU and, for boxes that jumped too far to overlap (low frame rate, fast
+vehicle), by centroid distance. Each track accumulates its detections'
+confidences and remembers the context (frame, result, position) of its most
+confident frame. A track ends after max_missed frames without a match and is
+returned once, with its mean confidence, if it was seen in at least min_hits
+frames; flickering single-frame false positives never produce a report.
+max_frames also ends tracks that never leave the view (a parked vehicle, the
+service simulation re-feeding the same image), so they still get reported.
+"""
+import itertools
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of two (N, 4) / (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def centroid_distance_matrix(a, b):
+    """Pairwise centroid distance, in units of the larger box diagonal of each pair."""
+    ca = (a[:, :2] + a[:, 2:]) / 2
+    cb = (b[:, :2] + b[:, 2:]) / 2
+    dist = np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=2)
+    diag_a = np.linalg.norm(a[:, 2:] - a[:, :2], axis=1)
+    diag_b = np.linalg.norm(b[:, 2:] - b[:, :2], axis=1)
+    return dist / np.maximum(np.maximum(diag_a[:, None], diag_b[None, :]), 1e-9)
+
+
+def greedy_match(score, valid):
+    """Pairs (row, col) greedily by descending score among valid entries; each row/col used once."""
+    pairs = []
+    rows, cols = np.nonzero(valid)
+    used_rows, used_cols = set(), set()
+    for k in np.argsort(-score[rows, cols], kind="stable"):
+        r, c = int(rows[k]), int(cols[k])
+        if r not in used_rows and c not in used_cols:
+            pairs.append((r, c))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+
+class Track:
+    def __init__(self, track_id, box, confidence, frame_index, context):
+        self.id = track_id
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.conf_sum = confidence
+        self.best_confidence = confidence
+        self.best_context = context
+        self.first_frame = self.last_frame = frame_index
+
+    def add(self, box, confidence, frame_index, context):
+        self.box = box
+        self.hits += 1
+        self.missed = 0
+        self.conf_sum += confidence
+        self.last_frame = frame_index
+        # A frame without context (e.g. no GPS fix) cannot be reported, so it never becomes the best one
+        if context is not None and (self.best_context is None or confidence > self.best_confidence):
+            self.best_confidence = confidence
+            self.best_context = context
+
+    @property
+    def confidence(self):
+        """Mean confidence over the frames the pothole was detected in (steadier than any one frame)."""
+        return self.conf_sum / self.hits
+
+    def summary(self):
+        return {
+            "track_id": self.id,
+            "confidence": self.confidence,
+            "best_confidence": self.best_confidence,
+            "hits": self.hits,
+            "frames": self.last_frame - self.first_frame + 1,
+            "context": self.best_context,
+        }
+
+
+class DetectionTracker:
+    """IoU/centroid tracker over per-frame boxes; update() returns the tracks that ended."""
+
+    def __init__(self, iou_threshold=0.2, max_centroid_distance=1.0, max_missed=5, min_hits=3, max_frames=None):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.max_frames = max_frames
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = itertools.count(1)
+        self.counters = {"detections": 0, "tracks": 0, "reported": 0, "discarded": 0}
+
+    def update(self, boxes, confidences, context=None):
+        """
+        Feeds one frame's boxes ((N, 4) x1, y1, x2, y2) and confidences. Call it
+        for every frame, also without boxes, so tracks can end. context is kept
+        for the frame if it becomes a track's best. Returns summaries of the
+        tracks that ended with enough hits.
+        """
+        self.frame_index += 1
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        confidences = np.asarray(confidences, dtype=float).reshape(-1)
+        self.counters["detections"] += len(boxes)
+
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and len(boxes):
+            track_boxes = np.array([t.box for t in self.tracks])
+            iou = iou_matrix(track_boxes, boxes)
+            pairs = greedy_match(iou, iou >= self.iou_threshold)
+            # Boxes that no longer overlap their track (big jump between frames): nearest centroid
+            paired_t, paired_b = {p[0] for p in pairs}, {p[1] for p in pairs}
+            leftover_t = [i for i in range(len(self.tracks)) if i not in paired_t]
+            leftover_b = [j for j in range(len(boxes)) if j not in paired_b]
+            if leftover_t and leftover_b:
+                dist = centroid_distance_matrix(track_boxes[leftover_t], boxes[leftover_b])
+                pairs += [(leftover_t[r], leftover_b[c])
+                          for r, c in greedy_match(-dist, dist <= self.max_centroid_distance)]
+            for ti, bi in pairs:
+                self.tracks[ti].add(boxes[bi], float(confidences[bi]), self.frame_index, context)
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+
+        ended = []
+        alive = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+            too_long = self.max_frames and self.frame_index - track.first_frame + 1 >= self.max_frames
+            (ended if track.missed > self.max_missed or too_long else alive).append(track)
+        for j in range(len(boxes)):
+            if j not in matched_boxes:
+                alive.append(Track(next(self._ids), boxes[j], float(confidences[j]), self.frame_index, context))
+                self.counters["tracks"] += 1
+        self.tracks = alive
+        return self._finish(ended)
+
+    def flush(self):
+        """Ends every live track (e.g. when the stream stops) and returns the reportable ones."""
+        ended, self.tracks = self.tracks, []
+        return self._finish(ended)
+
+    def _finish(self, tracks):
+        done = []
+        for track in tracks:
+            if track.hits >= self.min_hits:
+                self.counters["reported"] += 1
+                done.append(track.summary())
+            else:
+                self.counters["discarded"] += 1
+        return done
+
+    def summary(self):
+        c = self.counters
+        return (f"{c['detections']} detections | {c['tracks']} tracks | "
+                f"{c['reported']} fused reports | {c['discarded']} discarded as flicker")
@@ -0,0 +1,655 @@
+"""
+Offline end-to-end benchmark: no network, no webcam, no Firebase project.
+
+- backend:  the Flask app runs in-process (test client) on a throwaway SQLite
+            file; synthetic hazards are replayed at increasing rates through
+            /report_hazard and /report_hazards, then GET latency of /hazards
+            and /clusters (and of an aggregate /tiles tile) is measured as the
+            store grows. A pre-filled outbox
+            is replayed over loopback HTTP (gzip vs plain JSON, with part of it
+            already stored) to measure reconnect drain throughput. Startup
+            cost is compared for large stores: indexing every row vs
+            memory-mapping a columnar snapshot (backend/snapshot.py). Months
+            of simulated operation show the hot store and full-scan latency
+            with and without daily expiry and compaction (backend/lifecycle.py).
+- service:  service.process_report_job, and the service's batched path
+            (ReportQueue -> outbox -> one commit per batch), run against the
+            in-memory report sink with a configurable round trip.
+- detector: synthetic frame streams (static and moving scenes) go through the
+            detector's infer() step with and without the frame gate. Cold
+            start is timed in fresh processes: importing the detector, loading
+            the model, first and second frame, with and without warm-up, and
+            attached to a running model server (common/model_server.py).
+
+Results are written as JSON so two commits can be compared:
+    python benchmark.py --output baseline.json
+    python benchmark.py --quick --compare baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import secrets
+import itertools
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+
+import numpy as np
+
+DEMO_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTOTYPE_DIR = os.path.dirname(DEMO_DIR)
+ROOT_DIR = os.path.dirname(PROTOTYPE_DIR)
+SERVICE_DIR = os.path.join(ROOT_DIR, "runs", "pothole-detector")
+sys.path.insert(0, os.path.join(PROTOTYPE_DIR, "common"))
+sys.path.insert(0, os.path.join(PROTOTYPE_DIR, "detection"))
+
+SEED = 1234
+CENTER = (12.9229, 80.1275)   # Tambaram, same start point as the detectors
+SPREAD_DEG = 0.05             # synthetic hazards fall within ~5 km of CENTER
+INGEST_RATES = (100, 500, 2000, 0)   # reports/s offered; 0 = as fast as possible
+INGEST_REPORTS = 500                 # reports per rate step
+BULK_BATCH_SIZE = 20
+STORE_SIZES = (1000, 5000, 20000)
+GET_REPEATS = 20
+REPLAY_REPORTS = 2000
+REPLAY_BATCH_SIZE = 50
+REPLAY_DUPLICATE_SHARE = 0.25        # part of the backlog the backend already stored
+STARTUP_SIZES = (100000, 300000)
+LIFECYCLE_MONTHS = 6
+LIFECYCLE_PER_DAY = 200              # reports per simulated day
+SERVICE_REPORTS = 50
+SERVICE_LATENCIES_MS = (0, 50)       # simulated Firestore/Storage round trip
+DETECTOR_FRAMES = 200
+COLD_START_RUNS = 3                  # fresh processes per startup mode
+FRAME_SHAPE = (480, 640, 3)
+
+QUICK = {
+    "INGEST_REPORTS": 100,
+    "STORE_SIZES": (500, 2000),
+    "GET_REPEATS": 5,
+    "REPLAY_REPORTS": 400,
+    "STARTUP_SIZES": (20000,),
+    "LIFECYCLE_MONTHS": 3,
+    "LIFECYCLE_PER_DAY": 50,
+    "SERVICE_REPORTS": 10,
+    "DETECTOR_FRAMES": 40,
+    "COLD_START_RUNS": 1,
+}
+
+
+def latency_summary(samples):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds."""
+    ms = np.array(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def synthetic_hazards(n, rng):
+    now = time.time()
+    return [{
+        "latitude": CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "longitude": CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "confidence": round(rng.uniform(0.4, 0.99), 3),
+        "image_filename": f"event_bench_{i}.jpg",
+        "timestamp": now - n + i,  # distinct, in order, none in the future
+    } for i in range(n)]
+
+
+# --- Backend ---
+
+def load_backend_app(db_path):
+    """Imports backend/app.py against a throwaway database."""
+    os.environ["HAZARD_DB"] = db_path
+    sys.path.insert(0, os.path.join(PROTOTYPE_DIR, "backend"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    return app
+
+
+def paced(items, rate):
+    """Yields items no faster than `rate` per second (0 = unpaced)."""
+    start = time.perf_counter()
+    for i, item in enumerate(items):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield item
+
+
+def bench_ingest(app, rng, rates=INGEST_RATES, n=INGEST_REPORTS, batch_size=BULK_BATCH_SIZE):
+    client = app.app.test_client()
+    rows = []
+    for rate in rates:
+        for mode in ("single", "bulk"):
+            hazards = synthetic_hazards(n, rng)
+            if mode == "single":
+                calls = [("/report_hazard", h) for h in hazards]
+            else:
+                calls = [("/report_hazards", hazards[i:i + batch_size]) for i in range(0, n, batch_size)]
+            # Bulk requests are paced so that the offered rate is still in reports/s
+            request_rate = rate / (1 if mode == "single" else batch_size)
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for path, body in paced(calls, request_rate):
+                    t0 = time.perf_counter()
+                    resp = client.post(path, json=body)
+                    latencies.append(time.perf_counter() - t0)
+                    errors += resp.status_code != 201
+            elapsed = time.perf_counter() - started
+            row = {"offered_rate": rate, "mode": mode, "reports": n, "errors": errors,
+                   "achieved_reports_per_s": round(n / elapsed, 1)}
+            row.update(latency_summary(latencies))
+            rows.append(row)
+            print(f" [INGEST] {mode:<6} offered {rate or 'max':>5}/s -> {row['achieved_reports_per_s']:>8.1f} reports/s "
+                  f"| p95 {row['p95_ms']:.2f} ms | errors {errors}")
+    return rows
+
+
+def bench_outbox_replay(app, rng, tmp, n=REPLAY_REPORTS, batch_size=REPLAY_BATCH_SIZE):
+    """Drains a pre-filled outbox into the app over loopback HTTP, as after a reconnect."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from outbox import Outbox
+    from batch_client import BatchSender
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/report_hazards"
+    client = app.app.test_client()
+    rows = []
+    try:
+        for compress in (True, False):
+            hazards = synthetic_hazards(n, rng)
+            for i, hazard in enumerate(hazards):
+                hazard["report_id"] = f"bench-{compress}-{i}"
+            already = hazards[:int(n * REPLAY_DUPLICATE_SHARE)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(0, len(already), batch_size):
+                    client.post("/report_hazards", json=already[i:i + batch_size])
+            outbox = Outbox(os.path.join(tmp, f"outbox_{compress}.db"), name=f"bench_{compress}")
+            outbox.put(hazards)
+            before = app.store.count()
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                sender = BatchSender(url, outbox, batch_size=batch_size, max_wait=0, max_rate=0, compress=compress)
+                while outbox.count() and time.perf_counter() - started < 120:
+                    time.sleep(0.01)
+                sender.close(timeout=10)
+            elapsed = time.perf_counter() - started
+
+            row = {"compress": compress, "reports": n, "batch_size": batch_size,
+                   "reports_per_s": round(n / elapsed, 1), "requests": sender.stats["requests"],
+                   "kb_sent": round(sender.stats["bytes_sent"] / 1024, 1),
+                   "stored": app.store.count() - before, "left_in_outbox": outbox.count()}
+            rows.append(row)
+            print(f" [REPLAY] {'gzip' if compress else 'json':<4} {row['reports_per_s']:>8.1f} reports/s | "
+                  f"{row['kb_sent']:.0f} KB in {row['requests']} requests | {row['stored']} new of {n}")
+    finally:
+        server.shutdown()
+    return rows
+
+
+def bench_get_latency(app, rng, sizes=STORE_SIZES, repeats=GET_REPEATS):
+    from tiles import tile_fraction
+
+    client = app.app.test_client()
+    lat, lon = CENTER
+    u, v = tile_fraction(lat, lon)
+    queries = {
+        "hazards_all": "/hazards",
+        "hazards_bbox_1km": f"/hazards?bbox={lon - 0.005},{lat - 0.005},{lon + 0.005},{lat + 0.005}",
+        "hazards_radius_500m": f"/hazards?lat={lat}&lon={lon}&radius=500",
+        "clusters_all": "/clusters",
+        # One z11 tile (~20 km) summarizes the whole synthetic city
+        "tile_z11": f"/tiles/11/{int(u * 2 ** 11)}/{int(v * 2 ** 11)}",
+    }
+    rows = []
+    for size in sizes:
+        missing = size - app.store.count()
+        if missing > 0:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(0, missing, 500):
+                    app.save_hazards(synthetic_hazards(min(500, missing - i), rng))
+        row = {"store_size": app.store.count()}
+        for name, url in queries.items():
+            samples = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                resp = client.get(url)
+                samples.append(time.perf_counter() - t0)
+                assert resp.status_code == 200, (url, resp.status_code)
+            row[name] = latency_summary(samples)
+        rows.append(row)
+        print(f" [GET] {row['store_size']:>6} hazards | " + " | ".join(
+            f"{name} p95 {row[name]['p95_ms']:.2f} ms" for name in queries))
+    return rows
+
+
+def bench_startup(rng, tmp, sizes=STARTUP_SIZES):
+    """
+    Time and Python heap to get a queryable index and tiles for a large store:
+    indexing every row (no snapshot) vs mapping a snapshot. Mapped pages live
+    in the OS page cache, shared by all workers, and are not in the heap figure.
+    """
+    import tracemalloc
+    from hazard_store import HazardStore
+    from spatial_index import GridIndex, LayeredIndex
+    from tiles import TileAggregator
+    import snapshot
+
+    def measure(load):
+        t0 = time.perf_counter()
+        result = load()
+        elapsed = time.perf_counter() - t0
+        del result
+        # Heap in a second run: tracing slows allocation down several times
+        tracemalloc.start()
+        result = load()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, round(elapsed, 4), round(peak / 2 ** 20, 1)
+
+    def full_load():
+        index, tiles = GridIndex(), TileAggregator()
+        for hazard in store.all():
+            index.insert(hazard)
+            tiles.add(hazard)
+        return index
+
+    def snapshot_load():
+        snap = snapshot.Snapshot(path)
+        tiles = TileAggregator()
+        tiles.load_base(*snap.tile_bins, tile_count=snap.meta["tile_count"])
+        return LayeredIndex(snap.index())
+
+    rows = []
+    for size in sizes:
+        db_path = os.path.join(tmp, f"startup_{size}.db")
+        path = db_path + ".snapshot"
+        store = HazardStore(db_path)
+        for i in range(0, size, 50000):
+            store.add_many(synthetic_hazards(min(50000, size - i), rng))
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            snapshot.build(store, path)
+        build_s = time.perf_counter() - t0
+        full, full_s, full_mb = measure(full_load)
+        mapped, snap_s, snap_mb = measure(snapshot_load)
+        assert len(full) == len(mapped) == size
+        lat, lon = CENTER
+        assert full.query_bbox(lat, lon, lat + 0.005, lon + 0.005) == mapped.query_bbox(lat, lon, lat + 0.005, lon + 0.005)
+        row = {
+            "store_size": size,
+            "full_load_s": full_s,
+            "full_load_heap_mb": full_mb,
+            "snapshot_build_s": round(build_s, 3),
+            "snapshot_load_s": snap_s,
+            "snapshot_load_heap_mb": snap_mb,
+            "snapshot_disk_mb": round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2 ** 20, 1),
+        }
+        rows.append(row)
+        print(f" [STARTUP] {size:>7} hazards | full load {full_s:.2f}s, {full_mb:.0f} MB heap | "
+              f"snapshot {snap_s * 1000:.1f} ms, {snap_mb:.1f} MB heap ({row['snapshot_disk_mb']} MB on disk, "
+              f"built in {build_s:.2f}s)")
+    return rows
+
+
+def bench_lifecycle(rng, tmp, months=LIFECYCLE_MONTHS, per_day=LIFECYCLE_PER_DAY):
+    """
+    Simulated months of reports into two stores, one of them maintained daily
+    (lifecycle.run_maintenance at the simulated time). At every month's end:
+    hot hazards and clusters, database size, and the latency of a full
+    /hazards scan (store.all()).
+    """
+    import lifecycle
+    from hazard_store import HazardStore
+    from clustering import ClusterEngine
+
+    day = 86400
+    start = time.time() - months * 30 * day
+    stores = {name: HazardStore(os.path.join(tmp, f"lifecycle_{name}.db")) for name in ("kept", "maintained")}
+    rows = []
+    for d in range(months * 30):
+        now = start + d * day
+        batch = [dict(h, timestamp=now + i) for i, h in enumerate(synthetic_hazards(per_day, rng))]
+        for name, store in stores.items():
+            with store.write_lock():
+                store.add_many([dict(h) for h in batch])
+                ClusterEngine(store).load()
+        with contextlib.redirect_stdout(io.StringIO()):
+            lifecycle.run_maintenance(stores["maintained"], os.path.join(tmp, "lifecycle.archive"), now=now + day)
+        if (d + 1) % 30:
+            continue
+        row = {"month": (d + 1) // 30}
+        for name, store in stores.items():
+            samples = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                store.all()
+                samples.append(time.perf_counter() - t0)
+            row[name] = {
+                "hazards": store.count(),
+                "clusters": len(store.all_clusters()),
+                "db_mb": round(sum(os.path.getsize(store.db_path + ext) for ext in ("", "-wal")
+                                   if os.path.exists(store.db_path + ext)) / 2 ** 20, 2),
+                "full_scan": latency_summary(samples),
+            }
+        rows.append(row)
+        print(f" [LIFECYCLE] month {row['month']:>2} | " + " | ".join(
+            f"{name}: {row[name]['hazards']:>6} hazards, {row[name]['clusters']:>5} clusters, "
+            f"{row[name]['db_mb']:>5} MB, scan p50 {row[name]['full_scan']['p50_ms']:>7.2f} ms"
+            for name in stores))
+    return rows
+
+
+# --- Service ---
+
+def load_service():
+    """Imports runs/pothole-detector/service.py with the in-memory report sink (no Firebase needed)."""
+    os.environ.setdefault("REPORT_SINK", "memory")
+    sys.path.insert(0, SERVICE_DIR)
+    import service
+    return service
+
+
+def bench_service(n=SERVICE_REPORTS, latencies_ms=SERVICE_LATENCIES_MS):
+    from reporter import ReportQueue, BLOCK
+    from outbox import Outbox, OutboxReplayer
+    from image_store import LocalImageStore
+    from report_sinks import MemorySink
+
+    service = load_service()
+    frame = np.random.RandomState(SEED).randint(0, 255, FRAME_SHAPE, dtype=np.uint8)
+    job_ids = itertools.count()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        service.image_store = LocalImageStore(tmp, fmt=service.EVENT_IMAGE_FORMAT, quality=service.EVENT_IMAGE_QUALITY)
+        for latency_ms in latencies_ms:
+            # One report end to end on the caller's thread: upload, then one document write
+            service.sink = MemorySink(latency_ms / 1000)
+            samples = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(min(n, 10)):
+                    t0 = time.perf_counter()
+                    service.process_report_job(_service_job(frame, next(job_ids)))
+                    samples.append(time.perf_counter() - t0)
+
+            # Throughput through the service's own pipeline: workers journal, the
+            # replayer uploads each batch's images concurrently and commits it at once
+            service.sink = sink = MemorySink(latency_ms / 1000)
+            outbox = Outbox(os.path.join(tmp, f"outbox_{latency_ms}.db"), name=f"bench-{latency_ms}")
+            replayer = OutboxReplayer(outbox, service.write_reports, batch_size=service.REPORT_BATCH_SIZE,
+                                      max_wait=service.REPORT_BATCH_WAIT, max_rate=0, name=f"bench-{latency_ms}")
+            reporter = ReportQueue(lambda job: service.journal_report(job, outbox, replayer),
+                                   workers=service.REPORT_WORKERS, maxsize=service.REPORT_QUEUE_SIZE,
+                                   policy=BLOCK, name=f"bench-{latency_ms}")
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(n):
+                    reporter.submit(_service_job(frame, next(job_ids)))
+                reporter.close(timeout=300)
+                replayer.close(timeout=300)
+            elapsed = time.perf_counter() - started
+
+            row = {"backend_latency_ms": latency_ms, "reports": n, "workers": service.REPORT_WORKERS,
+                   "reports_per_s": round(n / elapsed, 2), "sent": replayer.stats["sent"],
+                   "documents": len(sink.documents.get("hazards", {})), "commits": sink.stats["commits"],
+                   "uploads": sink.stats["uploads"]}
+            row.update(latency_summary(samples))
+            rows.append(row)
+            print(f" [SERVICE] backend latency {latency_ms:>3} ms | one report p50 {row['p50_ms']:.1f} ms | "
+                  f"{row['reports_per_s']:.1f} reports/s with {row['workers']} workers, "
+                  f"{row['documents']} documents in {row['commits']} commits")
+    return rows
+
+
+def _service_job(frame, job_id):
+    """A report job with a shifted copy of frame, so the image store cannot deduplicate it."""
+    return {
+        "frame": np.roll(frame, job_id + 1, axis=1),
+        "latitude": CENTER[0],
+        "longitude": CENTER[1],
+        "confidence": 0.9,
+        "is_simulated": True,
+    }
+
+
+# --- Detector ---
+
+def synthetic_frames(kind, n, rng, shape=FRAME_SHAPE):
+    """'static': one scene with sensor noise; 'moving': a texture scrolling past like a road."""
+    texture = rng.randint(0, 255, (shape[0], shape[1] * 2, shape[2]), dtype=np.uint8)
+    for i in range(n):
+        if kind == "static":
+            noise = rng.randint(-2, 3, shape).astype(np.int16)
+            yield np.clip(texture[:, :shape[1]].astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        else:
+            offset = (i * 16) % shape[1]
+            yield np.ascontiguousarray(texture[:, offset:offset + shape[1]])
+
+
+def bench_detector(n=DETECTOR_FRAMES, model_path=None):
+    import detect_potholes as dp
+    from detection_reports import max_confidence
+    from inference_backends import load_backend
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = load_backend(model_path) if model_path else dp.load_model()
+    model(np.zeros(FRAME_SHAPE, dtype=np.uint8), verbose=False)  # warm-up
+    rows = []
+    for kind in ("static", "moving"):
+        for gated in (False, True):
+            rng = np.random.RandomState(SEED)
+            frame_gate = dp.create_frame_gate() if gated else None
+            samples = []
+            started = time.perf_counter()
+            for frame in synthetic_frames(kind, n, rng):
+                t0 = time.perf_counter()
+                result = dp.infer(model, frame, frame_gate)
+                max_confidence(result, dp.CONFIDENCE_THRESHOLD)
+                samples.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - started
+            row = {"stream": kind, "frame_gate": gated, "frames": n, "fps": round(n / elapsed, 2),
+                   "inferred": frame_gate.counters["inferred"] if frame_gate else n}
+            row.update(latency_summary(samples))
+            rows.append(row)
+            print(f" [DETECTOR] {kind:<6} gate {'on ' if gated else 'off'} | {row['fps']:>7.1f} FPS | "
+                  f"{row['inferred']}/{n} inferred")
+    return rows
+
+
+# Runs in a fresh interpreter: argv = mode (cold / warm / attach), model
+# server address, model paths. Prints its timings as one JSON line.
+COLD_START_PROBE = """
+import io, sys, json, time, contextlib
+started = time.perf_counter()
+sys.path[:0] = {paths!r}
+import numpy as np
+import detect_potholes
+timings = {{"import_ms": (time.perf_counter() - started) * 1000}}
+mode, address, models = sys.argv[1], sys.argv[2], sys.argv[3:]
+with contextlib.redirect_stdout(io.StringIO()):
+    t0 = time.perf_counter()
+    if mode == "attach":
+        from model_server import attach
+        model = attach(address)
+        if model is None:
+            sys.exit("could not attach to the model server")
+    else:
+        import ultralytics
+        timings["ultralytics_import_ms"] = (time.perf_counter() - t0) * 1000
+        from inference_backends import load_first_available, warm_up
+        model, _ = load_first_available(models)
+        if mode == "warm":
+            warm_up(model)
+timings["ready_ms"] = (time.perf_counter() - t0) * 1000
+frame = np.zeros({shape!r}, dtype=np.uint8)
+for key in ("first_frame_ms", "second_frame_ms"):
+    t0 = time.perf_counter()
+    model(frame, verbose=False)
+    timings[key] = (time.perf_counter() - t0) * 1000
+timings["total_ms"] = (time.perf_counter() - started) * 1000
+timings["ultralytics_loaded"] = "ultralytics" in sys.modules
+print(json.dumps(timings))
+"""
+
+
+def _cold_start_probe(mode, address, models, env):
+    code = COLD_START_PROBE.format(paths=[os.path.join(PROTOTYPE_DIR, "common"),
+                                          os.path.join(PROTOTYPE_DIR, "detection")], shape=FRAME_SHAPE)
+    done = subprocess.run([sys.executable, "-c", code, mode, address] + models,
+                          capture_output=True, text=True, timeout=600, env=env)
+    if done.returncode != 0:
+        raise RuntimeError(f"{mode} start failed: {done.stderr.strip().splitlines()[-1:]}")
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def bench_cold_start(tmp, runs=COLD_START_RUNS, model_path=None):
+    import detect_potholes as dp
+
+    models = [model_path] if model_path else [dp.MODEL_NAME, "yolov8n.pt"]
+    # A throwaway key, and the socket in tmp (private: mkdtemp creates it 0700)
+    env = dict(os.environ, MODEL_SERVER_KEY=secrets.token_hex(32))
+    address = os.path.join(tmp, "model.sock") if hasattr(os, "fork") else "127.0.0.1:6071"
+    server = subprocess.Popen([sys.executable, os.path.join(PROTOTYPE_DIR, "common", "model_server.py"),
+                               "--address", address, "--model"] + models,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    rows = []
+    try:
+        for mode in ("cold", "warm", "attach"):
+            if mode == "attach":
+                # The server prints its address once it listens
+                for line in server.stdout:
+                    if "Serving" in line:
+                        break
+                else:
+                    raise RuntimeError(f"model server exited with code {server.wait()}")
+            samples = [_cold_start_probe(mode, address, models, env) for _ in range(runs)]
+            row = {"mode": mode, "runs": runs}
+            for key in samples[0]:
+                values = sorted(sample[key] for sample in samples)
+                row[key] = values[len(values) // 2] if key == "ultralytics_loaded" else round(values[len(values) // 2], 1)
+            rows.append(row)
+            print(f" [COLD START] {mode:<6} | import {row['import_ms']:>7.1f} ms | ready {row['ready_ms']:>8.1f} ms | "
+                  f"first frame {row['first_frame_ms']:>7.1f} ms | second {row['second_frame_ms']:>6.1f} ms")
+    finally:
+        server.terminate()
+        server.wait()
+    return rows
+
+
+# --- Baseline file ---
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(value, prefix=""):
+    """{"a": [{"b": 1}]} -> {"a[0].b": 1}, numbers only."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else k))
+        return out
+    if isinstance(value, list):
+        out = {}
+        for i, v in enumerate(value):
+            out.update(flatten(v, f"{prefix}[{i}]"))
+        return out
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(current, baseline, threshold=0.10):
+    """Prints every metric that moved by more than threshold relative to the baseline."""
+    old = flatten(baseline.get("results", {}))
+    new = flatten(current["results"])
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} (changes > {threshold:.0%}):")
+    changed = 0
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        delta = (new[key] - old[key]) / abs(old[key])
+        if abs(delta) > threshold:
+            changed += 1
+            print(f"  {key:<60} {old[key]:>12} -> {new[key]:>12} ({delta:+.0%})")
+    if not changed:
+        print("  no changes")
+
+
+def run(sections, quick=False, model_path=None):
+    if quick:
+        globals().update(QUICK)
+    rng = random.Random(SEED)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if "backend" in sections:
+            app = load_backend_app(os.path.join(tmp, "bench.db"))
+            results["ingest"] = bench_ingest(app, rng, n=INGEST_REPORTS)
+            results["get_latency"] = bench_get_latency(app, rng, sizes=STORE_SIZES, repeats=GET_REPEATS)
+            results["outbox_replay"] = bench_outbox_replay(app, rng, tmp, n=REPLAY_REPORTS)
+            results["startup"] = bench_startup(rng, tmp, sizes=STARTUP_SIZES)
+            results["lifecycle"] = bench_lifecycle(rng, tmp, months=LIFECYCLE_MONTHS, per_day=LIFECYCLE_PER_DAY)
+        for section, name, fn, kwargs in (
+                ("service", "service", bench_service, {"n": SERVICE_REPORTS}),
+                ("detector", "detector", bench_detector, {"n": DETECTOR_FRAMES, "model_path": model_path}),
+                ("detector", "cold_start", bench_cold_start, {"tmp": tmp, "runs": COLD_START_RUNS,
+                                                              "model_path": model_path})):
+            if section not in sections:
+                continue
+            try:
+                results[name] = fn(**kwargs)
+            except Exception as e:
+                # e.g. no model weights or ultralytics in this environment; the rest still runs
+                print(f" [WARN] {name} benchmark skipped: {e}")
+                results[name] = {"skipped": str(e)}
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+        "quick": quick,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the hazard pipeline.")
+    parser.add_argument("--sections", nargs="+", default=["backend", "service", "detector"],
+                        choices=["backend", "service", "detector"])
+    parser.add_argument("--quick", action="store_true", help="smaller runs for a fast sanity check")
+    parser.add_argument("--model", help="model for the detector section (default: detect_potholes.MODEL_NAME)")
+    parser.add_argument("--output", default="benchmark_baseline.json", help="where to write the results")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    args = parser.parse_args()
+
+    report = run(args.sections, quick=args.quick, model_path=args.model)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
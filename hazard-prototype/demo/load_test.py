@@ -0,0 +1,221 @@
+"""
+HTTP load test of the production backend (backend/serve.py).
+
+For every worker count the server is started on a throwaway database, seeded
+with synthetic hazards, and driven by client processes issuing a map-like mix:
+viewport GETs of /hazards and /clusters, change-feed polls and bulk reports.
+Reports requests/s and latency percentiles per worker count, then checks that
+every worker answers with the same data. --streams keeps that many
+/hazards/stream (SSE) subscribers open meanwhile, like map dashboards; the
+API mix must still be served. Worker counts above the CPU count say nothing
+about core scaling and are flagged.
+
+    python load_test.py --workers 1 2 4 --clients 8 --duration 20
+    python load_test.py --workers 2 --streams 16
+    python load_test.py --server waitress --workers 1 --output load.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import numpy as np
+import requests
+
+DEMO_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVE_SCRIPT = os.path.join(os.path.dirname(DEMO_DIR), "backend", "serve.py")
+
+CENTER = (12.9229, 80.1275)   # Tambaram, same start point as the detectors
+SPREAD_DEG = 0.05
+VIEWPORT_DEG = 0.01           # ~1 km map viewport
+SEED_HAZARDS = 2000
+REPORT_BATCH = 5
+# Share of each request type in the mix (the rest are viewport GETs of /hazards)
+CLUSTERS_SHARE = 0.3
+FEED_SHARE = 0.1
+REPORT_SHARE = 0.1
+CONSISTENCY_PROBES = 20
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_hazards(n, rng):
+    return [{
+        "latitude": CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "longitude": CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "confidence": round(rng.uniform(0.4, 0.99), 3),
+        "timestamp": time.time(),
+    } for _ in range(n)]
+
+
+def start_server(workers, threads, server, db_path):
+    port = free_port()
+    env = dict(os.environ, HAZARD_DB=db_path)
+    cmd = [sys.executable, SERVE_SCRIPT, "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--threads", str(threads)]
+    if server:
+        cmd += ["--server", server]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base}/clusters", timeout=1).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"Server did not come up: {' '.join(cmd)}")
+
+
+def client(base, duration, seed, out):
+    """One client process: issues the request mix for `duration` seconds."""
+    rng = random.Random(seed)
+    session = requests.Session()
+    latencies, errors, cursor = [], 0, 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        lat = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        lon = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        bbox = f"{lon},{lat},{lon + VIEWPORT_DEG},{lat + VIEWPORT_DEG}"
+        roll = rng.random()
+        t0 = time.perf_counter()
+        try:
+            if roll < REPORT_SHARE:
+                resp = session.post(f"{base}/report_hazards", json=synthetic_hazards(REPORT_BATCH, rng), timeout=30)
+                ok = resp.status_code == 201
+            elif roll < REPORT_SHARE + FEED_SHARE:
+                resp = session.get(f"{base}/hazards", params={"since": cursor}, timeout=30)
+                ok = resp.status_code == 200
+                if ok:
+                    cursor = resp.json()["cursor"]
+            elif roll < REPORT_SHARE + FEED_SHARE + CLUSTERS_SHARE:
+                resp = session.get(f"{base}/clusters", params={"bbox": bbox}, timeout=30)
+                ok = resp.status_code == 200
+            else:
+                resp = session.get(f"{base}/hazards", params={"bbox": bbox}, timeout=30)
+                ok = resp.status_code == 200
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - t0)
+        errors += not ok
+    out.put((latencies, errors))
+
+
+def check_consistency(base, probes=CONSISTENCY_PROBES):
+    """Every worker must return the same hazards and clusters for the same area."""
+    bbox = f"{CENTER[1] - SPREAD_DEG},{CENTER[0] - SPREAD_DEG},{CENTER[1] + SPREAD_DEG},{CENTER[0] + SPREAD_DEG}"
+    answers = set()
+    for _ in range(probes):
+        # A new connection per probe, so the requests spread over the workers
+        hazards = requests.get(f"{base}/hazards", params={"bbox": bbox}, timeout=30).json()
+        found = requests.get(f"{base}/clusters", params={"bbox": bbox}, timeout=30).json()
+        answers.add((len(hazards), len(found), sum(c["report_count"] for c in found)))
+    return len(answers) == 1, sorted(answers)
+
+
+def open_streams(base, n):
+    """Opens n SSE subscribers, each on its own connection. Returns (open responses, refused count)."""
+    streams, refused = [], 0
+    for _ in range(n):
+        try:
+            resp = requests.get(f"{base}/hazards/stream", stream=True, timeout=10)
+        except requests.RequestException:
+            refused += 1
+            continue
+        if resp.status_code == 200:
+            streams.append(resp)
+        else:
+            refused += 1
+            resp.close()
+    return streams, refused
+
+
+def run_step(workers, threads, server, clients, duration, seed_hazards, streams=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, base = start_server(workers, threads, server, os.path.join(tmp, "load.db"))
+        try:
+            rng = random.Random(workers)
+            seed = synthetic_hazards(seed_hazards, rng)
+            for i in range(0, len(seed), 500):
+                requests.post(f"{base}/report_hazards", json=seed[i:i + 500], timeout=60)
+
+            subscribers, refused = open_streams(base, streams)
+            ctx = multiprocessing.get_context("spawn")
+            out = ctx.Queue()
+            procs = [ctx.Process(target=client, args=(base, duration, workers * 1000 + i, out))
+                     for i in range(clients)]
+            started = time.perf_counter()
+            for p in procs:
+                p.start()
+            results = [out.get() for _ in procs]
+            for p in procs:
+                p.join()
+            elapsed = time.perf_counter() - started
+            for resp in subscribers:
+                resp.close()
+
+            consistent, answers = check_consistency(base)
+        finally:
+            proc.terminate()
+            proc.wait(30)
+
+    latencies = np.array([lat for lats, _ in results for lat in lats]) * 1000
+    row = {
+        "workers": workers,
+        "threads": threads,
+        "clients": clients,
+        "requests": int(latencies.size),
+        "errors": sum(e for _, e in results),
+        "requests_per_s": round(latencies.size / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "consistent": consistent,
+        "streams_open": len(subscribers),
+        "streams_refused": refused,
+        "oversubscribed": workers > (os.cpu_count() or 1),
+    }
+    print(f" [LOAD] {workers} workers x {threads} threads | {row['requests_per_s']:>8.1f} req/s | "
+          f"p50 {row['p50_ms']:.1f} ms | p95 {row['p95_ms']:.1f} ms | p99 {row['p99_ms']:.1f} ms | "
+          f"errors {row['errors']} | consistent {consistent} {answers if not consistent else ''}"
+          + (f" | streams {len(subscribers)} open, {refused} refused" if streams else ""))
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the multi-worker hazard backend.")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--server", choices=["gunicorn", "waitress", "werkzeug"])
+    parser.add_argument("--clients", type=int, default=8, help="client processes")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per worker count")
+    parser.add_argument("--seed-hazards", type=int, default=SEED_HAZARDS)
+    parser.add_argument("--streams", type=int, default=0, help="SSE subscribers held open during each step")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()} | {args.clients} client processes | {args.duration:.0f}s per step")
+    if max(args.workers) > (os.cpu_count() or 1):
+        print(f" [WARN] More workers than CPUs: those steps share cores (and the clients'), "
+              f"so they do not measure scaling")
+    rows = [run_step(w, args.threads, args.server, args.clients, args.duration, args.seed_hazards, args.streams)
+            for w in args.workers]
+    base = rows[0]["requests_per_s"] or 1e-9
+    for row in rows:
+        print(f"  {row['workers']} workers: {row['requests_per_s'] / base:.2f}x the throughput of {rows[0]['workers']}"
+              + (" (more workers than CPUs, not a scaling result)" if row["oversubscribed"] else ""))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": rows}, f, indent=2)
+        print(f"Wrote {args.output}")
@@ -34,13 +34,59 @@ def test_backend():
         print(f"FAILED to post: {e}")
         return
 
-    # 3. Verify it was stored
+    # 3. Test POST /report_hazards (bulk)
+    batch = [dict(payload, latitude=payload["latitude"] + i * 0.001) for i in range(5)]
+    try:
+        resp = requests.post(f"{BASE_URL}/report_hazards", json=batch)
+        print(f"POST /report_hazards: {resp.status_code}")
+        assert resp.status_code == 201
+        assert len(resp.json()["hazard_ids"]) == len(batch)
+        print(" -> Response:", resp.json())
+    except Exception as e:
+        print(f"FAILED to post batch: {e}")
+        return
+
+    # 4. Verify it was stored
     resp = requests.get(f"{BASE_URL}/hazards")
     data = resp.json()
     print(f"Final GET /hazards count: {len(data)}")
-    assert len(data) > 0
+    assert len(data) > len(batch)
     print(" -> Data:", data)
-    
+
+    # 5. Change feed: an unchanged store answers 304, and since=<cursor> returns only new hazards
+    resp = requests.get(f"{BASE_URL}/hazards", headers={"If-None-Match": resp.headers["ETag"]})
+    print(f"Conditional GET /hazards: {resp.status_code}")
+    assert resp.status_code == 304
+    cursor = resp.headers["X-Hazard-Cursor"]
+    requests.post(f"{BASE_URL}/report_hazard", json=payload)
+    resp = requests.get(f"{BASE_URL}/hazards", params={"since": cursor})
+    print(f"GET /hazards?since={cursor}: {resp.status_code}")
+    assert resp.status_code == 200
+    assert len(resp.json()["hazards"]) == 1
+    print(" -> Changes:", resp.json())
+
+    # 6. Replayed reports (same report_id) are acknowledged but stored only once
+    replay = [dict(payload, report_id=f"smoke-{time.time()}")]
+    first = requests.post(f"{BASE_URL}/report_hazards", json=replay).json()
+    again = requests.post(f"{BASE_URL}/report_hazards", json=replay).json()
+    print(f"Replayed batch: {again}")
+    assert again["duplicates"] == 1
+    assert again["hazard_ids"] == first["hazard_ids"]
+
+    # 7. Invalid records are rejected one by one; the rest of the batch is stored
+    mixed = [payload, dict(payload, latitude="x"), dict(payload, longitude=float("inf"))]
+    resp = requests.post(f"{BASE_URL}/report_hazards", data=json.dumps(mixed), headers={"Content-Type": "application/json"})
+    print(f"Batch with invalid records: {resp.status_code} -> {resp.json()}")
+    assert resp.status_code == 201
+    assert [r["index"] for r in resp.json()["rejected"]] == [1, 2]
+    assert resp.json()["hazard_ids"][0] is not None and resp.json()["hazard_ids"][1:] == [None, None]
+
+    # 8. The world tile aggregates every stored hazard
+    resp = requests.get(f"{BASE_URL}/tiles/0/0/0")
+    print(f"GET /tiles/0/0/0: {resp.status_code} -> {resp.json()['count']} hazards")
+    assert resp.status_code == 200
+    assert resp.json()["count"] == len(requests.get(f"{BASE_URL}/hazards").json())
+
     print("SUCCESS: Backend is working!")
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from location import TrackReader
+
+# The same two fixes, 1 s apart, in each track format
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="12.971600" lon="77.594600"><time>2024-05-01T10:00:00Z</time></trkpt>
+    <trkpt lat="12.971700" lon="77.594800"><time>2024-05-01T10:00:01Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+CSV = """timestamp,latitude,longitude,speed
+2024-05-01T10:00:00Z,12.971600,77.594600,5.0
+2024-05-01T10:00:01Z,12.971700,77.594800,5.0
+"""
+NMEA = """$GPRMC,100000.00,A,1258.29600,N,07735.67600,E,9.72,0.0,010524,,,A
+$GPRMC,100001.00,A,1258.30200,N,07735.68800,E,9.72,0.0,010524,,,A
+"""
+START = 1714557600.0  # 2024-05-01T10:00:00Z
+
+def read_track(name, text):
+    """Reads a track file through TrackReader, as --gps does."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        reader = TrackReader(path).start()
+        assert reader.wait(10), f"{name} was not read"
+        return reader
+
+def test_location():
+    print("Testing track formats...")
+    for name, text in (("drive.gpx", GPX), ("drive.csv", CSV), ("drive.nmea", NMEA)):
+        reader = read_track(name, text)
+        print(f" -> {reader.summary()}")
+        assert reader.error is None, reader.error
+        assert reader.stats["fixes"] == 2
+        lat, lon = reader.position(START + 0.5)
+        assert abs(lat - 12.97165) < 1e-6 and abs(lon - 77.5947) < 1e-6, (lat, lon)
+    print("SUCCESS: GPX, CSV and NMEA tracks load!")
+
+if __name__ == "__main__":
+    test_location()
@@ -1,15 +1,27 @@
 import cv2
-import requests
-import json
 import time
 import os
-import random
-import math
-from ultralytics import YOLO
-import datetime
+import sys
+import argparse
+
+# Shared helpers (geo, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from geo import ReportGate
+from reporter import ReportQueue
+from batch_client import BatchSender
+from outbox import Outbox, new_report_id
+from detection_reports import (detections, locate, max_confidence, queue_report, report_track,
+                               store_event_image, track_context)
+from image_store import LocalImageStore
+from frame_gate import FrameGate
+from tracker import DetectionTracker
+from inference_backends import load_first_available, warm_up
+from tiled_inference import TiledDetector
+from location import create_location
+import metrics
 
 # --- Configuration ---
-BACKEND_URL = "http://localhost:5000/report_hazard"
+BACKEND_BATCH_URL = "http://localhost:5000/report_hazards"
 EVENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'events')
 
 # NOTE: ideally download a specific model like 'yolov8n-pothole.pt'
@@ -20,52 +32,224 @@ MODEL_NAME = "yolov8n.pt"
 # Try to load a specific one if available manually
 if os.path.exists("pothole_best.pt"):
     MODEL_NAME = "pothole_best.pt"
+# Exported models (.onnx, .tflite, *_openvino_model/, see runs/pothole-detector/export_model.py)
+# run on their own CPU runtimes; point MODEL_PATH at one to use it.
+MODEL_NAME = os.environ.get("MODEL_PATH", MODEL_NAME)
+# Startup: a loaded model runs warm_up() blank frames before the first real one.
+# With MODEL_SERVER set to a running common/model_server.py ("default", a socket
+# path or a loopback host:port; same key, see that file), runs attach to its
+# loaded, warm model and never import Ultralytics.
+MODEL_SERVER = os.environ.get("MODEL_SERVER")
 
 CONFIDENCE_THRESHOLD = 0.4
 REPORT_MIN_DISTANCE = 100 # meters
 
+# ROI / tiled inference (common/tiled_inference.py): crop the road region and split it
+# into overlapping tiles run as one batch, so distant potholes keep their pixels.
+INFERENCE_ROI = None          # (x0, y0, x1, y1) fractions, e.g. (0.0, 0.4, 1.0, 0.85); None = whole frame
+INFERENCE_TILES = (1, 1)      # (cols, rows) over the ROI, e.g. (3, 1)
+INFERENCE_TILE_OVERLAP = 0.2  # share of a tile shared with its neighbour
+INFERENCE_IMGSZ = None        # model input size per tile; None = the model's default
+
+# We want to throttle reports not just by distance, but by time
+REPORT_COOLDOWN_TIME = 2.0 # seconds (only used with TRACKING_ENABLED = False)
+
+# Detection fusion: boxes are linked across frames and each pothole is reported
+# once, when its track ends, with its mean confidence and its best frame.
+TRACKING_ENABLED = True
+TRACK_IOU_THRESHOLD = 0.2  # min overlap to continue a track
+TRACK_MAX_MISSED = 5       # frames a track may go undetected before it ends
+TRACK_MIN_HITS = 3         # shorter tracks are dropped as flicker
+TRACK_MAX_FRAMES = 300     # a track still open after this many frames is reported anyway
+
+# Background reporting: the detection loop only enqueues, workers write + POST.
+REPORT_WORKERS = 2
+REPORT_QUEUE_SIZE = 32
+REPORT_QUEUE_POLICY = "drop_oldest"  # or "drop_newest" / "block" (backpressure)
+REPORT_MAX_RETRIES = 3
+# Every payload is journaled in an on-device outbox until the backend stored it;
+# after a connection loss the backlog is replayed, paced to OUTBOX_REPLAY_RATE.
+OUTBOX_DB = os.path.join(EVENTS_DIR, 'outbox.db')
+LEGACY_OUTBOX_FILE = os.path.join(EVENTS_DIR, 'outbox.jsonl')
+OUTBOX_MAX_RECORDS = 50000
+OUTBOX_MAX_MB = 64
+OUTBOX_REPLAY_RATE = 200  # reports/s
+# Payloads are POSTed (gzip) to /report_hazards in batches over one keep-alive session
+REPORT_BATCH_SIZE = 20
+REPORT_BATCH_WAIT = 1.0  # seconds the oldest pending report may wait
+
+# Lean pipeline: frames are only annotated when shown or reported, and event
+# images are rendered and encoded on the reporter workers.
+SHOW_WINDOW = True            # False for headless runs: no per-frame plot()
+EVENT_IMAGE_FORMAT = "jpg"    # or "webp"
+EVENT_IMAGE_QUALITY = 85
+EVENT_IMAGE_MAX_WIDTH = None  # e.g. 960 to downscale before encoding
+EVENT_IMAGE_CROP = False      # store only the area around the detected boxes
+
+# Frame-change gating: skip YOLO when the scene has not changed and reuse the last result
+FRAME_GATE_ENABLED = True
+FRAME_DIFF_THRESHOLD = 3.0     # mean abs gray-level difference of 64x36 thumbnails
+FRAME_GATE_MAX_SKIP = 15       # force a fresh inference after this many reused frames
+MIN_TRAVEL_PER_INFERENCE = 2.0 # meters; used when GPS speed is available
+FRAME_GATE_STATS_EVERY = 300   # frames between [GATE] log lines
+
+# Metrics: Prometheus /metrics on this port (0 disables); `kill -USR1 <pid>`
+# writes a sampling profile of all threads to PROFILE_DIR.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+PROFILE_DIR = os.path.join(EVENTS_DIR, "profiles")
+
+# Location (common/location.py): NMEA from a GPS device or log, or a GPX / CSV
+# track; every frame is geotagged at its capture time. Unset = simulated GPS
+# random-walking from the start point below.
+LOCATION_SOURCE = os.environ.get("GPS_SOURCE")  # e.g. /dev/ttyUSB0, drive.nmea, drive.gpx, drive.csv
+LOCATION_FORMAT = None        # "nmea" / "gpx" / "csv"; None = from the file extension
+LOCATION_FOLLOW = True        # keep reading as the device / log grows
+LOCATION_TIME_OFFSET = 0.0    # seconds added to every fix time
+LOCATION_MAX_GAP = 5.0        # seconds between fixes still interpolated across
+
 # TAMBARAM, CHENNAI COORDINATES (Starting Point)
 CURRENT_LAT = 12.9229
 CURRENT_LON = 80.1275
 
-last_reported_lat = None
-last_reported_lon = None
+# Event images are stored by content hash (with thumbnails) in EVENTS_DIR.
+image_store = LocalImageStore(EVENTS_DIR, fmt=EVENT_IMAGE_FORMAT, quality=EVENT_IMAGE_QUALITY)
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculates distance in meters between two lat/lon points."""
-    R = 6371000 # Earth radius in meters
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi / 2.0)**2 + \
-        math.cos(phi1) * math.cos(phi2) * \
-        math.sin(delta_lambda / 2.0)**2
-    
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+# Every location reported this session; new detections must be REPORT_MIN_DISTANCE from all of them.
+report_gate = ReportGate(REPORT_MIN_DISTANCE)
 
-def get_simulated_gps():
-    """Simulates moving slightly in Chennai."""
-    global CURRENT_LAT, CURRENT_LON
-    
-    # Move roughly 5-10 meters
-    CURRENT_LAT += random.uniform(-0.00005, 0.00005)
-    CURRENT_LON += random.uniform(-0.00005, 0.00005)
-    
-    return CURRENT_LAT, CURRENT_LON
+def load_location(source=None):
+    """Starts the location provider: a track reader for source (default LOCATION_SOURCE), else simulated GPS."""
+    location = create_location(source or LOCATION_SOURCE, CURRENT_LAT, CURRENT_LON, fmt=LOCATION_FORMAT,
+                               follow=LOCATION_FOLLOW, time_offset=LOCATION_TIME_OFFSET,
+                               max_gap=LOCATION_MAX_GAP)
+    print(f" [GPS] {location.summary()}")
+    return location
+
+def report_job(result, frame, lat, lon, confidence, timestamp):
+    """A reporter job: what to draw (result / frame) and the payload for the backend."""
+    # image_filename is filled in by the worker once the image is stored;
+    # report_id lets the backend drop the payload if it is ever sent twice.
+    payload = {
+        "report_id": new_report_id(),
+        "latitude": lat,
+        "longitude": lon,
+        "confidence": confidence,
+        "timestamp": timestamp
+    }
+    return {"result": result, "frame": frame, "payload": payload}
 
-def main():
-    # Load model
+def send_report(job, batch_sender):
+    """Worker-side half of a report: renders and saves the event image, then hands the payload to the batcher."""
+    ref = store_event_image(job, image_store, max_width=EVENT_IMAGE_MAX_WIDTH, crop=EVENT_IMAGE_CROP)
+    if ref is not None:
+        # The backend serves EVENTS_DIR, so the content-addressed name is all the payload needs
+        job["payload"]["image_filename"] = ref["name"]
+    batch_sender.add(job["payload"])
+
+def load_model():
+    """
+    Attaches to the model server at MODEL_SERVER if one is running; otherwise
+    loads MODEL_NAME through its inference backend (falling back to the stock
+    yolov8n.pt) and warms it up.
+    """
+    started = time.perf_counter()
+    if MODEL_SERVER:
+        from model_server import attach
+        model = attach(MODEL_SERVER)
+        if model is not None:
+            print(f" [MODEL] Attached to {model.model_path} at {MODEL_SERVER} "
+                  f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return model
     print(f"Loading {MODEL_NAME}...")
-    try:
-        model = YOLO(MODEL_NAME)
-    except Exception as e:
-        print(f"Computed error loading model {MODEL_NAME}: {e}")
-        print("Falling back to yolov8n.pt")
-        model = YOLO("yolov8n.pt")
+    model, _ = load_first_available([MODEL_NAME, "yolov8n.pt"])
+    if INFERENCE_ROI is not None or tuple(INFERENCE_TILES) != (1, 1) or INFERENCE_IMGSZ:
+        model = TiledDetector(model, roi=INFERENCE_ROI, tiles=INFERENCE_TILES,
+                              overlap=INFERENCE_TILE_OVERLAP, imgsz=INFERENCE_IMGSZ)
+        print(f"Tiled inference: roi {INFERENCE_ROI}, {INFERENCE_TILES[0]}x{INFERENCE_TILES[1]} tiles")
+    loaded = time.perf_counter() - started
+    latencies = warm_up(model)
+    print(f" [MODEL] Ready: loaded in {loaded:.2f}s, warm-up {', '.join(f'{ms:.0f}' for ms in latencies)} ms")
+    return model
+
+def create_reporter():
+    """Starts the background reporting stage; returns (reporter, batch_sender)."""
+    outbox = Outbox(OUTBOX_DB, max_records=OUTBOX_MAX_RECORDS, max_bytes=OUTBOX_MAX_MB * 1024 * 1024)
+    outbox.import_jsonl(LEGACY_OUTBOX_FILE)
+    pending = outbox.count()
+    if pending:
+        print(f" [OUTBOX] Replaying {pending} reports from a previous run")
+    batch_sender = BatchSender(
+        BACKEND_BATCH_URL,
+        outbox,
+        batch_size=REPORT_BATCH_SIZE,
+        max_wait=REPORT_BATCH_WAIT,
+        max_rate=OUTBOX_REPLAY_RATE,
+    )
+    reporter = ReportQueue(
+        lambda job: send_report(job, batch_sender),
+        workers=REPORT_WORKERS,
+        maxsize=REPORT_QUEUE_SIZE,
+        policy=REPORT_QUEUE_POLICY,
+        max_retries=REPORT_MAX_RETRIES,
+        outbox=outbox,
+        to_record=lambda job: job["payload"],
+    )
+    return reporter, batch_sender
+
+def close_reporter(reporter, batch_sender):
+    """Flushes pending reports and prints ingest stats."""
+    print("Flushing pending reports...")
+    reporter.close(timeout=30)
+    batch_sender.close(timeout=30)
+    reports_per_s, requests_per_s = batch_sender.throughput()
+    print(f"Reporter stats: {reporter.stats} | Batch stats: {batch_sender.stats}")
+    print(f"Ingest throughput: {reports_per_s:.2f} reports/s over {requests_per_s:.2f} requests/s")
+    _, replay_rate = batch_sender.replayer.throughput()
+    print(f"Outbox: {batch_sender.pending()} reports left for next start | "
+          f"{replay_rate:.1f} reports/s while sending")
+
+def create_tracker():
+    if not TRACKING_ENABLED:
+        return None
+    return DetectionTracker(
+        iou_threshold=TRACK_IOU_THRESHOLD,
+        max_missed=TRACK_MAX_MISSED,
+        min_hits=TRACK_MIN_HITS,
+        max_frames=TRACK_MAX_FRAMES,
+    )
+
+def create_frame_gate():
+    if not FRAME_GATE_ENABLED:
+        return None
+    return FrameGate(
+        diff_threshold=FRAME_DIFF_THRESHOLD,
+        max_skip=FRAME_GATE_MAX_SKIP,
+        min_travel_m=MIN_TRAVEL_PER_INFERENCE,
+    )
+
+def infer(model, frame, frame_gate=None, speed_mps=None, dt=None):
+    """Runs the model on frame unless the gate has a reusable result."""
+    result = frame_gate.lookup(frame, speed_mps=speed_mps, dt=dt) if frame_gate else None
+    if result is None:
+        with metrics.timed("pipeline_stage_seconds", stage="inference"):
+            result = model(frame, verbose=False)[0]
+        metrics.counter("detector_inferences_total", "Frames that ran the model").inc()
+        if frame_gate:
+            frame_gate.store(frame, result)
+    return result
+
+def start_metrics():
+    """Exposes /metrics on METRICS_PORT (if set) and arms the SIGUSR1 profiler."""
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+    metrics.install_profile_signal(PROFILE_DIR)
+
+def main(location_source=None):
+    model = load_model()
+    location = load_location(location_source)
+    frame_gate = create_frame_gate()
+    tracker = create_tracker()
+    start_metrics()
 
     # Initialize Webcam (0)
     source = 0 
@@ -74,87 +258,91 @@ def main():
         print("Error: Could not open video source.")
         return
 
+    reporter, batch_sender = create_reporter()
+
     print("Starting detection loop. Press 'q' to quit.")
     
-    global last_reported_lat, last_reported_lon
-    
-    # We want to throttle reports not just by time, but by distance
     last_report_time = 0
-    REPORT_COOLDOWN_TIME = 2.0 
+    last_frame_time = None
+    fps = metrics.RateMeter()
+    metrics.gauge("detector_fps", "Frames per second over the last 5 s", fn=fps.rate)
+    frames_total = metrics.counter("detector_frames_total", "Frames processed")
 
     while True:
-        ret, frame = cap.read()
+        with metrics.timed("pipeline_stage_seconds", stage="capture"):
+            ret, frame = cap.read()
         if not ret:
             break
+        # Geotags and the travel stride both use the capture time
+        current_time = time.time()
+        frames_total.inc()
+        fps.tick()
 
-        # Run inference
-        results = model(frame, verbose=False)
-        result = results[0]
-        annotated_frame = result.plot()
-
-        detected = False
-        max_conf = 0.0
-        
-        # Check detections
-        for box in result.boxes:
-            conf = float(box.conf)
-            if conf > CONFIDENCE_THRESHOLD:
-                # OPTIONAL: Filter class here if using standard model
-                # if model.names[int(box.cls)] in ['bowl', 'cup', 'car']: ...
-                detected = True
-                max_conf = max(max_conf, conf)
-
-        # Show feed
-        cv2.imshow("Pothole Detection (Chennai Prototype)", annotated_frame)
+        # Run inference (or reuse the previous result if the scene has not changed / we barely moved)
+        dt = current_time - last_frame_time if last_frame_time is not None else None
+        last_frame_time = current_time
+        result = infer(model, frame, frame_gate, speed_mps=location.speed(current_time), dt=dt)
+        if frame_gate and frame_gate.counters["frames"] % FRAME_GATE_STATS_EVERY == 0:
+            print(f" [GATE] {frame_gate.summary()}")
+        # Only draw (and show the feed) when someone is watching; reported frames are drawn by the workers
+        annotated_frame = None
+        if SHOW_WINDOW:
+            with metrics.timed("pipeline_stage_seconds", stage="plot"):
+                annotated_frame = result.plot()
+            cv2.imshow("Pothole Detection (Chennai Prototype)", annotated_frame)
 
         # Logic to Report
-        current_time = time.time()
-        
-        if detected and (current_time - last_report_time > REPORT_COOLDOWN_TIME):
-            # 1. Get Location
-            lat, lon = get_simulated_gps()
-            
-            # 2. Check Distance Constraint
-            should_report = True
-            if last_reported_lat is not None and last_reported_lon is not None:
-                dist = haversine_distance(lat, lon, last_reported_lat, last_reported_lon)
-                if dist < REPORT_MIN_DISTANCE:
-                    print(f" [SKIP] Hazard detected but too close to previous tag ({dist:.1f}m < 100m)")
-                    should_report = False
-            
-            if should_report:
-                # Save event image
-                timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"event_{timestamp_str}.jpg"
-                filepath = os.path.join(EVENTS_DIR, filename)
-                cv2.imwrite(filepath, annotated_frame)
-                
-                payload = {
-                    "latitude": lat,
-                    "longitude": lon,
-                    "confidence": max_conf,
-                    "image_filename": filename,
-                    "timestamp": current_time
-                }
-                
-                try:
-                    resp = requests.post(BACKEND_URL, json=payload)
-                    if resp.status_code == 201:
-                        print(f" [REPORTED] Hazard at {lat:.5f}, {lon:.5f} | Conf: {max_conf:.2f}")
-                        # Update last reported location
-                        last_reported_lat = lat
-                        last_reported_lon = lon
-                        last_report_time = current_time
-                    else:
-                        print(f" [ERROR] Backend returned {resp.status_code}")
-                except Exception as e:
-                    print(f" [ERROR] Could not connect to backend: {e}")
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if tracker:
+            # One report per pothole, sent when its track ends
+            boxes, confs = detections(result, CONFIDENCE_THRESHOLD)
+            context = None
+            if len(boxes):
+                position = location.position(current_time)
+                # A frame without a fix still continues the track, it just cannot be its best frame
+                if position is not None:
+                    context = track_context(result, annotated_frame, *position, current_time)
+            for track in tracker.update(boxes, confs, context):
+                report_track(reporter, report_gate, track, report_job)
+        else:
+            detected, max_conf = max_confidence(result, CONFIDENCE_THRESHOLD)
+            if detected and (current_time - last_report_time > REPORT_COOLDOWN_TIME):
+                position = locate(location, current_time)
+                if position and queue_report(reporter, report_gate,
+                                             report_job(result, annotated_frame, *position, max_conf, current_time),
+                                             *position):
+                    last_report_time = current_time
+            elif detected:
+                metrics.counter("reports_skipped_total", "Detections not reported", reason="cooldown").inc()
+
+        if SHOW_WINDOW and cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
     cap.release()
     cv2.destroyAllWindows()
+    if frame_gate:
+        print(f" [GATE] {frame_gate.summary()}")
+    if tracker:
+        # Potholes still in view when the stream ends are reported too
+        for track in tracker.flush():
+            report_track(reporter, report_gate, track, report_job)
+        print(f" [TRACK] {tracker.summary()}")
+    close_reporter(reporter, batch_sender)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Pothole detection: live webcam loop or offline batch processing.")
+    parser.add_argument("--offline", metavar="SOURCE",
+                        help="process a recorded video file or image directory instead of the webcam")
+    parser.add_argument("--output", default="detections.jsonl", help="JSONL file for offline detections")
+    parser.add_argument("--workers", type=int, default=None, help="offline pool size (default: all cores)")
+    parser.add_argument("--stride", type=int, default=1, help="offline: process every Nth frame")
+    parser.add_argument("--gps", metavar="TRACK", help="NMEA device or log, GPX or CSV track (default: GPS_SOURCE)")
+    parser.add_argument("--gps-start", help="offline video: track time (Unix or ISO 8601) of the first frame "
+                                            "(default: the first fix)")
+    args = parser.parse_args()
+
+    if args.offline:
+        from offline import run_offline
+        run_offline(args.offline, args.output, workers=args.workers, stride=args.stride,
+                    track=args.gps or LOCATION_SOURCE, track_start=args.gps_start)
+    else:
+        main(args.gps)
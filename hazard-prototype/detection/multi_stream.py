@@ -0,0 +1,241 @@
+"""
+Multi-stream detection worker.
+
+One process serves N camera/video sources: every source is read on its own
+capture thread, the newest frame of each stream is collected into a batch,
+and one batched YOLO call per tick produces the results that are routed back
+to each stream's own reporting state (distance gate, cooldown, location).
+
+Usage:
+    python multi_stream.py 0 rtsp://10.0.0.5/stream drive.mp4 ../../images
+"""
+import os
+import glob
+import time
+import argparse
+import threading
+
+import cv2
+
+import detect_potholes as dp
+from detection_reports import detections, locate, max_confidence, queue_report, report_track, track_context
+from geo import ReportGate
+from location import SimulatedGPS
+import metrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+MAX_BATCH = 8          # frames per YOLO call
+STATS_INTERVAL = 10.0  # seconds between throughput log lines
+
+
+class StreamReader(threading.Thread):
+    """
+    Reads one source on its own thread and keeps only its newest frame.
+    Live sources (webcam index, URLs) overwrite frames the worker has not taken
+    yet; recorded sources (files, frame directories) wait so no frame is lost.
+    """
+
+    def __init__(self, name, source):
+        super().__init__(name=f"capture-{name}", daemon=True)
+        self.stream_name = name
+        self.source = source
+        self.live = not (os.path.isdir(source) or os.path.isfile(source))
+        self._cond = threading.Condition()
+        self._frame = None
+        self._stopped = False
+        self.finished = False
+
+    def _frames(self):
+        if os.path.isdir(self.source):
+            paths = sorted(p for p in glob.glob(os.path.join(self.source, "*"))
+                           if p.lower().endswith(IMAGE_EXTENSIONS))
+            for path in paths:
+                if self._stopped:
+                    return
+                frame = cv2.imread(path)
+                if frame is not None:
+                    yield frame
+            return
+
+        cap = cv2.VideoCapture(int(self.source) if self.source.isdigit() else self.source)
+        if not cap.isOpened():
+            print(f" [ERR] Could not open video source {self.source}")
+            return
+        try:
+            while not self._stopped:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+    def run(self):
+        for frame in self._frames():
+            with self._cond:
+                while not self.live and self._frame is not None and not self._stopped:
+                    self._cond.wait(0.1)
+                if self._stopped:
+                    break
+                self._frame = frame
+        with self._cond:
+            self.finished = True
+
+    def take(self):
+        """Returns the newest unseen frame, or None."""
+        with self._cond:
+            frame, self._frame = self._frame, None
+            self._cond.notify()
+            return frame
+
+    @property
+    def exhausted(self):
+        with self._cond:
+            return self.finished and self._frame is None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+class StreamState:
+    """
+    Per-stream reporting state: its own distance gate, tracker (or cooldown)
+    and location (a shared GPS track, else its own simulated walk).
+    """
+
+    def __init__(self, name, location=None):
+        self.name = name
+        self.report_gate = ReportGate(dp.REPORT_MIN_DISTANCE)
+        self.last_report_time = 0
+        self.location = location or SimulatedGPS(dp.CURRENT_LAT, dp.CURRENT_LON)
+        self.last_frame_time = None
+        self.frame_gate = dp.create_frame_gate()
+        self.tracker = dp.create_tracker()
+        self.frames = 0
+        self.reports = 0
+
+    def motion(self):
+        """(speed in m/s, seconds since this stream's previous frame) for the frame gate's travel stride."""
+        now = time.time()
+        dt = now - self.last_frame_time if self.last_frame_time is not None else None
+        self.last_frame_time = now
+        return self.location.speed(now), dt
+
+    def handle_result(self, result, reporter):
+        self.frames += 1
+        current_time = time.time()
+        label = f" [{self.name}]"
+        # Reported frames are annotated and encoded by the reporter workers
+        if self.tracker:
+            boxes, confs = detections(result, dp.CONFIDENCE_THRESHOLD)
+            context = None
+            position = self.location.position(current_time) if len(boxes) else None
+            if position is not None:
+                context = track_context(result, None, *position, current_time)
+            for track in self.tracker.update(boxes, confs, context):
+                self.reports += report_track(reporter, self.report_gate, track, dp.report_job, label=label)
+            return
+
+        detected, max_conf = max_confidence(result, dp.CONFIDENCE_THRESHOLD)
+        if not detected:
+            return
+        if current_time - self.last_report_time <= dp.REPORT_COOLDOWN_TIME:
+            metrics.counter("reports_skipped_total", "Detections not reported", reason="cooldown").inc()
+            return
+        position = locate(self.location, current_time, label=label)
+        if position and queue_report(reporter, self.report_gate, dp.report_job(result, None, *position, max_conf,
+                                                                                current_time),
+                                     *position, label=label):
+            self.last_report_time = current_time
+            self.reports += 1
+
+    def flush(self, reporter):
+        """Reports the tracks still open when the stream stops."""
+        if self.tracker:
+            for track in self.tracker.flush():
+                self.reports += report_track(reporter, self.report_gate, track, dp.report_job,
+                                             label=f" [{self.name}]")
+
+
+def run(sources, max_batch=MAX_BATCH, gps=None):
+    model = dp.load_model()
+    # One GPS (a multi-camera vehicle) for every stream; without one each stream walks on its own
+    location = dp.load_location(gps) if gps or dp.LOCATION_SOURCE else None
+    readers = [StreamReader(f"s{i}", str(src)) for i, src in enumerate(sources)]
+    states = {r.stream_name: StreamState(r.stream_name, location) for r in readers}
+    for r in readers:
+        r.start()
+    reporter, batch_sender = dp.create_reporter()
+    dp.start_metrics()
+    fps = metrics.RateMeter()
+    metrics.gauge("detector_fps", "Frames per second over the last 5 s", fn=fps.rate)
+    frames_total = metrics.counter("detector_frames_total", "Frames processed")
+
+    print(f"Serving {len(readers)} streams with batched inference (max batch {max_batch}). Ctrl+C to stop.")
+    ticks = 0
+    frames_done = 0
+    window_start = time.time()
+    try:
+        while not all(r.exhausted for r in readers):
+            batch = []
+            taken = 0
+            for r in readers:
+                frame = r.take()
+                if frame is None:
+                    continue
+                taken += 1
+                frames_total.inc()
+                fps.tick()
+                state = states[r.stream_name]
+                # Unchanged scenes reuse their stream's last result and stay out of the batch
+                cached = state.frame_gate.lookup(frame, *state.motion()) if state.frame_gate else None
+                if cached is not None:
+                    state.handle_result(cached, reporter)
+                else:
+                    batch.append((state, frame))
+            if not taken:
+                time.sleep(0.005)
+                continue
+
+            for i in range(0, len(batch), max_batch):
+                chunk = batch[i:i + max_batch]
+                with metrics.timed("pipeline_stage_seconds", stage="inference"):
+                    results = model([frame for _, frame in chunk], verbose=False)
+                metrics.counter("detector_inferences_total", "Frames that ran the model").inc(len(chunk))
+                for (state, frame), result in zip(chunk, results):
+                    if state.frame_gate:
+                        state.frame_gate.store(frame, result)
+                    state.handle_result(result, reporter)
+            ticks += 1
+            frames_done += taken
+
+            elapsed = time.time() - window_start
+            if elapsed >= STATS_INTERVAL:
+                print(f" [STATS] {frames_done / elapsed:.1f} FPS across {len(readers)} streams | "
+                      f"avg frames per tick {frames_done / ticks:.1f}")
+                ticks, frames_done, window_start = 0, 0, time.time()
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        for r in readers:
+            r.stop()
+        for state in states.values():
+            state.flush(reporter)
+            print(f" [{state.name}] frames: {state.frames} | reports: {state.reports}")
+            if state.frame_gate:
+                print(f" [{state.name}] [GATE] {state.frame_gate.summary()}")
+            if state.tracker:
+                print(f" [{state.name}] [TRACK] {state.tracker.summary()}")
+        dp.close_reporter(reporter, batch_sender)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pothole detection over several sources in one process.")
+    parser.add_argument("sources", nargs="+",
+                        help="webcam index, video file, stream URL or directory of frames")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="frames per YOLO call")
+    parser.add_argument("--gps", metavar="TRACK", help="NMEA device or log, GPX or CSV track shared by all streams")
+    args = parser.parse_args()
+    run(args.sources, max_batch=args.max_batch, gps=args.gps)
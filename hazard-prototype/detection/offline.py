@@ -0,0 +1,192 @@
+"""
+Offline batch processing of recorded footage.
+
+Splits a video file (or a directory of frames) into chunks of frame indexes,
+processes the chunks on a multiprocessing pool where every process loads the
+model once, and streams one JSON line per frame with detections:
+
+    {"source": ..., "frame_index": 120, "timestamp": 4.0,
+     "boxes": [[x1, y1, x2, y2], ...], "confidences": [...], "classes": [...]}
+
+With a GPS track (NMEA log, GPX or CSV; see common/location.py) every record
+also gets the interpolated "latitude" and "longitude" of its frame (null
+without a fix). Video timestamps are seconds from the first frame, placed on
+the track at track_start (default: the first fix); image timestamps are
+their file times.
+
+Run through detect_potholes.py:
+    python detect_potholes.py --offline drive.mp4 --workers 8 --stride 5 --output drive.jsonl
+    python detect_potholes.py --offline drive.mp4 --gps drive.nmea --gps-start 2024-05-01T08:12:30Z
+"""
+import os
+import glob
+import json
+import time
+import multiprocessing
+
+import cv2
+
+import detect_potholes as dp
+from location import TrackReader, parse_time
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+CHUNK_FRAMES = 240  # source frames per pool task
+TRACK_CAPACITY = 1000000  # fixes kept from an offline track (28 h at 10 Hz)
+
+_model = None
+
+
+def _init_worker():
+    """Pool initializer: one model per process, one thread per process (the pool provides the parallelism)."""
+    global _model
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _model = dp.load_model()
+
+
+def _to_record(source, frame_index, timestamp, result):
+    boxes, confs, classes = [], [], []
+    for box in result.boxes:
+        conf = float(box.conf)
+        if conf > dp.CONFIDENCE_THRESHOLD:
+            boxes.append([round(float(v), 1) for v in box.xyxy[0]])
+            confs.append(round(conf, 4))
+            classes.append(int(box.cls))
+    if not boxes:
+        return None
+    return {
+        "source": source,
+        "frame_index": frame_index,
+        "timestamp": timestamp,
+        "boxes": boxes,
+        "confidences": confs,
+        "classes": classes,
+    }
+
+
+def _process_video_chunk(task):
+    """Decodes frames [start, end) of a video, keeping every stride-th one."""
+    path, start, end, stride = task
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    records = []
+    frames = 0
+    try:
+        for frame_index in range(start, end):
+            # grab() skips decoding of frames we are not going to use
+            if not cap.grab():
+                break
+            if frame_index % stride:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            frames += 1
+            result = _model(frame, verbose=False)[0]
+            timestamp = frame_index / fps if fps else None
+            record = _to_record(path, frame_index, timestamp, result)
+            if record:
+                records.append(record)
+    finally:
+        cap.release()
+    return frames, records
+
+
+def _process_image_chunk(task):
+    """Runs the model over a list of (frame_index, image_path)."""
+    records = []
+    frames = 0
+    for frame_index, path in task:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        frames += 1
+        result = _model(frame, verbose=False)[0]
+        record = _to_record(path, frame_index, os.path.getmtime(path), result)
+        if record:
+            records.append(record)
+    return frames, records
+
+
+def _plan(source, stride):
+    """Returns (worker function, list of tasks) for a video file or image directory."""
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*"))
+                       if p.lower().endswith(IMAGE_EXTENSIONS))
+        indexed = list(enumerate(paths))[::stride]
+        per_task = max(1, CHUNK_FRAMES // stride)
+        return _process_image_chunk, [indexed[i:i + per_task] for i in range(0, len(indexed), per_task)]
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video source {source}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        raise ValueError(f"Could not determine the frame count of {source}")
+    chunk = max(stride, CHUNK_FRAMES)
+    return _process_video_chunk, [(source, start, min(start + chunk, total), stride)
+                                  for start in range(0, total, chunk)]
+
+
+def load_track(track, track_start=None):
+    """
+    Reads a whole GPS track. Returns (reader, offset): offset turns a video
+    timestamp (seconds from the first frame) into track time.
+    """
+    reader = TrackReader(track, follow=False, capacity=TRACK_CAPACITY, max_gap=dp.LOCATION_MAX_GAP).start()
+    reader.wait()
+    span = reader.buffer.span()
+    if span is None:
+        raise ValueError(f"No usable fixes in {track}" + (f": {reader.error}" if reader.error else ""))
+    print(f" [GPS] {reader.summary()}")
+    return reader, parse_time(str(track_start)) if track_start is not None else span[0]
+
+
+def geotag(record, reader, offset, is_video):
+    """Adds the interpolated latitude/longitude of the record's frame (None without a fix)."""
+    t = record["timestamp"]
+    position = None
+    if t is not None:
+        position = reader.position(offset + t if is_video else t)
+    record["latitude"], record["longitude"] = position if position else (None, None)
+    return position is not None
+
+
+def run_offline(source, output, workers=None, stride=1, track=None, track_start=None):
+    """
+    Processes a recorded source on a process pool and streams detections to
+    output (JSONL), geotagged from track (a GPS log) if given.
+    """
+    workers = workers or os.cpu_count() or 1
+    stride = max(1, stride)
+    func, tasks = _plan(source, stride)
+    reader, offset = load_track(track, track_start) if track else (None, 0.0)
+    geotagged = 0
+    print(f"Processing {source} in {len(tasks)} chunks on {workers} processes (stride {stride})...")
+
+    started = time.time()
+    frames = 0
+    detections = 0
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool, open(output, "w") as out:
+        # imap keeps chunk order, so the JSONL stays sorted by frame while chunks run in parallel
+        for chunk_frames, records in pool.imap(func, tasks):
+            frames += chunk_frames
+            for record in records:
+                if reader:
+                    geotagged += geotag(record, reader, offset, func is _process_video_chunk)
+                out.write(json.dumps(record) + "\n")
+            detections += len(records)
+            out.flush()
+
+    elapsed = time.time() - started
+    print(f"Done: {frames} frames, {detections} frames with detections in {elapsed:.1f}s "
+          f"({frames / max(elapsed, 1e-9):.1f} FPS) -> {output}")
+    if reader:
+        print(f" [GPS] Geotagged {geotagged} of {detections} frames with detections")
+    return frames, detections
@@ -0,0 +1,116 @@
+"""
+Benchmark CPU inference backends.
+
+For every backend/precision/input-size combination the model is exported
+(once, in this process) and then measured in a fresh child process so that
+peak RSS belongs to that backend alone. Reports load time, latency
+p50/p95, throughput and peak RSS, and optionally writes them as JSON.
+
+Example:
+    python benchmark_backends.py --backends pytorch onnx tflite openvino \
+        --precisions fp32 int8 --imgsz 320 640 --runs 50 --output backends.json
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import resource
+import concurrent.futures
+import multiprocessing
+
+import numpy as np
+
+# Shared helpers (inference backends, ...) live in hazard-prototype/common
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'hazard-prototype', 'common'))
+from inference_backends import BACKENDS, export_backend, load_backend
+
+DEFAULT_IMAGES = os.path.join(ROOT_DIR, "images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _measure(model_path, imgsz, image_paths, runs, warmup):
+    """Runs in a child process: load, warm up, time `runs` inferences."""
+    import cv2
+
+    frames = [cv2.imread(p) for p in image_paths]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        frames = [np.zeros((480, 640, 3), dtype=np.uint8)]
+
+    started = time.perf_counter()
+    model = load_backend(model_path)
+    load_s = time.perf_counter() - started
+
+    for i in range(warmup):
+        model(frames[i % len(frames)], imgsz=imgsz, device="cpu", verbose=False)
+
+    latencies = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        model(frames[i % len(frames)], imgsz=imgsz, device="cpu", verbose=False)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    lat = np.array(latencies)
+    return {
+        "load_s": round(load_s, 3),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "mean_ms": round(float(lat.mean()), 2),
+        "throughput_fps": round(1000.0 / float(lat.mean()), 2),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_benchmark(weights, backends, precisions, sizes, runs=50, warmup=5, images=DEFAULT_IMAGES):
+    image_paths = sorted(p for p in glob.glob(os.path.join(images, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for backend in backends:
+        for precision in precisions:
+            if precision not in BACKENDS[backend]:
+                continue
+            for imgsz in sizes:
+                row = {"backend": backend, "precision": precision, "imgsz": imgsz}
+                try:
+                    model_path = export_backend(weights, backend, precision=precision, imgsz=imgsz)
+                    row["model"] = model_path
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        row.update(pool.submit(_measure, model_path, imgsz, image_paths, runs, warmup).result())
+                except Exception as e:
+                    row["error"] = str(e)
+                rows.append(row)
+                print_row(row)
+    return rows
+
+
+def print_row(row):
+    name = f"{row['backend']}/{row['precision']}@{row['imgsz']}"
+    if "error" in row:
+        print(f"{name:<24} ERROR: {row['error']}")
+        return
+    print(f"{name:<24} load {row['load_s']:>6.2f}s | p50 {row['p50_ms']:>7.1f}ms | p95 {row['p95_ms']:>7.1f}ms | "
+          f"{row['throughput_fps']:>6.1f} FPS | peak RSS {row['peak_rss_mb']:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference backends.")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--precisions", nargs="+", default=["fp32"], choices=["fp32", "fp16", "int8"])
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="directory of sample frames")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.weights, args.backends, args.precisions, args.imgsz,
+                            runs=args.runs, warmup=args.warmup, images=args.images)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"weights": args.weights, "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+        print(f"Wrote {args.output}")
@@ -0,0 +1,155 @@
+"""
+Benchmark ROI / tiled inference against whole-frame inference.
+
+Every configuration (whole frame at the default size, whole frame upscaled,
+ROI crop, ROI split into tiles) runs over the sample frames. Reports latency
+p50/p95 per frame, detections, recall and recall per CPU-millisecond.
+
+Recall is measured against YOLO label files next to the images (<name>.txt,
+"class cx cy w h" normalized) when they exist; otherwise against the pooled
+detections of all configurations (merged by the same cross-tile NMS), so a
+configuration scores by how much of what any of them found it finds too.
+
+Example:
+    python benchmark_tiling.py --weights pothole_best.pt --roi 0 0.35 1 1 --runs 20 --output tiling.json
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+import numpy as np
+
+# Shared helpers (inference backends, ...) live in hazard-prototype/common
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'hazard-prototype', 'common'))
+from inference_backends import load_backend
+from tiled_inference import TiledDetector, merge_detections
+from tracker import iou_matrix
+
+DEFAULT_IMAGES = os.path.join(ROOT_DIR, "images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+CONFIDENCE_THRESHOLD = 0.25
+MATCH_IOU = 0.5
+# name -> (use the ROI, (cols, rows), imgsz)
+CONFIGS = {
+    "full@640": (False, (1, 1), 640),
+    "full@1280": (False, (1, 1), 1280),
+    "roi@640": (True, (1, 1), 640),
+    "roi_2x1@640": (True, (2, 1), 640),
+    "roi_3x1@640": (True, (3, 1), 640),
+}
+
+
+def load_frames(images):
+    """Sample frames and their labels in pixels ((N, 4) boxes, or None without a label file)."""
+    import cv2
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(images, "*"))):
+        stem, ext = os.path.splitext(path)
+        # Skip annotated copies of the samples (e.g. 1_detected.jpg)
+        if ext.lower() not in IMAGE_EXTENSIONS or stem.endswith("_detected"):
+            continue
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        labels = None
+        if os.path.exists(stem + ".txt"):
+            h, w = frame.shape[:2]
+            rows = np.loadtxt(stem + ".txt", ndmin=2).reshape(-1, 5)
+            cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+            labels = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        frames.append((os.path.basename(path), frame, labels))
+    return frames
+
+
+def boxes_of(result, conf=CONFIDENCE_THRESHOLD):
+    data = result.boxes.data
+    data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+    data = np.asarray(data, dtype=float).reshape(-1, 6)
+    return data[data[:, 4] >= conf]
+
+
+def recall(found, truth, iou=MATCH_IOU):
+    """Share of truth boxes matched by a found box at IoU >= iou (None without truth)."""
+    if truth is None or not len(truth):
+        return None
+    if not len(found):
+        return 0.0
+    return float((iou_matrix(truth, found[:, :4]) >= iou).any(axis=1).mean())
+
+
+def run_benchmark(weights, roi, runs=10, warmup=2, images=DEFAULT_IMAGES, configs=CONFIGS):
+    model = load_backend(weights)
+    frames = load_frames(images)
+    if not frames:
+        raise SystemExit(f"No sample images in {images}")
+
+    detected, rows = {}, []
+    for name, (use_roi, tiles, imgsz) in configs.items():
+        detector = TiledDetector(model, roi=roi if use_roi else None, tiles=tiles, imgsz=imgsz)
+        for i in range(warmup):
+            detector(frames[i % len(frames)][1], verbose=False)
+        latencies = []
+        for i in range(runs):
+            _, frame, _ = frames[i % len(frames)]
+            t0 = time.perf_counter()
+            detector(frame, verbose=False)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        detected[name] = [boxes_of(detector(frame, verbose=False)[0]) for _, frame, _ in frames]
+        lat = np.array(latencies)
+        rows.append({
+            "config": name,
+            "roi": roi if use_roi else None,
+            "tiles": list(tiles),
+            "imgsz": imgsz,
+            "batch": len(detector.windows(frames[0][1].shape)),
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            "detections": int(sum(len(d) for d in detected[name])),
+        })
+
+    # Ground truth per frame: labels, else everything any configuration found
+    truth = []
+    for i, (_, _, labels) in enumerate(frames):
+        if labels is not None:
+            truth.append(labels)
+        else:
+            pooled = [detected[name][i] for name in configs if len(detected[name][i])]
+            truth.append(merge_detections(np.concatenate(pooled))[:, :4] if pooled else None)
+    for row in rows:
+        scores = [recall(found, t) for found, t in zip(detected[row["config"]], truth)]
+        scores = [s for s in scores if s is not None]
+        row["recall"] = round(float(np.mean(scores)), 3) if scores else None
+        row["recall_per_ms"] = round(row["recall"] / row["p50_ms"], 5) if scores else None
+        print_row(row)
+    return rows
+
+
+def print_row(row):
+    recall_text = "   n/a" if row["recall"] is None else f"{row['recall']:>6.2f}"
+    print(f"{row['config']:<14} batch {row['batch']} | p50 {row['p50_ms']:>7.1f}ms | p95 {row['p95_ms']:>7.1f}ms | "
+          f"{row['detections']:>3} boxes | recall {recall_text} | "
+          f"recall/ms {row['recall_per_ms'] if row['recall_per_ms'] is not None else 'n/a'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ROI / tiled inference.")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--roi", nargs=4, type=float, default=[0.0, 0.35, 1.0, 1.0],
+                        metavar=("X0", "Y0", "X1", "Y1"), help="road region as fractions of the frame")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="directory of sample frames")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.weights, tuple(args.roi), runs=args.runs, warmup=args.warmup, images=args.images)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"weights": args.weights, "roi": args.roi, "cpu_count": os.cpu_count(),
+                       "results": results}, f, indent=2)
+        print(f"Wrote {args.output}")
@@ -1,23 +1,39 @@
-from ultralytics import YOLO
+import os
 import sys
+import argparse
 
-def export_model():
+# Shared helpers (inference backends, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'hazard-prototype', 'common'))
+from inference_backends import BACKENDS, export_backend
+
+def export_model(weights="yolov8n.pt", backends=("tflite",), precisions=("fp32",), imgsz=640):
+    """Exports weights to every requested backend/precision that is supported."""
+    exported = []
     try:
-        # Load the YOLOv8 model
         # Use 'pothole_best.pt' if you have valid weights, otherwise 'yolov8n.pt'
-        model_name = "yolov8n.pt" 
-        print(f"Loading {model_name}...")
-        model = YOLO(model_name)
+        print(f"Loading {weights}...")
+        for backend in backends:
+            for precision in precisions:
+                if precision not in BACKENDS[backend]:
+                    print(f"Skipping {backend}/{precision}: not supported")
+                    continue
+                print(f"Exporting to {backend} ({precision}, imgsz={imgsz})...")
+                path = export_backend(weights, backend, precision=precision, imgsz=imgsz)
+                print(f" -> {path}")
+                exported.append((backend, precision, path))
 
-        # Export the model to TFLite format
-        # format='tflite' exports to TFLite
-        print("Exporting to TFLite...")
-        model.export(format='tflite')
-        
         print("Export complete!")
+        return exported
     except Exception as e:
         print(f"Error exporting model: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    export_model()
+    parser = argparse.ArgumentParser(description="Export YOLO weights to CPU inference backends.")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--backends", nargs="+", default=["tflite"],
+                        choices=[b for b in BACKENDS if b != "pytorch"])
+    parser.add_argument("--precisions", nargs="+", default=["fp32"], choices=["fp32", "fp16", "int8"])
+    parser.add_argument("--imgsz", type=int, default=640)
+    args = parser.parse_args()
+    export_model(args.weights, args.backends, args.precisions, args.imgsz)
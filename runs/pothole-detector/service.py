@@ -1,21 +1,46 @@
 import cv2
 import time
 import os
-import random
-import math
 import datetime
-import firebase_admin
+import sys
 import threading
-from firebase_admin import credentials, firestore, storage
-from ultralytics import YOLO
-import base64
+import multiprocessing
+import functools
+import concurrent.futures
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+
+# Shared helpers (geo, ...) live in hazard-prototype/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'hazard-prototype', 'common'))
+from geo import ReportGate
+from reporter import ReportQueue
+from outbox import Outbox, OutboxReplayer, new_report_id
+from detection_reports import detections, locate, queue_report, report_track, store_event_image, track_context
+from image_store import IMMUTABLE_CACHE_CONTROL, LocalImageStore
+from frame_gate import FrameGate
+from tracker import DetectionTracker
+from inference_backends import load_first_available, warm_up
+from tiled_inference import TiledDetector
+from location import create_location
+from report_sinks import FirestoreSink, LocalFileSink, MemorySink
+from serving import serve
+import metrics
+
 app = Flask(__name__)
 CORS(app) # This allows your Netlify frontend to talk to this backend
+metrics.install_flask_metrics(app) # /metrics (Prometheus) and, with ENABLE_PROFILING=1, /debug/profile
+
+# Handle of the detection process and its ready event, set once the model is
+# loaded and warmed up (see supervise_detector)
+detector_process = None
+detector_ready = None
 
 @app.route('/')
 def health_check():
+    if detector_process is not None and not detector_process.is_alive():
+        return "Argus AI Backend is Running! (detector restarting)", 503
+    if detector_ready is not None and not detector_ready.is_set():
+        return "Argus AI Backend is Running! (detector warming up)", 503
     return "Argus AI Backend is Running!"
 
 
@@ -24,108 +49,292 @@ def health_check():
 CRED_PATH = "pothole-detector-3f442-firebase-adminsdk-fbsvc-a1da9dffe4.json"
 STORAGE_BUCKET = "pothole-detector-3f442.firebasestorage.app"  # From your config
 
-# Model Path (Exported TFLite model)
-MODEL_NAME = "yolov8n_float32.tflite" 
-# Note: Ultralytics export often creates a folder or specific file naming.
-# We will verify the exact name after export. If export fails, we fallback to .pt
+# Model Path (Exported TFLite model, see export_model.py)
+MODEL_NAME = "yolov8n_saved_model/yolov8n_float32.tflite"
+# Tried in order: MODEL_PATH override, the custom trained weights, the exported
+# TFLite model (TFLite CPU runtime), then the stock PyTorch weights.
+MODEL_CANDIDATES = [p for p in (os.environ.get("MODEL_PATH"), "pothole_best.pt", MODEL_NAME, "yolov8n.pt") if p]
+GENERIC_MODELS = ("yolov8n.pt", MODEL_NAME)
+# A running common/model_server.py ("default", a socket path or a loopback
+# host:port; same key, see that file) to attach to instead of loading the
+# model in every detector (re)start.
+MODEL_SERVER = os.environ.get("MODEL_SERVER")
 
 CONFIDENCE_THRESHOLD = 0.4
 REPORT_MIN_DISTANCE = 100 # meters
 
+# ROI / tiled inference (common/tiled_inference.py): crop the road region and split it
+# into overlapping tiles run as one batch, so distant potholes keep their pixels.
+INFERENCE_ROI = None          # (x0, y0, x1, y1) fractions, e.g. (0.0, 0.4, 1.0, 0.85); None = whole frame
+INFERENCE_TILES = (1, 1)      # (cols, rows) over the ROI, e.g. (3, 1)
+INFERENCE_TILE_OVERLAP = 0.2  # share of a tile shared with its neighbour
+INFERENCE_IMGSZ = None        # model input size per tile; None = the model's default
+
+# Background reporting: the detection loop only enqueues; workers render and
+# save the image and journal the report in the outbox.
+EVENTS_DIR = "events"
+REPORT_WORKERS = 2
+REPORT_QUEUE_SIZE = 32
+REPORT_QUEUE_POLICY = "drop_oldest"  # or "drop_newest" / "block" (backpressure)
+REPORT_MAX_RETRIES = 3
+# Journaled reports (bounded on disk) are drained in batches: the batch's images
+# upload concurrently, then its documents go out in one commit (a Firestore
+# WriteBatch). Unreachable sinks back off; backlog replay is paced.
+OUTBOX_DB = os.path.join(EVENTS_DIR, "outbox.db")
+LEGACY_OUTBOX_FILE = os.path.join(EVENTS_DIR, "outbox.jsonl")
+OUTBOX_MAX_RECORDS = 50000
+OUTBOX_MAX_MB = 64
+OUTBOX_REPLAY_RATE = 200  # reports/s
+REPORT_BATCH_SIZE = 20
+REPORT_BATCH_WAIT = 1.0  # seconds the oldest pending report may wait
+UPLOAD_WORKERS = 4
+
+# Where reports go: "firestore" (CRED_PATH / STORAGE_BUCKET, initialized on first
+# write), "local" (NDJSON + image files in LOCAL_SINK_DIR, offline) or "memory".
+REPORT_SINK = os.environ.get("REPORT_SINK", "firestore")
+LOCAL_SINK_DIR = os.path.join(EVENTS_DIR, "sink")
+# Every report document carries expire_at = timestamp + this; a Firestore TTL
+# policy on hazards.expire_at deletes stale reports server-side.
+REPORT_TTL_DAYS = 90
+
+# Lean pipeline: frames are only annotated when shown (local webcam) or
+# reported, and event images are rendered and encoded on the reporter workers.
+EVENT_IMAGE_FORMAT = "jpg"    # or "webp"
+EVENT_IMAGE_QUALITY = 85
+EVENT_IMAGE_MAX_WIDTH = None  # e.g. 960 to downscale before encoding/upload
+EVENT_IMAGE_CROP = False      # store only the area around the detected boxes
+
+# Frame-change gating: skip YOLO when the scene has not changed and reuse the
+# cached result (the simulation re-feeds the same few images forever)
+FRAME_GATE_ENABLED = True
+FRAME_DIFF_THRESHOLD = 3.0     # mean abs gray-level difference of 64x36 thumbnails
+FRAME_GATE_MAX_SKIP = 15       # force a fresh inference after this many reused frames
+MIN_TRAVEL_PER_INFERENCE = 2.0 # meters; used when GPS speed is available
+FRAME_GATE_STATS_EVERY = 100   # frames between [GATE] log lines
+
+# Detection fusion: boxes are linked across frames and each pothole is reported
+# once, when its track ends, with its mean confidence and its best frame.
+TRACKING_ENABLED = True
+TRACK_IOU_THRESHOLD = 0.2  # min overlap to continue a track
+TRACK_MAX_MISSED = 5       # frames a track may go undetected before it ends
+TRACK_MIN_HITS = 3         # shorter tracks are dropped as flicker
+TRACK_MAX_SECONDS = 60     # a track still open this long is reported anyway
+
+# Profiling: `kill -USR1 <pid>` writes a sampling profile of all threads here
+PROFILE_DIR = os.path.join(EVENTS_DIR, "profiles")
+PROFILE_SECONDS = 10
+
+# The detection loop runs in its own process so inference never holds the
+# web server's GIL; it serves its own /metrics and is restarted if it dies.
+DETECTOR_METRICS_PORT = int(os.environ.get("DETECTOR_METRICS_PORT", 9101))  # 0 disables
+DETECTOR_RESTART_DELAY = 10  # seconds
+WEB_THREADS = 4
+
+# Location (common/location.py): NMEA from a GPS device or log, or a GPX / CSV
+# track; every frame is geotagged at its capture time. Unset = simulated GPS
+# random-walking from the start point below.
+LOCATION_SOURCE = os.environ.get("GPS_SOURCE")  # e.g. /dev/ttyUSB0, drive.nmea, drive.gpx, drive.csv
+LOCATION_FORMAT = None        # "nmea" / "gpx" / "csv"; None = from the file extension
+LOCATION_TIME_OFFSET = 0.0    # seconds added to every fix time
+LOCATION_MAX_GAP = 5.0        # seconds between fixes still interpolated across
+
 # TAMBARAM, CHENNAI COORDINATES (Starting Point)
 CURRENT_LAT = 12.9229
 CURRENT_LON = 80.1275
 
-last_reported_lat = None
-last_reported_lon = None
-
-# --- Initialize Firebase ---
-if not firebase_admin._apps:
-    cred = credentials.Certificate(CRED_PATH)
-    firebase_admin.initialize_app(cred, {
-        'storageBucket': STORAGE_BUCKET
-    })
-
-db = firestore.client()
-bucket = storage.bucket()
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculates distance in meters between two lat/lon points."""
-    R = 6371000 # Earth radius in meters
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi / 2.0)**2 + \
-        math.cos(phi1) * math.cos(phi2) * \
-        math.sin(delta_lambda / 2.0)**2
-    
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
-
-def get_simulated_gps():
-    """Simulates moving slightly in Chennai."""
-    global CURRENT_LAT, CURRENT_LON
-    # Move roughly 5-10 meters
-    CURRENT_LAT += random.uniform(-0.00005, 0.00005)
-    CURRENT_LON += random.uniform(-0.00005, 0.00005)
-    return CURRENT_LAT, CURRENT_LON
-
-def upload_image_to_firebase(image_path, filename):
-    """Uploads image to Firebase Storage and returns the public URL."""
-    try:
-        blob = bucket.blob(f"events/{filename}")
-        blob.upload_from_filename(image_path)
-        # Make public (optional, or use signed URLs)
-        blob.make_public()
-        return blob.public_url
-    except Exception as e:
-        print(f"Error uploading image: {e}")
-        return None
-
-def encode_image_base64(image_path):
-    """Encodes an image file to a Base64 string."""
-    try:
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            return f"data:image/jpeg;base64,{encoded_string}"
-    except Exception as e:
-        print(f"Error encoding image base64: {e}")
-        return None
-
-def report_hazard(lat, lon, confidence, image_filename, local_image_path, is_simulated=False):
-    """Writes hazard data to Firestore."""
-    
-    # 1. Upload Image (Optional)
-    image_url = upload_image_to_firebase(local_image_path, image_filename)
-    
-    image_base64 = None
-    if image_url is None:
-        print(" [WARN] Image upload failed. Falling back to Base64 encoding in Firestore.")
-        image_base64 = encode_image_base64(local_image_path)
-
-    # 2. Add to Firestore
-    timestamp = time.time()
-    doc_ref = db.collection('hazards').document()
-    
-    data = {
-        'id': doc_ref.id,
+# Event images are stored locally by content hash (with thumbnails), uploaded once
+# per hash, and documents only reference them by URL and hash.
+image_store = LocalImageStore(EVENTS_DIR, fmt=EVENT_IMAGE_FORMAT, quality=EVENT_IMAGE_QUALITY)
+uploaded_urls = {}  # image hash -> {"full": url, "thumb": url, ...}
+uploaded_urls_lock = threading.Lock()
+
+# Every location reported this session; new detections must be REPORT_MIN_DISTANCE from all of them.
+report_gate = ReportGate(REPORT_MIN_DISTANCE)
+
+def create_sink(kind=REPORT_SINK):
+    if kind == "firestore":
+        return FirestoreSink(CRED_PATH, STORAGE_BUCKET)
+    if kind == "local":
+        return LocalFileSink(LOCAL_SINK_DIR)
+    if kind == "memory":
+        return MemorySink()
+    raise ValueError(f"Unknown REPORT_SINK {kind!r}, expected firestore, local or memory")
+
+# No network or credentials needed until the first report is written
+sink = create_sink()
+upload_pool = concurrent.futures.ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def upload_image(image_path, filename):
+    """Uploads one image file to the sink and returns its public URL. Raises on failure."""
+    with metrics.timed("pipeline_stage_seconds", stage="upload"):
+        # Content-addressed names never change, so browsers and CDNs may cache them for good
+        return sink.upload(image_path, f"events/{filename}", cache_control=IMMUTABLE_CACHE_CONTROL)
+
+def upload_event_images(image_refs):
+    """
+    Uploads stored event images and their variants, once per content hash,
+    every file concurrently on the upload pool. Returns
+    {hash: {"full": url, "thumb": url, ...}}, None for an image whose upload failed.
+    """
+    urls, pending = {}, {}
+    with uploaded_urls_lock:
+        for ref in image_refs:
+            if ref["hash"] in uploaded_urls:
+                urls[ref["hash"]] = uploaded_urls[ref["hash"]]
+            else:
+                pending[ref["hash"]] = ref
+    futures = {
+        image_hash: [(next((v for v, n in ref["variants"].items() if n == name), "full"),
+                      upload_pool.submit(upload_image, path, name))
+                     for name, path in image_store.files(ref)]
+        for image_hash, ref in pending.items()
+    }
+    for image_hash, uploads in futures.items():
+        try:
+            urls[image_hash] = {variant: future.result() for variant, future in uploads}
+        except Exception as e:
+            metrics.counter("pipeline_errors_total", "Errors by pipeline stage", stage="upload").inc()
+            print(f"Error uploading image: {e}")
+            urls[image_hash] = None
+            continue
+        with uploaded_urls_lock:
+            uploaded_urls[image_hash] = urls[image_hash]
+    return urls
+
+def upload_event_image(image_ref):
+    """Uploads one stored event image; returns {"full": url, "thumb": url, ...} or None on failure."""
+    return upload_event_images([image_ref])[image_ref["hash"]]
+
+def hazard_document(lat, lon, confidence, image_ref=None, urls=None, is_simulated=False, report_id=None,
+                    timestamp=None):
+    """Returns (document id, data) of one report; report_id becomes the id."""
+    if image_ref and urls is None:
+        # Never inline the pixels: the document keeps the hash, the image stays in the local store
+        print(f" [WARN] Image upload failed. Storing only the image hash {image_ref['hash']}.")
+    report_id = report_id or new_report_id()
+    timestamp = time.time() if timestamp is None else timestamp
+    return report_id, {
+        'id': report_id,
         'latitude': lat,
         'longitude': lon,
         'confidence': confidence,
-        'image_url': image_url, # Store URL if available
-        'image_base64': image_base64, # Store Base64 if URL failed
+        'image_url': urls and urls.get('full'),  # Store URL if available
+        'thumb_url': urls and urls.get('thumb'),  # Small variant for map popups and lists
+        'image_hash': image_ref and image_ref['hash'],
         'timestamp': timestamp,
-        'created_at': firestore.SERVER_TIMESTAMP,
+        'created_at': sink.server_timestamp,
+        'expire_at': datetime.datetime.fromtimestamp(timestamp + REPORT_TTL_DAYS * 86400, datetime.timezone.utc),
         'is_simulated': is_simulated  # Flag to trigger frontend warning
     }
-    
-    doc_ref.set(data)
-    print(f" [REPORTED] Hazard logged to Firestore ID: {doc_ref.id} | Conf: {confidence:.2f} | Sim: {is_simulated}")
 
-def main():
+def report_hazard(lat, lon, confidence, image_ref=None, is_simulated=False, report_id=None, timestamp=None):
+    """
+    Writes one hazard document right away. image_ref is what image_store.put() returned.
+    report_id becomes the document id, so writing a replayed report again
+    overwrites the same document instead of creating a duplicate.
+    """
+    urls = upload_event_image(image_ref) if image_ref else None
+    doc_id, data = hazard_document(lat, lon, confidence, image_ref, urls, is_simulated, report_id, timestamp)
+    with metrics.timed("pipeline_stage_seconds", stage="firestore_write"):
+        sink.write('hazards', [(doc_id, data)])
+    print(f" [REPORTED] Hazard logged ID: {doc_id} | Conf: {confidence:.2f} | Sim: {is_simulated}")
+
+def invalid_record(record):
+    """Why a journaled report cannot be written (e.g. an outbox row from an older version), or None."""
+    for field in ("latitude", "longitude", "confidence"):
+        value = record.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{field} is missing or not a number"
+    image = record.get("image")
+    if image is not None and not (isinstance(image, dict) and {"hash", "name", "variants"} <= image.keys()):
+        return "image is not a stored image reference"
+    return None
+
+def write_reports(records):
+    """
+    OutboxReplayer sender: uploads the batch's images concurrently, then
+    writes its documents in one commit (same ids on replay). Returns the
+    positions of malformed records, which are dropped. Raises on failure.
+    """
+    rejected = []
+    for i, r in enumerate(records):
+        error = invalid_record(r)
+        if error:
+            print(f" [REJECTED] Report {r.get('report_id')}: {error}")
+            rejected.append(i)
+    records = [r for i, r in enumerate(records) if i not in rejected]
+    if not records:
+        return rejected
+    urls = upload_event_images([r["image"] for r in records if r.get("image")])
+    documents = [
+        hazard_document(r["latitude"], r["longitude"], r["confidence"], r.get("image"),
+                        r.get("image") and urls[r["image"]["hash"]], r.get("is_simulated", False),
+                        r.get("report_id"), r.get("timestamp"))
+        for r in records
+    ]
+    with metrics.timed("pipeline_stage_seconds", stage="firestore_write"):
+        sink.write('hazards', documents)
+    print(f" [REPORTED] {len(documents)} hazards logged in one commit, IDs: {', '.join(d for d, _ in documents)}")
+    return rejected
+
+def prepare_report_job(job):
+    """Worker-side half of a report: renders and saves the event image (job["image"])."""
+    ref = store_event_image(job, image_store, max_width=EVENT_IMAGE_MAX_WIDTH, crop=EVENT_IMAGE_CROP)
+    if ref is not None:
+        # The store also creates runs/pothole-detector/events if needed. Keeping the
+        # reference on the job means a retry or the outbox record reuses the stored image.
+        job["image"] = ref
+
+def process_report_job(job):
+    """One report end to end on the caller's thread: image, upload, document. Raises on failure."""
+    prepare_report_job(job)
+    report_hazard(
+        job["latitude"], job["longitude"], job["confidence"],
+        job.get("image"),
+        is_simulated=job["is_simulated"],
+        report_id=job.get("report_id"),
+        timestamp=job.get("timestamp"),
+    )
+
+def journal_report(job, outbox, replayer):
+    """ReportQueue handler: prepares the image, then journals the report for the next batch."""
+    prepare_report_job(job)
+    outbox.put([report_job_record(job)])
+    replayer.wake()
+
+def report_job(result, frame, lat, lon, confidence, timestamp=None, is_simulated=False):
+    """A reporter job: what to draw (result / frame) and the fields of the report document."""
+    # Drawing, encoding, Firebase upload and Firestore write happen on the reporter workers
+    return {
+        "report_id": new_report_id(),
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "result": result,
+        "frame": frame,
+        "latitude": lat,
+        "longitude": lon,
+        "confidence": confidence,
+        "is_simulated": is_simulated,
+    }
+
+def legacy_outbox_record(record):
+    """
+    Maps a report from the old JSONL outbox (image_filename + local_image_path,
+    no "image") onto the current record: its event image moves into image_store.
+    """
+    path = record.pop("local_image_path", None)
+    record.pop("image_filename", None)
+    if record.get("image") is None and path and os.path.exists(path):
+        try:
+            record["image"] = image_store.put_file(path)
+        except (OSError, ValueError) as e:
+            print(f" [OUTBOX] Could not keep the image of report {record.get('report_id')}: {e}")
+    return record
+
+def report_job_record(job):
+    """Outbox form of a job (everything but the frame pixels and the model result)."""
+    return {k: v for k, v in job.items() if k not in ("frame", "result")}
+
+def main(ready=None):
     # --- cloud simulation setup ---
     import os
     import sys
@@ -140,18 +349,30 @@ def main():
         os.environ.get('RENDER_SERVICE_NAME') is not None
     )
 
-    # Load model
+    # Load model (or attach to a warm one in a model server)
     # Prioritize the custom trained model 'pothole_best.pt'
-    MODEL_NAME = "pothole_best.pt" 
-    print(f"Loading {MODEL_NAME}...")
-    try:
-        model = YOLO(MODEL_NAME)
-    except Exception as e:
-        print(f"Computed error loading model {MODEL_NAME}: {e}")
-        print("Falling back to yolov8n.pt")
-        model = YOLO("yolov8n.pt")    
-        # If falling back to standard model, we must warn user it might detect generic objects
-        print(" [WARN] Using generic model. Detections might not be accurate potholes.")
+    started = time.perf_counter()
+    model = None
+    if MODEL_SERVER:
+        from model_server import attach
+        model = attach(MODEL_SERVER)
+        if model is not None:
+            print(f" [MODEL] Attached to {model.model_path} at {MODEL_SERVER}")
+    if model is None:
+        print(f"Loading first available of {MODEL_CANDIDATES}...")
+        model, model_path = load_first_available(MODEL_CANDIDATES)
+        if model_path in GENERIC_MODELS:
+            # If falling back to standard model, we must warn user it might detect generic objects
+            print(" [WARN] Using generic model. Detections might not be accurate potholes.")
+        if INFERENCE_ROI is not None or tuple(INFERENCE_TILES) != (1, 1) or INFERENCE_IMGSZ:
+            model = TiledDetector(model, roi=INFERENCE_ROI, tiles=INFERENCE_TILES,
+                                  overlap=INFERENCE_TILE_OVERLAP, imgsz=INFERENCE_IMGSZ)
+            print(f"Tiled inference: roi {INFERENCE_ROI}, {INFERENCE_TILES[0]}x{INFERENCE_TILES[1]} tiles")
+        loaded = time.perf_counter() - started
+        latencies = warm_up(model)
+        print(f" [MODEL] Ready: loaded in {loaded:.2f}s, warm-up {', '.join(f'{ms:.0f}' for ms in latencies)} ms")
+    if ready is not None:
+        ready.set()
 
     # Initialize Video Source
     cap = None
@@ -214,13 +435,52 @@ def main():
         print(f" [INFO] Loaded {len(loaded_images)} sample images for simulation.")
         image_cycler = itertools.cycle(loaded_images)
 
+    outbox = Outbox(OUTBOX_DB, max_records=OUTBOX_MAX_RECORDS, max_bytes=OUTBOX_MAX_MB * 1024 * 1024)
+    outbox.import_jsonl(LEGACY_OUTBOX_FILE, convert=legacy_outbox_record)
+    replayer = OutboxReplayer(outbox, write_reports, batch_size=REPORT_BATCH_SIZE,
+                              max_wait=REPORT_BATCH_WAIT, max_rate=OUTBOX_REPLAY_RATE, name="outbox-replay")
+    reporter = ReportQueue(
+        lambda job: journal_report(job, outbox, replayer),
+        workers=REPORT_WORKERS,
+        maxsize=REPORT_QUEUE_SIZE,
+        policy=REPORT_QUEUE_POLICY,
+        max_retries=REPORT_MAX_RETRIES,
+        outbox=outbox,
+        to_record=report_job_record,
+    )
+
+    frame_gate = FrameGate(
+        diff_threshold=FRAME_DIFF_THRESHOLD,
+        max_skip=FRAME_GATE_MAX_SKIP,
+        min_travel_m=MIN_TRAVEL_PER_INFERENCE,
+    ) if FRAME_GATE_ENABLED else None
+    # Read on its own thread; the loop only looks positions up by frame time
+    location = create_location(LOCATION_SOURCE, CURRENT_LAT, CURRENT_LON, fmt=LOCATION_FORMAT,
+                               time_offset=LOCATION_TIME_OFFSET, max_gap=LOCATION_MAX_GAP)
+    print(f" [GPS] {location.summary()}")
+
+    # The simulation feeds one frame every 5 s, the webcam ~30 per second
+    frame_interval = 5.0 if IS_RENDER else 1 / 30
+    tracker = DetectionTracker(
+        iou_threshold=TRACK_IOU_THRESHOLD,
+        max_missed=TRACK_MAX_MISSED,
+        min_hits=TRACK_MIN_HITS,
+        max_frames=max(TRACK_MIN_HITS, round(TRACK_MAX_SECONDS / frame_interval)),
+    ) if TRACKING_ENABLED else None
+    # Reports from the simulation are flagged so the frontend can warn about them
+    make_job = functools.partial(report_job, is_simulated=IS_RENDER)
+
+    fps = metrics.RateMeter()
+    metrics.gauge("detector_fps", "Frames per second over the last 5 s", fn=fps.rate)
+    frames_total = metrics.counter("detector_frames_total", "Frames processed")
+    inferences_total = metrics.counter("detector_inferences_total", "Frames that ran the model")
+
     print("Starting detection loop. Press 'q' to quit.")
     
-    global last_reported_lat, last_reported_lon
-    
-    # We want to throttle reports not just by time, but by distance
+    # Without tracking, reports are throttled by time as well as by distance
     last_report_time = 0
-    REPORT_COOLDOWN_TIME = 2.0 
+    last_frame_time = None
+    REPORT_COOLDOWN_TIME = 2.0
 
     while True:
         if IS_RENDER:
@@ -230,64 +490,60 @@ def main():
             ret = True
             time.sleep(5) # Simulate ~10 FPS to not flood logs
         else:
-            ret, frame = cap.read()
+            with metrics.timed("pipeline_stage_seconds", stage="capture"):
+                ret, frame = cap.read()
             if not ret:
+                metrics.counter("pipeline_errors_total", "Errors by pipeline stage", stage="capture").inc()
                 break
+        # Geotags and the travel stride both use the capture time
+        current_time = time.time()
+        dt = current_time - last_frame_time if last_frame_time is not None else None
+        last_frame_time = current_time
+        frames_total.inc()
+        fps.tick()
+
+        # Run inference (or reuse a cached result if the scene has not changed / we barely moved)
+        result = frame_gate.lookup(frame, location.speed(current_time), dt) if frame_gate else None
+        if result is None:
+            with metrics.timed("pipeline_stage_seconds", stage="inference"):
+                results = model(frame, verbose=False)
+            result = results[0]
+            inferences_total.inc()
+            if frame_gate:
+                frame_gate.store(frame, result)
+        if frame_gate and frame_gate.counters["frames"] % FRAME_GATE_STATS_EVERY == 0:
+            print(f" [GATE] {frame_gate.summary()}")
+        # Headless runs never draw here; reported frames are drawn by the workers
+        annotated_frame = None
+        if not IS_RENDER:
+            with metrics.timed("pipeline_stage_seconds", stage="plot"):
+                annotated_frame = result.plot()
 
-        # Run inference
-        results = model(frame, verbose=False)
-        result = results[0]
-        annotated_frame = result.plot()
-
-        detected = False
-        max_conf = 0.0
-        
         # Check detections
-        for box in result.boxes:
-            conf = float(box.conf)
-            if conf > CONFIDENCE_THRESHOLD:
-                # Filter for class if needed, for now assume all detections are relevant
-                detected = True
-                max_conf = max(max_conf, conf)
+        boxes, confs = detections(result, CONFIDENCE_THRESHOLD)
 
         # Show feed ONLY if NOT on Render
         if not IS_RENDER:
             cv2.imshow("Pothole Detection (Chennai Prototype)", annotated_frame)
 
         # Logic to Report
-        current_time = time.time()
-        
-        if detected and (current_time - last_report_time > REPORT_COOLDOWN_TIME):
-            # 1. Get Location
-            lat, lon = get_simulated_gps()
-            
-            # 2. Check Distance Constraint
-            should_report = True
-            if last_reported_lat is not None and last_reported_lon is not None:
-                dist = haversine_distance(lat, lon, last_reported_lat, last_reported_lon)
-                if dist < REPORT_MIN_DISTANCE:
-                    print(f" [SKIP] Hazard detected but too close to previous tag ({dist:.1f}m < 100m)")
-                    should_report = False
-            
-            if should_report:
-                # Save event image locally first
-                timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"event_{timestamp_str}.jpg"
-                # Make sure events dir exists in runs/pothole-detector/events
-                events_dir = "events"
-                if not os.path.exists(events_dir):
-                    os.makedirs(events_dir)
-                    
-                local_filepath = os.path.join(events_dir, filename)
-                cv2.imwrite(local_filepath, annotated_frame)
-                
-                # Report to Firebase
-                report_hazard(lat, lon, max_conf, filename, local_filepath, is_simulated=IS_RENDER)
-                
-                # Update last reported location
-                last_reported_lat = lat
-                last_reported_lon = lon
+        if tracker:
+            # One report per pothole, sent when its track ends
+            context = None
+            position = location.position(current_time) if len(boxes) else None
+            # A frame without a fix still continues the track, it just cannot be its best frame
+            if position is not None:
+                context = track_context(result, annotated_frame, *position, current_time)
+            for track in tracker.update(boxes, confs, context):
+                report_track(reporter, report_gate, track, make_job)
+        elif len(boxes) and (current_time - last_report_time > REPORT_COOLDOWN_TIME):
+            position = locate(location, current_time)
+            if position and queue_report(reporter, report_gate,
+                                         make_job(result, annotated_frame, *position, float(confs.max()), current_time),
+                                         *position):
                 last_report_time = current_time
+        elif len(boxes):
+            metrics.counter("reports_skipped_total", "Detections not reported", reason="cooldown").inc()
 
         if not IS_RENDER:
             if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -301,13 +557,45 @@ def main():
     if cap:
         cap.release()
     cv2.destroyAllWindows()
+    if tracker:
+        for track in tracker.flush():
+            report_track(reporter, report_gate, track, make_job)
+        print(f" [TRACK] {tracker.summary()}")
+    print("Flushing pending reports...")
+    reporter.close(timeout=30)
+    replayer.close(timeout=30)
+    print(f"Reporter stats: {reporter.stats} | Outbox replay: {replayer.stats}, {outbox.count()} pending")
+
+def run_detector(ready=None):
+    """Entry point of the detection process; sets ready once the model is warm."""
+    if DETECTOR_METRICS_PORT:
+        metrics.start_metrics_server(DETECTOR_METRICS_PORT)
+    metrics.install_profile_signal(PROFILE_DIR, seconds=PROFILE_SECONDS)
+    main(ready)
+
+def supervise_detector():
+    """Runs the detection loop in a child process and restarts it when it exits."""
+    global detector_process, detector_ready
+    # spawn, not fork: the child initializes Firebase (gRPC) and the model itself
+    ctx = multiprocessing.get_context("spawn")
+    while True:
+        detector_ready = ctx.Event()
+        detector_process = ctx.Process(target=run_detector, args=(detector_ready,), name="detector", daemon=True)
+        detector_process.start()
+        print(f" [DETECTOR] Started detection process (pid {detector_process.pid})")
+        detector_process.join()
+        metrics.counter("detector_restarts_total", "Detection process exits").inc()
+        print(f" [DETECTOR] Exited with code {detector_process.exitcode}; restarting in {DETECTOR_RESTART_DELAY}s")
+        time.sleep(DETECTOR_RESTART_DELAY)
 
 if __name__ == '__main__':
-    # 1. Start the Detection/Simulation logic in a separate thread
-    print("Starting background simulation thread...")
-    threading.Thread(target=main, daemon=True).start()
+    # 1. Start the Detection/Simulation logic in its own process
+    metrics.install_profile_signal(PROFILE_DIR, seconds=PROFILE_SECONDS)
+    print("Starting detection process...")
+    threading.Thread(target=supervise_detector, name="detector-supervisor", daemon=True).start()
 
-    # 2. Start the Flask Server (This keeps Render happy by listening on the port)
+    # 2. Start the web server (This keeps Render happy by listening on the port).
+    # One process (in_process): the supervisor and the detector handle live in it.
     port = int(os.environ.get("PORT", 5000))
-    print(f"Starting Flask server on port {port}...")
-    app.run(host='0.0.0.0', port=port)
+    print(f"Starting web server on port {port}...")
+    serve(lambda: app, port=port, threads=WEB_THREADS, server="waitress", in_process=True)